@@ -12,6 +12,9 @@ from rbs_tui_dom.dom.types import HORIZONTAL, FULL_WIDTH, FULL_SIZE, VERTICAL
 
 from nyansat.host.client import NyanSatTelemetryClient
 from nyansat.host.dom.dom_shell import DOMNyanSatShell
+from nyansat.host.recorder import TelemetryRecorder, TelemetryReplayer, TelemetryStore
+from nyansat.host.view.fleet import FleetView
+from nyansat.host.view.render_scheduler import DEFAULT_MAX_FPS, RenderScheduler
 from nyansat.host.view.root import RootView
 from nyansat.host.view.telemetry import TelemetryView
 
@@ -208,6 +211,15 @@ def create_dom(shell: DOMNyanSatShell):
                             )
                         ]
                     ),
+                    DOMTextFill("═", style=DOMStyle(size=(FULL_WIDTH, 1))),
+                    DOMText("Fleet", style=DOMStyle(text_align=Alignment.CENTER,
+                                                    size=(FULL_WIDTH, 1))),
+                    DOMTextFill("-", style=DOMStyle(size=(FULL_WIDTH, 1))),
+                    DOMText(
+                        "",
+                        id="fleet_value",
+                        style=DOMStyle(text_align=Alignment.LEFT, size=FULL_SIZE)
+                    ),
                 ]
             ),
         ]),
@@ -216,7 +228,13 @@ def create_dom(shell: DOMNyanSatShell):
    ])
 
 
-async def run(server_port: int):
+async def run(
+        server_port: int,
+        record_path: Optional[str] = None,
+        replay_path: Optional[str] = None,
+        replay_speed: float = 1.,
+        max_fps: float = DEFAULT_MAX_FPS,
+):
     logging.basicConfig(
         filename='hacksat_ui.log',
         level=logging.getLevelName("INFO"),
@@ -235,8 +253,15 @@ async def run(server_port: int):
         shell.start_shell()
 
         RootView(window, client)
-        TelemetryView(window, client)
-        await client.start()
+        scheduler = RenderScheduler(loop, max_fps)
+        TelemetryView(window, client, scheduler)
+        FleetView(window, client, scheduler)
+        await client.start(listen=replay_path is None)
+        if record_path is not None:
+            loop.create_task(TelemetryRecorder(record_path).consume(client.queue, loop))
+        if replay_path is not None:
+            replayer = TelemetryReplayer(TelemetryStore(replay_path), client, loop, replay_speed)
+            loop.create_task(replayer.play())
     except:
         logging.error("Failed to launch", exc_info=True)
 
@@ -249,8 +274,28 @@ if __name__ == "__main__":
         default=31337,
         help='The port on which the UDP server should be listening'
     )
+    parser.add_argument(
+        '--record',
+        help='Directory in which to record the received telemetry'
+    )
+    parser.add_argument(
+        '--replay',
+        help='Directory of a telemetry recording to replay instead of listening'
+    )
+    parser.add_argument(
+        '--speed',
+        type=float,
+        default=1.,
+        help='Replay speed factor'
+    )
+    parser.add_argument(
+        '--max-fps',
+        type=float,
+        default=DEFAULT_MAX_FPS,
+        help='Maximum number of telemetry redraws per second'
+    )
     args = parser.parse_args()
 
     event_loop = asyncio.get_event_loop()
-    event_loop.run_until_complete(run(args.port))
+    event_loop.run_until_complete(run(args.port, args.record, args.replay, args.speed, args.max_fps))
     event_loop.run_forever()
@@ -1,19 +1,29 @@
 import asyncio
 import json
+import logging
 import socket
 import struct
 from asyncio import AbstractEventLoop
-from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
 from rbs_tui_dom.entity import ObservableEntity, UpdatablePropertyValue, ObservableProperty
 
+from nyansat.host.telemetry import decode_telemetry, is_binary_telemetry, record_to_telemetry, sequence_gap
+
 TELEMETRY_ENTITY_ID = b"root"
 
 MCAST_GRP = '239.255.255.250'
 MCAST_PORT = 31337
 MAX_MESSAGE_SIZE = 1024
-_DEFAULT_TIMEOUT = 0.0001
+
+# Weight of the latest interval in the smoothed per-station rates
+RATE_SMOOTHING = 0.3
+
+LOG = logging.getLogger(__name__)
+
+StationKey = Tuple[str, Optional[int]]
 
 
 @dataclass
@@ -62,68 +72,262 @@ class ObservableTelemetryEntity(ObservableEntity[TelemetryEntityData]):
         self.set_model(self._create_entity_data(telemetry))
 
 
+def station_entity_id(key: StationKey) -> bytes:
+    hostname, station_id = key
+    if station_id is None:
+        return hostname.encode()
+    return f"{hostname}#{station_id}".encode()
+
+
+@dataclass
+class StationState:
+    """
+    Reception statistics and latest telemetry of one station, keyed by source
+    IP and station id (None for JSON telemetry, which carries no station id).
+    """
+    key: StationKey
+    address: Tuple[str, int]
+    first_seen: float
+    last_seen: float
+    entity: ObservableTelemetryEntity = field(init=False, repr=False)
+    telemetry: Dict[str, Any] = field(default_factory=dict, repr=False)
+    datagrams: int = 0
+    records: int = 0
+    lost_batches: int = 0
+    last_sequence: Optional[int] = None
+    datagram_rate: float = 0.
+    record_rate: float = 0.
+    _rate_sampled_at: Optional[float] = field(default=None, repr=False)
+    _rate_datagrams: int = field(default=0, repr=False)
+    _rate_records: int = field(default=0, repr=False)
+
+    def __post_init__(self):
+        self.entity = ObservableTelemetryEntity(station_entity_id(self.key))
+
+    @property
+    def name(self) -> str:
+        return station_entity_id(self.key).decode()
+
+    def age(self, now: float) -> float:
+        """Seconds since the station was last heard from."""
+        return now - self.last_seen
+
+    def is_online(self, now: float, offline_timeout: float) -> bool:
+        return self.age(now) < offline_timeout
+
+    def sample_rates(self, now: float):
+        """
+        Update the smoothed datagram and record rates from the counts received
+        since the previous call.
+        """
+        if self._rate_sampled_at is not None and now > self._rate_sampled_at:
+            elapsed = now - self._rate_sampled_at
+            datagram_rate = (self.datagrams - self._rate_datagrams) / elapsed
+            record_rate = (self.records - self._rate_records) / elapsed
+            self.datagram_rate += RATE_SMOOTHING * (datagram_rate - self.datagram_rate)
+            self.record_rate += RATE_SMOOTHING * (record_rate - self.record_rate)
+        self._rate_sampled_at = now
+        self._rate_datagrams = self.datagrams
+        self._rate_records = self.records
+
+
+@dataclass
+class TelemetryUpdate:
+    """A received datagram, as handed to queue consumers."""
+    station: StationState
+    received_at: float
+    telemetry: Dict[str, Any]
+    records: Optional[np.ndarray]
+
+
+class TelemetryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client: 'NyanSatTelemetryClient'):
+        self._client = client
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]):
+        self._client.handle_datagram(data, addr)
+
+    def error_received(self, exc: Exception):
+        LOG.warning(f"Telemetry socket error: {exc}")
+
+
 class NyanSatTelemetryClient(object):
+    """
+    Receive station telemetry on the multicast group. Datagrams are handled as
+    soon as the event loop gets them, through a DatagramProtocol; the latest
+    values update the entity of the station that sent them and every datagram
+    is also put on a bounded queue for consumers. When the queue is full the
+    oldest update is dropped, so a slow consumer never holds back reception.
+
+    Stations are told apart by source IP and station id. telemetry_entity
+    mirrors the selected station, the first one heard from unless
+    select_station() picks another. Handling a datagram only touches its own
+    station; rates and staleness are refreshed by the watchdog, so the cost
+    grows linearly with the number of stations.
+    """
 
     def __init__(
             self,
             event_loop: AbstractEventLoop,
             listen_port: int,
-            interval: float = 0.2,
-            offline_timeout: int = 2,
+            offline_timeout: float = 2.,
+            queue_size: int = 1024,
     ):
         self._event_loop = event_loop
-        self._interval = interval
+        self._listen_port = listen_port
         self._offline_timeout = offline_timeout
-        self._mcast_socket: Optional[socket.socket] = None
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._watchdog: Optional[asyncio.Task] = None
         self.telemetry_entity = ObservableTelemetryEntity(TELEMETRY_ENTITY_ID)
         self.telemetry_entity.update_from_model({})
-        self._initialize_mcast_socket(listen_port)
-        self._running = False
+        self.stations: Dict[StationKey, StationState] = {}
+        self.selected_station: Optional[StationKey] = None
+        self.stations_observable: ObservableProperty[int] = ObservableProperty("stations")
+        self.station_count: UpdatablePropertyValue[int] = \
+            UpdatablePropertyValue(self.stations_observable, 0)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped_updates = 0
         self.is_connected_observable: ObservableProperty[bool] = ObservableProperty("is_connected")
         self.is_connected: UpdatablePropertyValue[bool] = \
             UpdatablePropertyValue(self.is_connected_observable, False)
 
-    def _initialize_mcast_socket(self, listen_port: int):
-        self._mcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self._mcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._mcast_socket.bind((MCAST_GRP, listen_port))
+    @property
+    def offline_timeout(self) -> float:
+        return self._offline_timeout
+
+    @property
+    def lost_batches(self) -> int:
+        return sum(station.lost_batches for station in self.stations.values())
+
+    @staticmethod
+    def _create_mcast_socket(listen_port: int) -> socket.socket:
+        mcast_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        mcast_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        mcast_socket.bind((MCAST_GRP, listen_port))
         mreq = struct.pack("4sl", socket.inet_aton(MCAST_GRP), socket.INADDR_ANY)
-        self._mcast_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
-        self._mcast_socket.settimeout(_DEFAULT_TIMEOUT)
+        mcast_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        mcast_socket.setblocking(False)
+        return mcast_socket
+
+    def station_list(self) -> List[StationState]:
+        """Known stations, in the order they were first heard from."""
+        return list(self.stations.values())
+
+    def select_station(self, key: StationKey):
+        """Mirror the telemetry of the given station in telemetry_entity."""
+        station = self.stations.get(key)
+        if station is None:
+            raise KeyError(f"Unknown station {key}")
+        self.selected_station = key
+        if station.entity.is_loaded:
+            self.telemetry_entity.update_from_model(station.telemetry)
 
-    async def _recv_from_multicast(self) -> Optional[bytes]:
+    def _station(self, key: StationKey, addr: Tuple[str, int], now: float) -> StationState:
+        station = self.stations.get(key)
+        if station is None:
+            station = StationState(key, addr, now, now)
+            self.stations[key] = station
+            self.station_count.value = len(self.stations)
+            if self.selected_station is None:
+                self.selected_station = key
+            LOG.info(f"New station {key} at {addr}")
+        station.address = addr
+        station.last_seen = now
+        return station
+
+    def handle_datagram(self, data: bytes, addr: Tuple[str, int]):
+        """Decode a datagram in either format and publish its latest values."""
+        hostname, _ = addr
         try:
-            return await self._event_loop.run_in_executor(
-                    None,
-                    self._mcast_socket.recvfrom,
-                    (MAX_MESSAGE_SIZE),
-            )
-        except OSError:
-            return None
-
-    async def _recv_loop(self):
-        last_contact = self._offline_timeout
-        while self._running:
-            data = await self._recv_from_multicast()
-            if data is not None:
-                last_contact = 0
-                message, (hostname, port) = data
-                message = dict(json.loads(message.decode('utf-8')))
-                message["ip"] = hostname
-                message["port"] = port
-                self.telemetry_entity.update_from_model(message)
+            if is_binary_telemetry(data):
+                header, records = decode_telemetry(data)
+                telemetry = record_to_telemetry(records[-1]) if header.count else {}
+                telemetry["id"] = header.station_id
+                key = (hostname, header.station_id)
+                count = header.count
+                sequence = header.sequence
             else:
-                # data is None (i.e. socket timeout)
-                last_contact += self._interval
-            self.is_connected.value = last_contact < self._offline_timeout
-            await asyncio.sleep(self._interval)
+                records = None
+                telemetry = dict(json.loads(data.decode('utf-8')))
+                key = (hostname, None)
+                count = 1
+                sequence = None
+        except ValueError as e:
+            LOG.warning(f"Dropping malformed telemetry from {addr}: {e}")
+            return
+        self.handle_telemetry(key, addr, telemetry, records, count, sequence)
+
+    def handle_telemetry(
+            self,
+            key: StationKey,
+            addr: Tuple[str, int],
+            telemetry: Dict[str, Any],
+            records: Optional[np.ndarray] = None,
+            count: int = 1,
+            sequence: Optional[int] = None,
+    ):
+        """
+        Publish the decoded content of one datagram: its latest values, the
+        station statistics and a queue update. Recordings are replayed through
+        this as well.
+        """
+        now = self._event_loop.time()
+        station = self._station(key, addr, now)
+        if sequence is not None:
+            if station.last_sequence is not None:
+                station.lost_batches += sequence_gap(station.last_sequence, sequence)
+            station.last_sequence = sequence
+        station.datagrams += 1
+        station.records += count
+        telemetry["ip"], telemetry["port"] = addr
+        station.telemetry = telemetry
+        station.entity.update_from_model(telemetry)
+        if station.key == self.selected_station:
+            self.telemetry_entity.update_from_model(telemetry)
+        if not self.is_connected.value:
+            self.is_connected.value = True
+        self._enqueue(TelemetryUpdate(station, now, telemetry, records))
+
+    def _enqueue(self, update: TelemetryUpdate):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped_updates += 1
+        self.queue.put_nowait(update)
 
-    async def start(self):
-        self._running = True
-        await asyncio.ensure_future(self._recv_loop())
+    async def _watch_connection(self):
+        """
+        Refresh the station rates and flag the client offline once no station
+        was heard from for offline_timeout.
+        """
+        while True:
+            now = self._event_loop.time()
+            online = False
+            for station in self.stations.values():
+                station.sample_rates(now)
+                online = online or station.is_online(now, self._offline_timeout)
+            if self.is_connected.value != online:
+                self.is_connected.value = online
+            await asyncio.sleep(self._offline_timeout / 4)
+
+    async def start(self, listen: bool = True):
+        """
+        Start the connection watchdog and, unless listen is False (e.g. to only
+        replay a recording), listen on the multicast group.
+        """
+        if listen:
+            self._transport, _ = await self._event_loop.create_datagram_endpoint(
+                lambda: TelemetryProtocol(self),
+                sock=self._create_mcast_socket(self._listen_port),
+            )
+        self._watchdog = self._event_loop.create_task(self._watch_connection())
 
     async def stop(self):
-        self._running = False
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
 
 
 async def main():
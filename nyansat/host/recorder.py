@@ -0,0 +1,363 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import struct
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from nyansat.host.client import NyanSatTelemetryClient, TelemetryUpdate
+from nyansat.host.telemetry import FLAG_GPS, FLAG_GPS_VALID, FLAG_IMU
+
+STORE_VERSION = 1
+INDEX_FILENAME = "index.json"
+DEFAULT_SEGMENT_SIZE = 1 << 16
+DEFAULT_FLUSH_INTERVAL = 10.
+NO_STATION_ID = -1
+
+# One .npy file per column and segment. received_at is the host wall clock
+# time the datagram was received at, in seconds: it orders the store and is
+# what time ranges refer to. time_us is the station's own record timestamp,
+# counted from the board epoch, 2000-01-01 UTC.
+COLUMNS: Dict[str, np.dtype] = {
+    "received_at": np.dtype('<f8'),
+    "ip": np.dtype('<u4'),
+    "port": np.dtype('<u2'),
+    "station_id": np.dtype('<i4'),
+    "time_us": np.dtype('<u8'),
+    "azimuth": np.dtype('<f4'),
+    "elevation": np.dtype('<f4'),
+    "latitude": np.dtype('<f8'),
+    "longitude": np.dtype('<f8'),
+    "altitude": np.dtype('<f4'),
+    "speed": np.dtype('<f4'),
+    "flags": np.dtype('u1'),
+}
+
+LOG = logging.getLogger(__name__)
+
+
+def ip_to_int(ip: str) -> int:
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def int_to_ip(value: int) -> str:
+    return socket.inet_ntoa(struct.pack("!I", int(value)))
+
+
+@dataclass
+class Segment:
+    name: str
+    count: int
+    start: float
+    end: float
+
+    def overlaps(self, start: Optional[float], end: Optional[float]) -> bool:
+        return (start is None or self.end >= start) and (end is None or self.start < end)
+
+
+class TelemetryStore(object):
+    """
+    Read side of a recording: a directory of column segments and their index.
+    Segments are memory-mapped, so selecting a time range only pages in the
+    columns and rows it covers.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.segments: List[Segment] = []
+        self.reload()
+
+    def reload(self):
+        """Pick up segments written since the store was opened."""
+        index_path = os.path.join(self.path, INDEX_FILENAME)
+        if not os.path.exists(index_path):
+            self.segments = []
+            return
+        with open(index_path) as f:
+            index = json.load(f)
+        if index.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported telemetry store version {index.get('version')}")
+        self.segments = [Segment(**segment) for segment in index["segments"]]
+
+    def __len__(self) -> int:
+        return sum(segment.count for segment in self.segments)
+
+    @property
+    def start(self) -> Optional[float]:
+        return self.segments[0].start if self.segments else None
+
+    @property
+    def end(self) -> Optional[float]:
+        return self.segments[-1].end if self.segments else None
+
+    def _load(self, segment: Segment, column: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, segment.name, f"{column}.npy"), mmap_mode='r')
+
+    def iter_range(
+            self,
+            start: Optional[float] = None,
+            end: Optional[float] = None,
+            columns: Sequence[str] = None,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Yield, segment by segment, memory-mapped views of the rows received in
+        [start, end). Nothing is copied, so this suits ranges that do not fit
+        in memory.
+        """
+        columns = list(COLUMNS) if columns is None else list(columns)
+        for segment in self.segments:
+            if segment.count == 0 or not segment.overlaps(start, end):
+                continue
+            received_at = self._load(segment, "received_at")
+            first = 0 if start is None else int(np.searchsorted(received_at, start, side='left'))
+            last = segment.count if end is None else int(np.searchsorted(received_at, end, side='left'))
+            if first >= last:
+                continue
+            yield {column: self._load(segment, column)[first:last] for column in columns}
+
+    def read(
+            self,
+            start: Optional[float] = None,
+            end: Optional[float] = None,
+            columns: Sequence[str] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Return the rows received in [start, end) as one array per column."""
+        columns = list(COLUMNS) if columns is None else list(columns)
+        chunks = list(self.iter_range(start, end, columns))
+        if not chunks:
+            return {column: np.empty(0, dtype=COLUMNS[column]) for column in columns}
+        return {column: np.concatenate([chunk[column] for chunk in chunks]) for column in columns}
+
+
+class TelemetryRecorder(object):
+    """
+    Append received telemetry to a TelemetryStore directory. Rows accumulate
+    in preallocated column buffers and are written out as a new segment when
+    the buffers are full, after flush_interval seconds, or on flush(). The
+    index is replaced atomically after each segment, so readers never see a
+    partial segment.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            segment_size: int = DEFAULT_SEGMENT_SIZE,
+            flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.path = path
+        self._segment_size = segment_size
+        self._flush_interval = flush_interval
+        os.makedirs(path, exist_ok=True)
+        self._segments = TelemetryStore(path).segments
+        self._buffers = {column: np.empty(segment_size, dtype=dtype) for column, dtype in COLUMNS.items()}
+        self._count = 0
+        self._last_flush = time.monotonic()
+        self._last_received_at = self._segments[-1].end if self._segments else float('-inf')
+
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    def _reserve(self, count: int) -> slice:
+        if self._count + count > self._segment_size:
+            self.flush()
+        rows = slice(self._count, self._count + count)
+        self._count += count
+        return rows
+
+    def append(self, received_at: float, addr: Tuple[str, int], station_id: Optional[int],
+               telemetry: Dict[str, Any], records: Optional[np.ndarray] = None):
+        """
+        Append the content of one datagram
+        :param received_at: host wall clock time of reception, in seconds
+        :param addr: source (ip, port) of the datagram
+        :param station_id: station id of binary telemetry, None for JSON telemetry
+        :param telemetry: decoded latest values, used when there are no records
+        :param records: decoded binary records (TELEMETRY_RECORD_DTYPE), if any
+        """
+        # Keep received_at sorted, which the time range lookups rely on
+        received_at = max(received_at, self._last_received_at)
+        self._last_received_at = received_at
+        if records is not None:
+            for first in range(0, len(records), self._segment_size):
+                self._append_records(received_at, addr, station_id, records[first:first + self._segment_size])
+        else:
+            self._append_telemetry(received_at, addr, station_id, telemetry)
+        if time.monotonic() - self._last_flush >= self._flush_interval:
+            self.flush()
+
+    def append_update(self, update: TelemetryUpdate, received_at: float):
+        self.append(received_at, update.station.address, update.station.key[1], update.telemetry, update.records)
+
+    def _fill_source(self, rows: slice, received_at: float, addr: Tuple[str, int], station_id: Optional[int]):
+        ip, port = addr
+        self._buffers["received_at"][rows] = received_at
+        self._buffers["ip"][rows] = ip_to_int(ip)
+        self._buffers["port"][rows] = port
+        self._buffers["station_id"][rows] = NO_STATION_ID if station_id is None else station_id
+
+    def _append_records(self, received_at: float, addr: Tuple[str, int], station_id: Optional[int],
+                        records: np.ndarray):
+        rows = self._reserve(len(records))
+        self._fill_source(rows, received_at, addr, station_id)
+        buffers = self._buffers
+        buffers["time_us"][rows] = records['time_us']
+        buffers["azimuth"][rows] = records['azimuth']
+        buffers["elevation"][rows] = records['elevation']
+        buffers["latitude"][rows] = records['latitude_e7'] / 1e7
+        buffers["longitude"][rows] = records['longitude_e7'] / 1e7
+        buffers["altitude"][rows] = records['altitude']
+        buffers["speed"][rows] = records['speed']
+        buffers["flags"][rows] = records['flags']
+
+    def _append_telemetry(self, received_at: float, addr: Tuple[str, int], station_id: Optional[int],
+                          telemetry: Dict[str, Any]):
+        rows = self._reserve(1)
+        row = rows.start
+        self._fill_source(rows, received_at, addr, station_id)
+        buffers = self._buffers
+        flags = 0
+        # JSON telemetry times are not in a common unit, they are not recorded
+        buffers["time_us"][row] = 0
+        if telemetry.get("azimuth") is not None and telemetry.get("elevation") is not None:
+            flags |= FLAG_IMU
+            buffers["azimuth"][row] = telemetry["azimuth"]
+            buffers["elevation"][row] = telemetry["elevation"]
+        else:
+            buffers["azimuth"][row] = buffers["elevation"][row] = np.nan
+        if telemetry.get("coordinates_lat") is not None and telemetry.get("coordinates_lng") is not None:
+            flags |= FLAG_GPS
+            if telemetry.get("gps_valid"):
+                flags |= FLAG_GPS_VALID
+            buffers["latitude"][row] = telemetry["coordinates_lat"]
+            buffers["longitude"][row] = telemetry["coordinates_lng"]
+            altitude, speed = telemetry.get("altitude"), telemetry.get("speed")
+            buffers["altitude"][row] = np.nan if altitude is None else altitude
+            buffers["speed"][row] = np.nan if speed is None else speed
+        else:
+            buffers["latitude"][row] = buffers["longitude"][row] = 0.
+            buffers["altitude"][row] = buffers["speed"][row] = np.nan
+        buffers["flags"][row] = flags
+
+    def flush(self):
+        """Write the buffered rows out as a new segment."""
+        self._last_flush = time.monotonic()
+        if self._count == 0:
+            return
+        count = self._count
+        name = f"{len(self._segments):06d}"
+        segment_path = os.path.join(self.path, name)
+        os.makedirs(segment_path, exist_ok=True)
+        for column, buffer in self._buffers.items():
+            np.save(os.path.join(segment_path, f"{column}.npy"), buffer[:count])
+        received_at = self._buffers["received_at"]
+        self._segments.append(Segment(name, count, float(received_at[0]), float(received_at[count - 1])))
+        self._write_index()
+        self._count = 0
+
+    def _write_index(self):
+        index = {
+            "version": STORE_VERSION,
+            "columns": {column: dtype.str for column, dtype in COLUMNS.items()},
+            "segments": [segment.__dict__ for segment in self._segments],
+        }
+        index_path = os.path.join(self.path, INDEX_FILENAME)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+    def close(self):
+        self.flush()
+
+    async def consume(self, queue: asyncio.Queue, event_loop: asyncio.AbstractEventLoop):
+        """
+        Record the updates put on a NyanSatTelemetryClient queue until
+        cancelled. Update times are on the event loop clock, and converted to
+        wall clock time.
+        """
+        try:
+            while True:
+                update: TelemetryUpdate = await queue.get()
+                received_at = time.time() - (event_loop.time() - update.received_at)
+                self.append_update(update, received_at)
+        finally:
+            self.close()
+
+
+def row_to_telemetry(columns: Dict[str, np.ndarray], row: int) -> Dict[str, Any]:
+    """Convert one recorded row to the dictionary layout of the JSON telemetry messages."""
+    flags = int(columns["flags"][row])
+    telemetry: Dict[str, Any] = {"time": int(columns["time_us"][row])}
+    station_id = int(columns["station_id"][row])
+    if station_id != NO_STATION_ID:
+        telemetry["id"] = station_id
+    if flags & FLAG_IMU:
+        telemetry.update({
+            "azimuth": float(columns["azimuth"][row]),
+            "elevation": float(columns["elevation"][row]),
+        })
+    if flags & FLAG_GPS:
+        telemetry.update({
+            "gps_valid": bool(flags & FLAG_GPS_VALID),
+            "coordinates_lat": float(columns["latitude"][row]),
+            "coordinates_lng": float(columns["longitude"][row]),
+            "altitude": float(columns["altitude"][row]),
+            "speed": float(columns["speed"][row]),
+        })
+    return telemetry
+
+
+class TelemetryReplayer(object):
+    """
+    Feed a recording back into a NyanSatTelemetryClient, keeping the original
+    spacing between datagrams divided by speed. Rows received together from
+    one station are replayed as one datagram.
+    """
+
+    def __init__(
+            self,
+            store: TelemetryStore,
+            client: NyanSatTelemetryClient,
+            event_loop: asyncio.AbstractEventLoop,
+            speed: float = 1.,
+    ):
+        self._store = store
+        self._client = client
+        self._event_loop = event_loop
+        self.speed = speed
+
+    async def play(self, start: Optional[float] = None, end: Optional[float] = None):
+        first_received_at = None
+        started_at = self._event_loop.time()
+        for columns in self._store.iter_range(start, end):
+            received_at = columns["received_at"]
+            # Datagrams start wherever the source or reception time changes
+            boundaries = np.flatnonzero(
+                (np.diff(received_at) != 0)
+                | (np.diff(columns["ip"]) != 0)
+                | (np.diff(columns["port"]) != 0)
+                | (np.diff(columns["station_id"]) != 0)
+            ) + 1
+            firsts = np.concatenate(([0], boundaries))
+            lasts = np.concatenate((boundaries, [len(received_at)]))
+            for first, last in zip(firsts, lasts):
+                if first_received_at is None:
+                    first_received_at = float(received_at[first])
+                due = started_at + (float(received_at[first]) - first_received_at) / self.speed
+                delay = due - self._event_loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._replay_datagram(columns, int(first), int(last))
+
+    def _replay_datagram(self, columns: Dict[str, np.ndarray], first: int, last: int):
+        row = last - 1
+        station_id = int(columns["station_id"][row])
+        addr = (int_to_ip(columns["ip"][row]), int(columns["port"][row]))
+        key = (addr[0], None if station_id == NO_STATION_ID else station_id)
+        self._client.handle_telemetry(key, addr, row_to_telemetry(columns, row), count=last - first)
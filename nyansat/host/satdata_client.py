@@ -13,6 +13,7 @@ class SatelliteScraper:
     async def get_tle_file(self, source=SOURCE):
         async with aiohttp.ClientSession() as session:
             async with session.get(source) as response:
+                response.raise_for_status()
                 self.file_text = await response.text()
 
     async def get_tle_lines(self):
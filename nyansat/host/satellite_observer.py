@@ -6,15 +6,38 @@
 import asyncio
 import time
 
+import numpy as np
+
+from dataclasses import dataclass
 from datetime import datetime
 from fuzzywuzzy import process
-from typing import Dict, Tuple, Union
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple, Union
 from skyfield.api import load, Topos, EarthSatellite
 from skyfield.iokit import parse_tle_file
 
+if TYPE_CHECKING:
+    from nyansat.host.tle_catalog import TleCatalog
+
 
 LatLong = Union[float, str]
 
+_SECONDS_PER_DAY = 86400
+
+
+@dataclass
+class SatellitePass:
+    """A single pass of a satellite above the observer's visibility threshold."""
+    rise_time: float
+    culmination_time: float
+    set_time: float
+    max_elevation: float
+    rise_azimuth: float
+    set_azimuth: float
+
+    @property
+    def duration(self) -> float:
+        return self.set_time - self.rise_time
+
 
 class SatelliteObserver(object):
     """
@@ -41,6 +64,18 @@ class SatelliteObserver(object):
         closest_sat_name, _ = process.extractOne(sat_name, _satellites.keys())
         return cls(place, _satellites[closest_sat_name])
 
+    @classmethod
+    def from_catalog(cls, coords: Tuple[LatLong, LatLong], sat_name: str,
+                     catalog: 'TleCatalog') -> 'SatelliteObserver':
+        """
+        Look up a satellite in a loaded TLE catalog
+        :param coords: latitude and longitude of the observer
+        :param sat_name: satellite name or NORAD ID to look up in the catalog
+        :param catalog: loaded TleCatalog
+        :return: SatelliteObserver object
+        """
+        return cls(Topos(*coords), catalog.get_satellite(sat_name))
+
     def __init__(self, observer_location: Topos, satellite: EarthSatellite):
         """
         :param observer_location: location where observation is taking place
@@ -50,6 +85,16 @@ class SatelliteObserver(object):
         self.sat = satellite
         self.sat_name = satellite.name
         self.timescale = load.timescale(builtin=True)
+        self._difference = self.sat - self.observer_location
+
+    def _unix_to_skyfield(self, at_times: np.ndarray):
+        """
+        Convert an array of Unix times to a skyfield Time array. Whole days
+        are passed separately from the seconds of the day so that skyfield
+        applies leap seconds the same way Unix time does.
+        """
+        days, seconds = np.divmod(at_times, _SECONDS_PER_DAY)
+        return self.timescale.utc(1970, 1, 1 + days, 0, 0, seconds)
 
     def get_stats(self, at_time: float) -> Tuple[float, float, float]:
         """
@@ -61,11 +106,132 @@ class SatelliteObserver(object):
         timestamp = self.timescale.utc(gmt.year, gmt.month, gmt.day, gmt.hour,
                                        gmt.minute,
                                        gmt.second + gmt.microsecond / 1000000.0)
-        difference = self.sat - self.observer_location
-        current_difference = difference.at(timestamp)
+        current_difference = self._difference.at(timestamp)
         altitude, azimuth, distance = current_difference.altaz()
         return altitude.degrees, azimuth.degrees, distance.km
 
+    def get_stats_batch(
+            self,
+            at_times: Sequence[float],
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the altitude, azimuth, and distance of the satellite for many
+        timestamps at once, using a single vectorized skyfield computation
+        :param at_times: Unix times GMT (timestamps) for satellite stats
+        :return: (altitudes, azimuths, distances) as NumPy arrays
+        """
+        at_times = np.atleast_1d(np.asarray(at_times, dtype=np.float64))
+        current_difference = self._difference.at(self._unix_to_skyfield(at_times))
+        altitude, azimuth, distance = current_difference.altaz()
+        return altitude.degrees, azimuth.degrees, distance.km
+
+    def get_stats_window(
+            self,
+            start: float,
+            stop: float,
+            step: float,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Get the altitude, azimuth, and distance of the satellite sampled every
+        step seconds in the window [start, stop]
+        :param start: Unix time GMT (timestamp) of the first sample
+        :param stop: Unix time GMT (timestamp) of the last sample
+        :param step: seconds between samples
+        :return: (times, altitudes, azimuths, distances) as NumPy arrays
+        """
+        if step <= 0:
+            raise ValueError("step must be positive")
+        times = np.arange(start, stop + step / 2, step, dtype=np.float64)
+        return (times,) + self.get_stats_batch(times)
+
+    def find_passes(
+            self,
+            start: float,
+            stop: float,
+            step: float = 10.,
+            min_elevation: float = None,
+    ) -> List[SatellitePass]:
+        """
+        Find the passes of the satellite in the window [start, stop]. The
+        window is sampled every step seconds; rise and set times are refined by
+        linear interpolation of the threshold crossing and the culmination by
+        fitting a parabola around the highest sample.
+        :param start: Unix time GMT (timestamp) where the search begins
+        :param stop: Unix time GMT (timestamp) where the search ends
+        :param step: seconds between samples, should be well below the
+                     duration of the shortest pass of interest
+        :param min_elevation: elevation threshold in degrees, defaults to
+                              LOWEST_VISIBLE_ELEVATION
+        :return: list of SatellitePass, ordered by rise time
+        """
+        if min_elevation is None:
+            min_elevation = SatelliteObserver.LOWEST_VISIBLE_ELEVATION
+        times, altitudes, azimuths, _ = self.get_stats_window(start, stop, step)
+        above = altitudes > min_elevation
+        if not above.any():
+            return []
+
+        # Indices where the visibility flag flips; a pass runs from a rising
+        # edge up to (but not including) the following falling edge
+        edges = np.flatnonzero(np.diff(above.astype(np.int8)))
+        rises = list(edges[~above[edges]] + 1)
+        sets = list(edges[above[edges]] + 1)
+        if above[0]:
+            rises.insert(0, 0)
+        if above[-1]:
+            sets.append(len(above))
+
+        passes = []
+        for rise_idx, set_idx in zip(rises, sets):
+            peak_idx = rise_idx + int(np.argmax(altitudes[rise_idx:set_idx]))
+            culmination_time, max_elevation = self._refine_peak(
+                times, altitudes, peak_idx, step)
+            rise_time = self._refine_crossing(times, altitudes, rise_idx - 1, min_elevation)
+            set_time = self._refine_crossing(times, altitudes, set_idx - 1, min_elevation)
+            passes.append(SatellitePass(
+                rise_time=rise_time,
+                culmination_time=culmination_time,
+                set_time=set_time,
+                max_elevation=max_elevation,
+                rise_azimuth=float(azimuths[rise_idx]),
+                set_azimuth=float(azimuths[set_idx - 1]),
+            ))
+        return passes
+
+    @staticmethod
+    def _refine_crossing(
+            times: np.ndarray,
+            altitudes: np.ndarray,
+            idx: int,
+            threshold: float,
+    ) -> float:
+        """Interpolate the time the altitude crosses threshold between idx and idx + 1."""
+        if idx < 0:
+            return float(times[0])
+        if idx + 1 >= len(times):
+            return float(times[-1])
+        a0, a1 = altitudes[idx], altitudes[idx + 1]
+        fraction = (threshold - a0) / (a1 - a0)
+        return float(times[idx] + fraction * (times[idx + 1] - times[idx]))
+
+    @staticmethod
+    def _refine_peak(
+            times: np.ndarray,
+            altitudes: np.ndarray,
+            idx: int,
+            step: float,
+    ) -> Tuple[float, float]:
+        """Fit a parabola through the samples around idx to locate the culmination."""
+        if idx == 0 or idx + 1 >= len(times):
+            return float(times[idx]), float(altitudes[idx])
+        a0, a1, a2 = altitudes[idx - 1], altitudes[idx], altitudes[idx + 1]
+        curvature = a0 - 2 * a1 + a2
+        if curvature >= 0:
+            return float(times[idx]), float(a1)
+        offset = 0.5 * (a0 - a2) / curvature
+        peak = a1 - 0.25 * (a0 - a2) * offset
+        return float(times[idx] + offset * step), float(peak)
+
     def get_current_stats(self) -> Tuple[float, float, float]:
         """
         Get the altitude, azimuth, and elevation of the satellite at the
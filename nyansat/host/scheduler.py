@@ -0,0 +1,120 @@
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from nyansat.host.satellite_observer import SatelliteObserver, SatellitePass
+
+POLICY_PRIORITY = "priority"
+POLICY_MAX_ELEVATION = "elevation"
+POLICIES = (POLICY_PRIORITY, POLICY_MAX_ELEVATION)
+
+
+@dataclass
+class PlannedPass:
+    """A (possibly trimmed) satellite pass that the tracker will follow."""
+    observer: SatelliteObserver
+    satellite_pass: SatellitePass
+    priority: int
+    start: float
+    stop: float
+
+    @property
+    def sat_name(self) -> str:
+        return self.observer.sat_name
+
+    @property
+    def duration(self) -> float:
+        return self.stop - self.start
+
+
+class TrackingScheduler(object):
+    """
+    Build a back to back tracking plan for several satellites. Every pass in
+    the horizon is computed with the batched propagator, then passes are
+    accepted greedily in ranking order. A pass that overlaps already accepted
+    passes is trimmed to the largest free part of its window, and dropped if
+    that part is shorter than min_duration.
+    """
+
+    def __init__(
+            self,
+            observers: Sequence[SatelliteObserver],
+            policy: str = POLICY_PRIORITY,
+            slew_margin: float = 30.,
+            min_duration: float = 60.,
+            step: float = 10.,
+    ):
+        """
+        :param observers: observers to schedule, in decreasing order of priority
+        :param policy: POLICY_PRIORITY to rank passes by observer order first,
+                       POLICY_MAX_ELEVATION to rank them by culmination first
+        :param slew_margin: seconds kept free between passes to slew the antenna
+        :param min_duration: shortest pass, in seconds, worth tracking
+        :param step: sampling step in seconds of the pass search
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy '{policy}', expected one of {POLICIES}")
+        self.observers = list(observers)
+        self.policy = policy
+        self.slew_margin = slew_margin
+        self.min_duration = min_duration
+        self.step = step
+
+    def _rank(self, planned: PlannedPass) -> Tuple:
+        max_elevation = planned.satellite_pass.max_elevation
+        if self.policy == POLICY_PRIORITY:
+            return planned.priority, -max_elevation
+        return -max_elevation, planned.priority
+
+    def _free_window(
+            self,
+            candidate: PlannedPass,
+            accepted: List[PlannedPass],
+    ) -> Optional[Tuple[float, float]]:
+        """Return the largest part of candidate's window that does not collide with accepted."""
+        windows = [(candidate.start, candidate.stop)]
+        for other in accepted:
+            busy_start = other.start - self.slew_margin
+            busy_stop = other.stop + self.slew_margin
+            remaining = []
+            for start, stop in windows:
+                if busy_stop <= start or busy_start >= stop:
+                    remaining.append((start, stop))
+                    continue
+                if start < busy_start:
+                    remaining.append((start, busy_start))
+                if busy_stop < stop:
+                    remaining.append((busy_stop, stop))
+            windows = remaining
+        if not windows:
+            return None
+        return max(windows, key=lambda window: window[1] - window[0])
+
+    def candidates(self, start: float, stop: float) -> List[PlannedPass]:
+        """Every pass of every observer between start and stop."""
+        candidates = []
+        for priority, observer in enumerate(self.observers):
+            for satellite_pass in observer.find_passes(start, stop, step=self.step):
+                candidates.append(PlannedPass(
+                    observer,
+                    satellite_pass,
+                    priority,
+                    max(start, satellite_pass.rise_time),
+                    min(stop, satellite_pass.set_time),
+                ))
+        return candidates
+
+    def plan(self, start: float, stop: float) -> List[PlannedPass]:
+        """
+        Compute the tracking plan for the horizon [start, stop]
+        :param start: Unix time GMT (timestamp) where the plan begins
+        :param stop: Unix time GMT (timestamp) where the plan ends
+        :return: non-overlapping PlannedPass list, ordered by start time
+        """
+        accepted = []
+        for candidate in sorted(self.candidates(start, stop), key=self._rank):
+            window = self._free_window(candidate, accepted)
+            if window is None or window[1] - window[0] < self.min_duration:
+                continue
+            candidate.start, candidate.stop = window
+            accepted.append(candidate)
+        return sorted(accepted, key=lambda planned: planned.start)
@@ -11,6 +11,7 @@ from mp import mpfshell
 from nyansat.host.shell.cli_arg_parser import CLIArgumentProperty, parse_cli_args
 from nyansat.host.shell.terminal_printer import TerminalPrinter
 from nyansat.host.shell.antenny_client import AntennyClient
+from nyansat.host.scheduler import POLICIES
 
 from nyansat.host.shell.errors import cli_handler
 
@@ -18,17 +19,18 @@ from nyansat.host.shell.errors import cli_handler
 class NyanShell(mpfshell.MpFileShell):
     """Extension of MPFShell that adds NyanSat-specific features"""
 
-    def __init__(self, color=False, caching=False, reset=False):
+    def __init__(self, color=False, caching=False, reset=False, tle_file=None):
         """Creates Cmd-based shell object.
 
         Keyword arguments:
         color -- support colored text in the shell
         caching -- support caching the results of functions like 'ls'
         reset -- hard reset device via DTR. (serial connection only)
+        tle_file -- local TLE file to track from, instead of downloading one
         """
         super().__init__(color, caching, reset)
 
-        self.client = AntennyClient(self.caching)
+        self.client = AntennyClient(self.caching, tle_file)
         self._intro()
         self._set_prompt_path()
         self.emptyline = lambda: None
@@ -294,6 +296,26 @@ class NyanShell(mpfshell.MpFileShell):
         az, = parsed_args
         self.client.azimuth(az)
 
+    @cli_handler
+    def do_point(self, args):
+        """point <AZIMUTH> <ELEVATION>
+        Point the antenna in closed loop, using the IMU as feedback, and report how long it
+        took to settle and the remaining pointing error. Use 'cancel' to release the target.
+        """
+        arg_properties = [
+            CLIArgumentProperty(
+                float,
+                None
+            ),
+            CLIArgumentProperty(
+                float,
+                None
+            )
+        ]
+        parsed_args = parse_cli_args(args, 'point', 2, arg_properties)
+        az, el = parsed_args
+        self.client.point(az, el)
+
     @cli_handler
     def do_antkontrol(self, args):
         """antkontrol <start | status>
@@ -314,7 +336,9 @@ class NyanShell(mpfshell.MpFileShell):
     @cli_handler
     def do_track(self, args):
         """track <SATELLITE_NAME>
-        Tracks a satellite across the sky. Satellite data is taken from Active-Space-Stations file from Celestrak."""
+        Tracks a satellite across the sky. SATELLITE_NAME can also be a NORAD catalog number.
+        Satellite data is taken from the active satellites file from Celestrak, and cached
+        locally between runs."""
         arg_properties = [
             CLIArgumentProperty(
                 str,
@@ -325,6 +349,31 @@ class NyanShell(mpfshell.MpFileShell):
         sat_name, = parsed_args
         self.client.track(sat_name)
 
+    @cli_handler
+    def do_schedule(self, args):
+        """schedule <SATELLITE_NAMES> <HOURS> <priority | elevation>
+        Track several satellites back to back over the next HOURS hours. SATELLITE_NAMES is a
+        comma separated list, in decreasing order of priority. Overlapping passes are resolved
+        by that priority, or by the highest elevation reached."""
+        arg_properties = [
+            CLIArgumentProperty(
+                str,
+                None
+            ),
+            CLIArgumentProperty(
+                float,
+                None
+            ),
+            CLIArgumentProperty(
+                str,
+                set(POLICIES)
+            )
+        ]
+        parsed_args = parse_cli_args(args, 'schedule', 3, arg_properties)
+        sat_names, hours, policy = parsed_args
+        sat_names = [sat_name.strip() for sat_name in sat_names.split(',') if sat_name.strip()]
+        self.client.schedule(sat_names, hours, policy)
+
     def do_cancel(self, args):
         """cancel
         Cancel tracking mode.
@@ -368,6 +417,10 @@ def main():
         "--nocache", help="disable cache", action="store_true", default=False
     )
 
+    parser.add_argument(
+        "--tle", help="track from a local TLE file (offline mode)", default=None
+    )
+
     parser.add_argument("--logfile", help="write log to file", default=None)
     parser.add_argument(
         "--loglevel",
@@ -409,7 +462,7 @@ def main():
         % (sys.version_info[0], sys.version_info[1], serial.VERSION)
     )
 
-    nyanshell = NyanShell(not args.nocolor, not args.nocache, args.reset)
+    nyanshell = NyanShell(not args.nocolor, not args.nocache, args.reset, args.tle)
 
     if args.open is not None:
         if args.board is None:
@@ -1,13 +1,16 @@
 # Client middle layer
+import aiohttp
 import ast
 import asyncio
 import getpass
 import json
 import logging
 import threading
+import time
 
 from time import sleep
 from dataclasses import dataclass
+from datetime import datetime
 from typing import List
 
 from nyansat.host.shell.terminal_printer import TerminalPrinter
@@ -18,19 +21,33 @@ from mp.pyboard import PyboardError
 from mp.mpfexp import MpFileExplorer
 from nyansat.host.shell.nyan_pyboard import NyanPyboard
 
-from nyansat.host.satellite_observer import SatelliteObserver, parse_tle_file
+from nyansat.host.satellite_observer import SatelliteObserver
+from nyansat.host.scheduler import TrackingScheduler
+from nyansat.host.tle_catalog import TleCatalog, TleDownloadError
+from nyansat.host.trajectory import encode_trajectory
 
 
-import nyansat.host.satdata_client as SatelliteScraper
+# Seconds between points of an uploaded trajectory; the station interpolates in between
+TRAJECTORY_STEP = 1.
+# How far ahead to look for the end of the current pass
+PASS_SEARCH_WINDOW = 60 * 60
+# How long to wait for closed-loop pointing to settle, and to measure the steady-state error after
+POINT_SETTLE_TIMEOUT = 15.
+POINT_STEADY_STATE_WINDOW = 2.
 
 
 class AntennyClient(object):
 
-    def __init__(self, caching):
+    def __init__(self, caching, tle_file=None):
         self.caching = caching
+        self.tle_catalog = TleCatalog(offline_path=tle_file)
         self.fe = None
         self.invoker = None
         self.tracking = None
+        self.pointing = False
+        # Bumped every time tracking starts, so that the thread waiting for the end
+        # of an earlier track or schedule does not end the current one
+        self._tracking_run = 0
         self.prompts = {
             "antenny_board_version": ("Antenny Board Version (integer, -1 for DIY)", int),
             "gps_uart_tx": ("GPS UART TX pin#", int),
@@ -45,16 +62,33 @@ class AntennyClient(object):
             "i2c_bno_sda": ("BNO055 SDA pin#", int),
             "i2c_bno_address": ("BNO055 address (in decimal)", int),
             "use_imu": ("Use IMU (True or False)", bool),
+            "imu_sample_rate": ("IMU sampling rate (Hz)", float),
             "i2c_screen_scl": ("Screen SCL pin#", int),
             "i2c_screen_sda": ("Screen SDA pin#", int),
             "i2c_screen_address": ("Screen address (in decimal)", int),
             "use_screen": ("Use Screen (True or False)", bool),
-            "elevation_servo_index": ("Servo default elevation index", float),
-            "azimuth_servo_index": ("Servo default azimuth index", float),
-            "elevation_max_rate": ("Servo elevation max rate", float),
-            "azimuth_max_rate": ("Servo azimuth max rate", float),
+            "elevation_servo_index": ("Servo default elevation index", int),
+            "azimuth_servo_index": ("Servo default azimuth index", int),
+            "elevation_max_rate": ("Servo elevation max rate (degrees/ms)", float),
+            "azimuth_max_rate": ("Servo azimuth max rate (degrees/ms)", float),
+            "elevation_max_acceleration": ("Servo elevation max acceleration (degrees/ms^2)", float),
+            "azimuth_max_acceleration": ("Servo azimuth max acceleration (degrees/ms^2)", float),
+            "azimuth_kp": ("Azimuth pointing PID proportional gain", float),
+            "azimuth_ki": ("Azimuth pointing PID integral gain", float),
+            "azimuth_kd": ("Azimuth pointing PID derivative gain", float),
+            "elevation_kp": ("Elevation pointing PID proportional gain", float),
+            "elevation_ki": ("Elevation pointing PID integral gain", float),
+            "elevation_kd": ("Elevation pointing PID derivative gain", float),
+            "pid_rate": ("Pointing PID control rate (Hz)", float),
+            "pid_tolerance": ("Pointing tolerance (degrees)", float),
             "use_webrepl": ("Use WebREPL", bool),
             "use_telemetry": ("Use Telemetry", bool),
+            "telemetry_rate": ("Telemetry sampling rate (Hz)", float),
+            "telemetry_binary": ("Send binary telemetry batches (False for JSON)", bool),
+            "station_id": ("Station identifier (integer)", int),
+            "use_rpc": ("Serve RPC requests over WiFi (True or False)", bool),
+            "rpc_port": ("RPC server TCP port", int),
+            "rpc_secret": ("RPC server shared secret, required to serve RPC", str),
             "enable_demo": ("Enable movement demo (short pin#15 to ground)", bool)
         }
 
@@ -101,6 +135,35 @@ class AntennyClient(object):
         self.safemode_guard()
         self.invoker.set_azimuth_degree(az)
 
+    @exception_handler
+    def point(self, az, el):
+        self.guard_open()
+        self.guard_init()
+        self.safemode_guard()
+        if self.invoker.is_tracking():
+            raise AlreadyTrackingError
+        self.invoker.point(az, el)
+        self.pointing = True
+        print("Pointing in closed loop ...")
+        with self.invoker.rpc_session() as rpc:
+            deadline = time.time() + POINT_SETTLE_TIMEOUT
+            status = rpc.pointing_status()
+            while status["settle_time_ms"] is None and time.time() < deadline:
+                sleep(0.2)
+                status = rpc.pointing_status()
+            if status["settle_time_ms"] is None:
+                az_error, el_error = status["error"]
+                TerminalPrinter.print_error(
+                    f"Not settled after {POINT_SETTLE_TIMEOUT:.0f} s, "
+                    f"error is {az_error:.2f} deg azimuth, {el_error:.2f} deg elevation")
+                return
+            sleep(POINT_STEADY_STATE_WINDOW)
+            status = rpc.pointing_status()
+        print(f"Settled in {status['settle_time_ms']} ms")
+        if status["steady_state_error"] is not None:
+            az_error, el_error = status["steady_state_error"]
+            print(f"Steady-state error: {az_error:.2f} deg azimuth, {el_error:.2f} deg elevation")
+
     @exception_handler
     def antkontrol(self, mode):
         self.guard_open()
@@ -129,10 +192,38 @@ class AntennyClient(object):
         imu_enabled = self.invoker.config_get("use_imu")
         if imu_enabled == 'False':
             TerminalPrinter.print_track_warning()
-        self.invoker.set_tracking(True)
+        run = self._start_tracking()
+        latitude = float(self.invoker.config_get("latitude"))
+        longitude = float(self.invoker.config_get("longitude"))
+        try:
+            end = asyncio.run(self._start_track(sat_name, (latitude, longitude)))
+        except Exception:
+            self.invoker.set_tracking(False)
+            raise
+        t = threading.Thread(target=self._end_track, args=(run, end))
+        t.start()
+
+    @exception_handler
+    def schedule(self, sat_names: List[str], hours: float, policy: str):
+        self.guard_open()
+        self.guard_init()
+        imu_enabled = self.invoker.config_get("use_imu")
+        if imu_enabled == 'False':
+            TerminalPrinter.print_track_warning()
         latitude = float(self.invoker.config_get("latitude"))
         longitude = float(self.invoker.config_get("longitude"))
-        asyncio.run(self._start_track(sat_name, (latitude, longitude)))
+        plan = asyncio.run(self._plan_schedule(sat_names, (latitude, longitude), hours, policy))
+        if not plan:
+            raise NoPassesError
+        print("Tracking plan:")
+        for planned in plan:
+            start = datetime.fromtimestamp(planned.start).strftime("%Y-%m-%d %H:%M:%S")
+            stop = datetime.fromtimestamp(planned.stop).strftime("%H:%M:%S")
+            print(f"  {start} - {stop}  {planned.sat_name} "
+                  f"(max elevation {planned.satellite_pass.max_elevation:.1f}º)")
+        run = self._start_tracking()
+        t = threading.Thread(target=self._run_plan, args=(run, plan))
+        t.start()
 
     @exception_handler
     def cancel(self):
@@ -141,6 +232,9 @@ class AntennyClient(object):
         self.guard_init()
         if self.invoker.is_tracking():
             self._cancel()
+        elif self.pointing:
+            self.invoker.stop_pointing()
+            self.pointing = False
         else:
             raise NotTrackingError
 
@@ -185,24 +279,26 @@ class AntennyClient(object):
         waiting_dot_count = 4
         dot_counter = 0
         sleep(1)
-        while not (magnet_calibrated and accel_calibrated and gyro_calibrated):
-            sleep(0.5)
-            old_calibration_status = (system_calibrated, gyro_calibrated, accel_calibrated, magnet_calibrated)
-            system_calibrated, gyro_calibrated, accel_calibrated, magnet_calibrated = TerminalPrinter.display_loop_calibration_status(
-                data,
-                old_calibration_status,
-                waiting_dot_count,
-                dot_counter
-            )
-
-            # Re-fetch calibration data
-            data = self.invoker.imu_calibration_status()
-            data = (data['system'], data['gyroscope'], data['accelerometer'], data['magnetometer'])
-            if not data:
-                TerminalPrinter.print_error("Error connecting to BNO055.")
-                return
-
-            dot_counter = (dot_counter + 1) % waiting_dot_count
+        # Poll through a single RPC session instead of one raw REPL exec per status
+        with self.invoker.rpc_session() as rpc:
+            while not (magnet_calibrated and accel_calibrated and gyro_calibrated):
+                sleep(0.5)
+                old_calibration_status = (system_calibrated, gyro_calibrated, accel_calibrated, magnet_calibrated)
+                system_calibrated, gyro_calibrated, accel_calibrated, magnet_calibrated = TerminalPrinter.display_loop_calibration_status(
+                    data,
+                    old_calibration_status,
+                    waiting_dot_count,
+                    dot_counter
+                )
+
+                # Re-fetch calibration data
+                data = rpc.imu_calibration_status()
+                data = (data['system'], data['gyroscope'], data['accelerometer'], data['magnetometer'])
+                if not data:
+                    TerminalPrinter.print_error("Error connecting to BNO055.")
+                    return
+
+                dot_counter = (dot_counter + 1) % waiting_dot_count
 
         print(f"System calibration complete: {TerminalPrinter.YES_DISPLAY_STRING}")
         print("Saving calibration data ...")
@@ -256,9 +352,11 @@ class AntennyClient(object):
         print("Welcome to Antenny!")
         print("Please enter the following information about your hardware\n")
 
+        defaults = self.invoker.config_get_default_many(self.prompts.keys())
+        new_values = {}
         for k, info in self.prompts.items():
             prompt_text_bare, typ = info
-            default_val = self.invoker.config_get_default(k)
+            default_val = defaults[k]
             prompt_text = prompt_text_bare + " (Default value is {}): ".format(default_val)
             try:
                 if typ == bool:
@@ -273,11 +371,13 @@ class AntennyClient(object):
                     new_val = typ(input(prompt_text))
 
             except ValueError:
-                new_val = self.invoker.config_get_default(k)
+                new_val = default_val
                 print("Invalid type, setting to default value \"{}\".\nUse \"set\" to "
                       "change the parameter".format(new_val))
 
-            self.invoker.config_set(k, new_val)
+            new_values[k] = new_val
+
+        self.invoker.config_set_many(new_values)
 
         # TODO: figure this out, do we need this (make caching by default?)
         if self.caching:
@@ -304,10 +404,11 @@ class AntennyClient(object):
     def configs(self):
         # TODO: Something with ConfigUnknownError
         self.guard_open()
+        values = self.invoker.config_get_many(self.prompts.keys())
         print("-Config parameters-\n" +
               "Using \"{}\"".format(self.invoker.which_config()))
         for key in self.prompts.keys():
-            print(key + ": " + self.invoker.config_get(key))
+            print(key + ": " + values[key])
 
     @exception_handler
     def switch(self, name):
@@ -322,31 +423,78 @@ class AntennyClient(object):
         print("Switched from \"{}\"".format(current) +
               " to \"{}\"".format(name))
 
-    @exception_handler
-    def _track_update(self, observer):
-        """Update the antenna position every 2 seconds"""
-        print(f"Tracking {observer.sat_name} ...")
-        while self.invoker.is_tracking():
-            elevation, azimuth, distance = observer.get_current_stats()
-            self.invoker.set_elevation_degree(elevation)
-            self.invoker.set_azimuth_degree(azimuth)
-            sleep(2)
+    async def _load_catalog(self):
+        """Load the TLE catalog, from the local cache when it is fresh enough"""
+        try:
+            catalog = await self.tle_catalog.load()
+        except (aiohttp.ClientError, OSError, TleDownloadError) as e:
+            raise TleUnavailableError(str(e))
+        if len(catalog) == 0:
+            raise TleUnavailableError
+        return catalog
+
+    def _upload_pass(self, observer, start, stop):
+        """Compute the trajectory between start and stop and hand it to the station"""
+        times, elevations, azimuths, _ = observer.get_stats_window(start, stop, TRAJECTORY_STEP)
+        self.invoker.play_trajectory(encode_trajectory(times, azimuths, elevations))
+        # Playing a trajectory releases any closed-loop pointing target on the station
+        self.pointing = False
 
     async def _start_track(self, sat_name, coords):
         """Track a satellite across the sky"""
-        tle_data_encoded = await SatelliteScraper.load_tle()
-        tle_data = parse_tle_file(tle_data_encoded)
-        observer = SatelliteObserver.parse_tle(coords, sat_name, tle_data)
+        catalog = await self._load_catalog()
+        observer = SatelliteObserver.from_catalog(coords, sat_name, catalog)
 
         if not observer.get_visible():
             self._cancel()
             raise NotVisibleError
-        t = threading.Thread(target=self._track_update, args=(observer,))
-        t.start()
+        now = time.time()
+        passes = observer.find_passes(now, now + PASS_SEARCH_WINDOW)
+        end = passes[0].set_time if passes else now + PASS_SEARCH_WINDOW
+        self._upload_pass(observer, now, end)
+        print(f"Tracking {observer.sat_name} for the next {int(end - now)} seconds ...")
+        return end
+
+    async def _plan_schedule(self, sat_names, coords, hours, policy):
+        """Compute a back to back tracking plan for several satellites"""
+        catalog = await self._load_catalog()
+        observers = [SatelliteObserver.from_catalog(coords, sat_name, catalog) for sat_name in sat_names]
+        now = time.time()
+        return TrackingScheduler(observers, policy=policy).plan(now, now + hours * 60 * 60)
+
+    def _start_tracking(self) -> int:
+        """Enter tracking mode, return the run to hand to the thread ending it"""
+        self._tracking_run += 1
+        self.invoker.set_tracking(True)
+        return self._tracking_run
+
+    def _is_tracking_run(self, run: int) -> bool:
+        return self._tracking_run == run and self.invoker.is_tracking()
+
+    def _end_track(self, run, end):
+        """Leave tracking mode once the pass uploaded by track is over"""
+        while self._is_tracking_run(run) and time.time() < end:
+            sleep(1)
+        if self._tracking_run == run:
+            self.invoker.set_tracking(False)
+
+    @exception_handler
+    def _run_plan(self, run, plan):
+        """Hand each planned pass to the station as soon as the previous one is over"""
+        for planned in plan:
+            if not self._is_tracking_run(run):
+                return
+            self._upload_pass(planned.observer, max(time.time(), planned.start), planned.stop)
+            while self._is_tracking_run(run) and time.time() < planned.stop:
+                sleep(1)
+        if self._tracking_run == run:
+            self.invoker.set_tracking(False)
 
     def _cancel(self):
         """Cancel tracking mode"""
         self.invoker.set_tracking(False)
+        if self.invoker.is_playing_trajectory():
+            self.invoker.stop_trajectory()
 
     @exception_handler
     def wifi_setup(self):
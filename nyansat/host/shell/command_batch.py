@@ -0,0 +1,111 @@
+import json
+from typing import Any, List, Tuple
+
+from mp.pyboard import PyboardError
+
+_EXEC = "exec"
+_EVAL_STR = "eval"
+_EVAL_JSON = "eval_json"
+
+_SCRIPT_PROLOGUE = """try:
+    import ujson as _batch_json
+except ImportError:
+    import json as _batch_json
+_batch_replies = []
+_batch_failed = False
+"""
+
+_SCRIPT_EPILOGUE = """print(_batch_json.dumps(_batch_replies))
+del _batch_replies, _batch_failed, _batch_json
+"""
+
+
+class CommandBatch(object):
+    """
+    Queue of statements and expressions that run on the ESP32 as a single
+    generated script, so that several invoker operations cost one raw-REPL
+    round trip. Each queued operation returns a handle used to look up its
+    result in the BatchResult returned by CommandInvoker.run_batch.
+    """
+
+    def __init__(self, stop_on_error: bool = True):
+        """
+        :param stop_on_error: skip the remaining operations once one of them raises
+        """
+        self.stop_on_error = stop_on_error
+        self._operations: List[Tuple[str, str]] = []
+
+    def __len__(self):
+        return len(self._operations)
+
+    def _add(self, kind: str, code: str) -> int:
+        self._operations.append((kind, code))
+        return len(self._operations) - 1
+
+    def exec_(self, statement: str) -> int:
+        """Queue a single line statement; its result is None."""
+        return self._add(_EXEC, statement)
+
+    def eval(self, expression: str) -> int:
+        """Queue an expression whose result is its string form, like eval_string_expr."""
+        return self._add(_EVAL_STR, expression)
+
+    def eval_json(self, expression: str) -> int:
+        """Queue an expression whose result is JSON serializable on the board."""
+        return self._add(_EVAL_JSON, expression)
+
+    def script(self) -> str:
+        """Generate the script that runs every queued operation and prints the JSON replies."""
+        lines = [_SCRIPT_PROLOGUE]
+        for kind, code in self._operations:
+            if kind == _EXEC:
+                body = [code, "_batch_replies.append([1, None])"]
+            elif kind == _EVAL_STR:
+                body = ["_batch_replies.append([1, str({})])".format(code)]
+            else:
+                body = ["_batch_replies.append([1, {}])".format(code)]
+            lines.append("if not _batch_failed:\n" if self.stop_on_error else "if True:\n")
+            lines.append("    try:\n")
+            lines.extend("        {}\n".format(line) for line in body)
+            lines.append(
+                "    except Exception as _batch_error:\n"
+                "        _batch_replies.append([0, repr(_batch_error)])\n"
+                "        _batch_failed = True\n"
+                "else:\n"
+                "    _batch_replies.append([0, None])\n"
+            )
+        lines.append(_SCRIPT_EPILOGUE)
+        return "".join(lines)
+
+
+class BatchResult(object):
+    """Results of a CommandBatch, indexed by the handles returned when queueing."""
+
+    def __init__(self, replies: List[List[Any]]):
+        self._replies = replies
+
+    @classmethod
+    def parse(cls, output: bytes) -> 'BatchResult':
+        """Parse the board's output; the JSON replies are always on the last line."""
+        lines = output.strip().split(b"\n")
+        try:
+            return cls(json.loads(lines[-1].decode()))
+        except (ValueError, UnicodeDecodeError) as e:
+            raise PyboardError("Malformed batch reply", output, str(e).encode())
+
+    def ok(self, handle: int) -> bool:
+        return bool(self._replies[handle][0])
+
+    def error(self, handle: int):
+        """The repr of the exception raised by an operation, None if it succeeded or was skipped."""
+        if self.ok(handle):
+            return None
+        return self._replies[handle][1]
+
+    def __getitem__(self, handle: int):
+        """Return the result of an operation, raising PyboardError if it failed or was skipped."""
+        ok, value = self._replies[handle]
+        if not ok:
+            message = value if value is not None else "skipped after an earlier error"
+            raise PyboardError("Batched command failed", b"", message.encode())
+        return value
@@ -1,15 +1,25 @@
 import ast
+import base64
 from dataclasses import dataclass
 import json
-from typing import List
+from typing import Dict, Iterable, List
 
+from nyansat.host.shell.command_batch import BatchResult, CommandBatch
 from nyansat.host.shell.nyan_pyboard import NyanPyboard
+from nyansat.host.shell.rpc_client import PyboardRpcTransport, rpc_session
 from nyansat.host.shell.errors import *
 
 
 class CommandInvoker(NyanPyboard):
     """
     Replacement for nyan_explorer. Antenny-specific functionality only.
+
+    The move to RPC is partial: commands repeated in a loop (pointing and
+    calibration status polls) go through rpc_session(), which pays its start
+    up once. One-shot commands still run as generated source through exec_()
+    or a CommandBatch, since a session for a single call costs more round
+    trips than the exec it replaces. Setup that creates REPL globals (api,
+    config) and the bus diagnostics have no RPC counterpart and stay here.
     """
     def __init__(self, con):
         super().__init__(con)
@@ -18,6 +28,21 @@ class CommandInvoker(NyanPyboard):
     EL_SERVO_INDEX = "elevation_servo_index"
     AZ_SERVO_INDEX = "azimuth_servo_index"
 
+    def run_batch(self, batch: CommandBatch) -> BatchResult:
+        """Run every operation queued in a CommandBatch in a single round trip."""
+        return BatchResult.parse(self.exec_(batch.script()))
+
+    def rpc_session(self):
+        """
+        Serve AntennyAPI calls over the serial link for the duration of a with
+        block, yielding an AntennyRpcClient. The raw REPL is unavailable until
+        the block exits.
+        """
+        try:
+            return rpc_session(PyboardRpcTransport(self))
+        except PyboardError as e:
+            raise NotRespondingError(str(e))
+
     def is_antenna_initialized(self):
         """Test if there is an AntKontrol object on the board"""
         try:
@@ -61,6 +86,20 @@ class CommandInvoker(NyanPyboard):
         except PyboardError as e:
             raise NoSuchConfigError(str(e))
 
+    def config_get_many(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Get the values of several config parameters in a single round trip.
+
+        Arguments:
+        keys -- names of config parameters.
+        """
+        batch = CommandBatch(stop_on_error=False)
+        handles = {key: batch.eval("config.get(\"{}\")".format(key)) for key in keys}
+        try:
+            result = self.run_batch(batch)
+            return {key: result[handle] for key, handle in handles.items()}
+        except PyboardError as e:
+            raise NoSuchConfigError(str(e))
+
     def config_set(self, key, val):
         """Set an individual parameter in the config file.
 
@@ -87,6 +126,34 @@ class CommandInvoker(NyanPyboard):
         except PyboardError as e:
             raise NoSuchConfigError(str(e))
 
+    def config_set_many(self, values: Dict):
+        """Set several parameters in the config file in a single round trip,
+        the file is written once.
+
+        Arguments:
+        values -- mapping of config parameter names to their new value.
+        """
+        batch = CommandBatch()
+        handle = batch.exec_("config.set_many({!r})".format(values))
+        try:
+            self.run_batch(batch)[handle]
+        except PyboardError as e:
+            raise NoSuchConfigError(str(e))
+
+    def config_get_default_many(self, keys: Iterable[str]) -> Dict:
+        """Get the typed default values of several config parameters in a single round trip.
+
+        Arguments:
+        keys -- names of config parameters.
+        """
+        batch = CommandBatch(stop_on_error=False)
+        handles = {key: batch.eval_json("config.get_default(\"{}\")".format(key)) for key in keys}
+        try:
+            result = self.run_batch(batch)
+            return {key: result[handle] for key, handle in handles.items()}
+        except PyboardError as e:
+            raise NoSuchConfigError(str(e))
+
     def config_new(self, name):
         """Create a new config file on the ESP32.
 
@@ -109,6 +176,19 @@ class CommandInvoker(NyanPyboard):
         except PyboardError as e:
             raise ConfigUnknownError(str(e))
 
+    @staticmethod
+    def _queue_i2c_scan(batch: CommandBatch, sda, scl):
+        """Queue the creation of an I2C bus on the given pins, return the handle of its scan."""
+        batch.exec_("import machine")
+        batch.exec_("from machine import Pin")
+        batch.exec_(
+            "i2c = machine.I2C(-1, sda=Pin({}, Pin.OUT, Pin.PULL_DOWN), scl=Pin({}, Pin.OUT, Pin.PULL_DOWN))".format(
+                    sda,
+                    scl
+                )
+            )
+        return batch.eval_json("i2c.scan()")
+
     def i2c_scan(self, sda, scl):
         """
         Create and scan an i2c bus for addresses; helpful for debugging
@@ -116,15 +196,9 @@ class CommandInvoker(NyanPyboard):
         :param scl: Pin number for scl
         :return: Addresses found on i2c bus
         """
-        self.exec_("import machine")
-        self.exec_("from machine import Pin")
-        self.exec_(
-            "i2c = machine.I2C(-1, sda=Pin({}, Pin.OUT, Pin.PULL_DOWN), scl=Pin({}, Pin.OUT, Pin.PULL_DOWN))".format(
-                    sda,
-                    scl
-                )
-            )
-        return self.eval_string_expr("i2c.scan()")
+        batch = CommandBatch()
+        scan = self._queue_i2c_scan(batch, sda, scl)
+        return str(self.run_batch(batch)[scan])
 
     def imu_calibration_status(self):
         """Get IMU calibration status."""
@@ -187,6 +261,60 @@ class CommandInvoker(NyanPyboard):
         except PyboardError as e:
             raise StartMotionError(str(e))
 
+    def point(self, az_angle, el_angle):
+        """Point the antenna in closed loop, using the IMU as feedback.
+
+        Arguments:
+        az_angle -- desired azimuth angle.
+        el_angle -- desired elevation angle.
+        """
+        try:
+            self.exec_("api.point({}, {})".format(az_angle, el_angle))
+        except PyboardError as e:
+            raise StartMotionError(str(e))
+
+    def stop_pointing(self):
+        """Release the closed-loop pointing target, if any."""
+        try:
+            self.exec_("api.stop_pointing()")
+        except PyboardError as e:
+            raise NotRespondingError(str(e))
+
+    def pointing_status(self):
+        """Get the closed-loop pointing report, None when not pointing."""
+        batch = CommandBatch()
+        status = batch.eval_json("api.pointing_status()")
+        try:
+            return self.run_batch(batch)[status]
+        except PyboardError as e:
+            raise NotRespondingError(str(e))
+
+    def play_trajectory(self, table: bytes):
+        """Upload a packed trajectory table and start following it, in a single round trip.
+
+        Arguments:
+        table -- trajectory table, as packed by nyansat.host.trajectory.encode_trajectory.
+        """
+        encoded = base64.b64encode(table).decode('ascii')
+        try:
+            self.exec_("api.play_trajectory('{}')".format(encoded))
+        except PyboardError as e:
+            raise StartMotionError(str(e))
+
+    def stop_trajectory(self):
+        """Stop following the current trajectory, if any."""
+        try:
+            self.exec_("api.stop_trajectory()")
+        except PyboardError as e:
+            raise NotRespondingError(str(e))
+
+    def is_playing_trajectory(self):
+        """Check if the antenna is currently following a trajectory."""
+        try:
+            return self.eval_string_expr("api.is_playing_trajectory()") == 'True'
+        except PyboardError as e:
+            raise NotRespondingError(str(e))
+
     def create_antkontrol(self):
         """Create an antkontrol object on the ESP32."""
         try:
@@ -231,124 +359,68 @@ class CommandInvoker(NyanPyboard):
     def bno_diagnostics(self, sda, scl):
         """
         Create a BNO controller object for the given I2C sda/scl configuration. Uses the default
-        value of 40 for the BNO055 I2C address.
+        value of 40 for the BNO055 I2C address. All steps run in a single round trip.
         :param sda: Pin number for sda
         :param scl: Pin number for scl
         :return: A BnoTestDiagnostics object containing relevant T/F information about the setup
         """
-        i2c_bus_scannable = False
-        i2c_addresses = []
-        bno_object_created = False
-        bno_object_calibrated = False
-
-        # Test scanning I2C bus
-        try:
-            addresses = self.i2c_scan(sda, scl)
-        except PyboardError:
-            return BnoTestDiagnostics(
-                i2c_bus_scannable,
-                i2c_addresses,
-                bno_object_created,
-                bno_object_calibrated
-            )
-        i2c_bus_scannable = True
-
-        # Test what's on the I2C bus and their addresses
-        try:
-            i2c_addresses = [int(n) for n in addresses.strip('] [').split(', ')]
-            if not i2c_addresses:
-                return BnoTestDiagnostics(
-                    i2c_bus_scannable,
-                    i2c_addresses,
-                    bno_object_created,
-                    bno_object_calibrated
-                )
-        except ValueError:
-            return BnoTestDiagnostics(
-                i2c_bus_scannable,
-                i2c_addresses,
-                bno_object_created,
-                bno_object_calibrated
-            )
+        batch = CommandBatch()
+        scan = self._queue_i2c_scan(batch, sda, scl)
+        batch.exec_("from imu.imu_bno055 import Bno055ImuController")
+        create = batch.exec_("bno = Bno055ImuController(i2c)")
+        calibration = batch.eval("bno.get_calibration_status()")
+        result = self.run_batch(batch)
+
+        # Test scanning I2C bus and what's on it
+        if not result.ok(scan):
+            return BnoTestDiagnostics(False, [], False, False)
+        i2c_addresses = result[scan]
+        if not i2c_addresses:
+            return BnoTestDiagnostics(True, i2c_addresses, False, False)
 
         # Test creating BNO object
-        try:
-            self.exec_("from imu.imu_bno055 import Bno055ImuController")
-            self.exec_("bno = Bno055ImuController(i2c)")
-        except PyboardError:
-            return BnoTestDiagnostics(
-                i2c_bus_scannable,
-                i2c_addresses,
-                bno_object_created,
-                bno_object_calibrated
-            )
-        bno_object_created = True
+        if not result.ok(create):
+            return BnoTestDiagnostics(True, i2c_addresses, False, False)
 
         # Test calibration status of BNO object
         try:
-            calibration_status = json.loads(self.eval_string_expr("bno.get_calibration_status()"))
-            bno_object_calibrated = calibration_status['system'] > 0
-        except PyboardError:
+            bno_object_calibrated = json.loads(result[calibration])['system'] > 0
+        except (PyboardError, ValueError, KeyError):
             bno_object_calibrated = False
 
         return BnoTestDiagnostics(
-            i2c_bus_scannable,
+            True,
             i2c_addresses,
-            bno_object_created,
+            True,
             bno_object_calibrated
         )
 
     def pwm_diagnostics(self, sda, scl):
         """
         Create a PCA9685 controller object for the given I2C sda/scl configuration. Uses the default
-        value of 40 for the controller's address.
+        value of 40 for the controller's address. All steps run in a single round trip.
         :param sda: Pin number for sda
         :param scl: Pin number for scl
         :return: A PwmTestDiagnostics object containing relevant T/F information about the setup
         """
-        i2c_bus_scannable = False
-        i2c_addresses = []
-        pca_object_created = False
-
-        # Test scanning I2C bus
-        try:
-            addresses = self.i2c_scan(sda, scl)
-        except PyboardError:
-            return PwmTestDiagnostics(
-                i2c_bus_scannable,
-                i2c_addresses,
-                pca_object_created
-            )
-        i2c_bus_scannable = True
-
-        # Test what's on the I2C bus and their addresses
-        try:
-            i2c_addresses = [int(n) for n in addresses.strip('] [').split(', ')]
-            if not i2c_addresses:
-                return PwmTestDiagnostics(
-                    i2c_bus_scannable,
-                    i2c_addresses,
-                    pca_object_created
-                )
-        except ValueError:
-            return PwmTestDiagnostics(
-                i2c_bus_scannable,
-                i2c_addresses,
-                pca_object_created
-            )
-
-        # Test creating BNO object
-        try:
-            self.exec_("from motor.motor_pca9685 import Pca9685Controller")
-            self.exec_("pca = Pca9685Controller(i2c)")
-            pca_object_created = True
-        except PyboardError:
-            pca_object_created = False
-
+        batch = CommandBatch()
+        scan = self._queue_i2c_scan(batch, sda, scl)
+        batch.exec_("from motor.motor_pca9685 import Pca9685Controller")
+        create = batch.exec_("pca = Pca9685Controller(i2c)")
+        result = self.run_batch(batch)
+
+        # Test scanning I2C bus and what's on it
+        if not result.ok(scan):
+            return PwmTestDiagnostics(False, [], False)
+        i2c_addresses = result[scan]
+        if not i2c_addresses:
+            return PwmTestDiagnostics(True, i2c_addresses, False)
+
+        # Test creating PCA object
         return PwmTestDiagnostics(
-            i2c_bus_scannable,
+            True,
             i2c_addresses,
-            pca_object_created
+            result.ok(create)
         )
 
 @dataclass
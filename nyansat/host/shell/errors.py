@@ -80,6 +80,15 @@ class NotVisibleError(AntennyException):
     msg = "The satellite is not visible from your position"
 
 
+class NoPassesError(AntennyException):
+    msg = "None of the satellites pass above your position within the given time horizon"
+
+
+class TleUnavailableError(AntennyException):
+    msg = "Could not load satellite data. Check your internet connection, or start the shell with " \
+          "'--tle <FILE>' to use a local TLE file"
+
+
 class DeviceNotOpenError(AntennyException):
     msg = "Not connected to device. Use 'open' first."
 
@@ -131,6 +140,10 @@ class NotTrackingError(AntennyException):
     msg = "The antenna is not currently tracking any satellite"
 
 
+class AlreadyTrackingError(AntennyException):
+    msg = "The antenna is tracking a satellite, use 'cancel' first"
+
+
 class AntennaAPIFactoryError(AntennyException):
     msg = "Could not initalize Antenny API"
 
@@ -0,0 +1,245 @@
+import base64
+import json
+import socket
+from contextlib import contextmanager
+from typing import Any, Iterable, List, Sequence, Tuple
+
+from mp.pyboard import Pyboard, PyboardError
+
+from nyansat.host.shell.errors import *
+
+# Must match nyansat/station/rpc/server.py
+EXIT_METHOD = "rpc.exit"
+PING_METHOD = "rpc.ping"
+AUTH_METHOD = "rpc.auth"
+DEFAULT_RPC_PORT = 31338
+
+_SERVE_STDIO_SCRIPT = "from rpc.server import serve_stdio\nserve_stdio(api)\n"
+# The ESP32 UART receive buffer is small, so only a few pipelined requests are kept in flight
+_MAX_IN_FLIGHT = 8
+
+
+class RpcError(PyboardError):
+    """
+    A remote call failed on the station. Uses the same argument layout as the
+    errors raised by Pyboard.exec_, so print_board_error shows the remote error.
+    """
+
+    def __init__(self, method: str, error: str):
+        super().__init__("RPC {} failed".format(method), b"", error.encode())
+        self.method = method
+        self.error = error
+
+
+class SocketRpcTransport(object):
+    """
+    JSON-lines transport over the station's TCP RPC server (see 'use_rpc'),
+    authenticated with the station's 'rpc_secret'.
+    """
+
+    def __init__(self, host: str, secret: str, port: int = DEFAULT_RPC_PORT, timeout: float = 5.):
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._stream = self._socket.makefile("rwb")
+        self.write_line(json.dumps({"id": 0, "method": AUTH_METHOD, "params": [secret]}).encode())
+        reply = json.loads(self.read_line().decode())
+        if "error" in reply:
+            self.close()
+            raise RpcError(AUTH_METHOD, reply["error"])
+
+    def write_line(self, line: bytes):
+        self._stream.write(line + b"\n")
+        self._stream.flush()
+
+    def read_line(self) -> bytes:
+        line = self._stream.readline()
+        if not line:
+            raise PyboardError("RPC connection closed by the station")
+        return line
+
+    def close(self):
+        self._stream.close()
+        self._socket.close()
+
+
+class PyboardRpcTransport(object):
+    """
+    JSON-lines transport over the serial link. The RPC loop is started once
+    from the raw REPL and keeps the link until the transport is closed, after
+    which the raw REPL can be used again.
+    """
+
+    def __init__(self, pyboard: Pyboard, timeout: float = 5.):
+        self._pyboard = pyboard
+        self._timeout = timeout
+        self._pyboard.exec_raw_no_follow(_SERVE_STDIO_SCRIPT)
+
+    def write_line(self, line: bytes):
+        self._pyboard.con.write(line + b"\n")
+
+    def read_line(self) -> bytes:
+        line = self._pyboard.read_until(1, b"\n", timeout=self._timeout)
+        if line.startswith(b"\x04"):
+            # The RPC loop itself died, what follows is the traceback
+            error = self._pyboard.read_until(1, b"\x04", timeout=self._timeout)
+            raise PyboardError("RPC server stopped", line[1:], error.rstrip(b"\x04"))
+        if not line.endswith(b"\n"):
+            raise PyboardError("Timed out waiting for an RPC reply")
+        return line
+
+    def close(self):
+        self._pyboard.follow(self._timeout)
+
+
+class AntennyRpcClient(object):
+    """
+    Call AntennyAPI methods on the station through its RPC server. Unlike
+    CommandInvoker, arguments and results travel as JSON, so no Python source
+    is generated on the host and nothing is parsed back out of the REPL output.
+    """
+
+    def __init__(self, transport):
+        self._transport = transport
+        self._next_id = 0
+
+    def _send(self, method: str, params: Sequence) -> int:
+        self._next_id += 1
+        request = {"id": self._next_id, "method": method, "params": list(params)}
+        self._transport.write_line(json.dumps(request).encode())
+        return self._next_id
+
+    def _receive(self, request_id: int) -> dict:
+        while True:
+            try:
+                reply = json.loads(self._transport.read_line().decode())
+            except (ValueError, UnicodeDecodeError):
+                # Log output from the station shares the serial link, skip it
+                continue
+            if isinstance(reply, dict) and reply.get("id") == request_id:
+                return reply
+
+    @staticmethod
+    def _result(method: str, reply: dict) -> Any:
+        if "error" in reply:
+            raise RpcError(method, reply["error"])
+        return reply.get("result")
+
+    def call(self, method: str, *params) -> Any:
+        """Call a single method, e.g. call("antenna.set_azimuth", 45.)"""
+        return self._result(method, self._receive(self._send(method, params)))
+
+    def call_many(self, calls: Iterable[Tuple[str, Sequence]]) -> List[Any]:
+        """
+        Pipeline several calls: requests are sent without waiting for the
+        previous replies, so the whole sequence costs about one round trip.
+        Raises the first RpcError once every reply has been received.
+        """
+        calls = list(calls)
+        replies = []
+        pending = []
+        for method, params in calls:
+            pending.append((method, self._send(method, params)))
+            if len(pending) >= _MAX_IN_FLIGHT:
+                replies.append(self._receive(pending.pop(0)[1]))
+        replies.extend(self._receive(request_id) for _, request_id in pending)
+        return [self._result(method, reply) for (method, _), reply in zip(calls, replies)]
+
+    def ping(self) -> bool:
+        return self.call(PING_METHOD)
+
+    def close(self):
+        """Stop the RPC session and release the transport."""
+        try:
+            self.call(EXIT_METHOD)
+        finally:
+            self._transport.close()
+
+    def is_safemode(self) -> bool:
+        return self.call("is_safemode")
+
+    def config_get(self, key):
+        try:
+            return self.call("config.get", key)
+        except RpcError as e:
+            raise NoSuchConfigError(str(e))
+
+    def config_set(self, key, val):
+        try:
+            self.call("config.set", key, val)
+        except RpcError as e:
+            raise NoSuchConfigError(str(e))
+
+    def imu_calibration_status(self) -> dict:
+        try:
+            return json.loads(self.call("imu.get_calibration_status"))
+        except RpcError as e:
+            raise CalibrationStatusError(str(e))
+
+    def motor_test(self, index, pos):
+        try:
+            return tuple(self.call("motor_test", index, pos))
+        except RpcError as e:
+            raise NotRespondingError(str(e))
+
+    def start_motion(self, az_angle, el_angle):
+        try:
+            self.call("antenna.start_motion", az_angle, el_angle)
+        except RpcError as e:
+            raise NotRespondingError(str(e))
+
+    def set_azimuth_degree(self, az_angle):
+        try:
+            self.call("antenna.set_azimuth", az_angle)
+        except RpcError as e:
+            raise StartMotionError(str(e))
+
+    def set_elevation_degree(self, el_angle):
+        try:
+            self.call("antenna.set_elevation", el_angle)
+        except RpcError as e:
+            raise StartMotionError(str(e))
+
+    def point(self, az_angle, el_angle):
+        try:
+            self.call("point", az_angle, el_angle)
+        except RpcError as e:
+            raise StartMotionError(str(e))
+
+    def stop_pointing(self):
+        try:
+            self.call("stop_pointing")
+        except RpcError as e:
+            raise NotRespondingError(str(e))
+
+    def pointing_status(self):
+        try:
+            return self.call("pointing_status")
+        except RpcError as e:
+            raise NotRespondingError(str(e))
+
+    def play_trajectory(self, table: bytes):
+        try:
+            self.call("play_trajectory", base64.b64encode(table).decode('ascii'))
+        except RpcError as e:
+            raise StartMotionError(str(e))
+
+    def stop_trajectory(self):
+        try:
+            self.call("stop_trajectory")
+        except RpcError as e:
+            raise NotRespondingError(str(e))
+
+    def is_playing_trajectory(self) -> bool:
+        try:
+            return self.call("is_playing_trajectory")
+        except RpcError as e:
+            raise NotRespondingError(str(e))
+
+
+@contextmanager
+def rpc_session(transport):
+    """Open an AntennyRpcClient on a transport and always hand the link back afterwards."""
+    client = AntennyRpcClient(transport)
+    try:
+        yield client
+    finally:
+        client.close()
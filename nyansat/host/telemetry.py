@@ -0,0 +1,86 @@
+import struct
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+# Must match nyansat/station/sender/telemetry_record.py
+TELEMETRY_MAGIC = b"NT"
+TELEMETRY_VERSION = 1
+TELEMETRY_HEADER_FORMAT = '!2sBBHI'
+TELEMETRY_HEADER_LENGTH = struct.calcsize(TELEMETRY_HEADER_FORMAT)
+TELEMETRY_RECORD_DTYPE = np.dtype([
+    ('time_us', '>u8'),
+    ('azimuth', '>f4'),
+    ('elevation', '>f4'),
+    ('latitude_e7', '>i4'),
+    ('longitude_e7', '>i4'),
+    ('altitude', '>f4'),
+    ('speed', '>f4'),
+    ('flags', 'u1'),
+])
+
+FLAG_IMU = 0x01
+FLAG_GPS = 0x02
+FLAG_GPS_VALID = 0x04
+
+
+@dataclass
+class TelemetryBatchHeader:
+    version: int
+    count: int
+    station_id: int
+    sequence: int
+
+
+def is_binary_telemetry(datagram: bytes) -> bool:
+    return datagram[:len(TELEMETRY_MAGIC)] == TELEMETRY_MAGIC
+
+
+def decode_telemetry(datagram: bytes) -> Tuple[TelemetryBatchHeader, np.ndarray]:
+    """
+    Decode a binary telemetry datagram
+    :param datagram: raw datagram, as sent by the station's UDPTelemetrySender
+    :return: batch header and the records as a structured array of TELEMETRY_RECORD_DTYPE
+    """
+    if len(datagram) < TELEMETRY_HEADER_LENGTH:
+        raise ValueError("Truncated telemetry header")
+    magic, version, count, station_id, sequence = struct.unpack_from(TELEMETRY_HEADER_FORMAT, datagram)
+    if magic != TELEMETRY_MAGIC:
+        raise ValueError("Not a binary telemetry datagram")
+    if version != TELEMETRY_VERSION:
+        raise ValueError(f"Unsupported telemetry format version {version}")
+    if len(datagram) < TELEMETRY_HEADER_LENGTH + count * TELEMETRY_RECORD_DTYPE.itemsize:
+        raise ValueError("Truncated telemetry records")
+    records = np.frombuffer(datagram, dtype=TELEMETRY_RECORD_DTYPE, count=count,
+                            offset=TELEMETRY_HEADER_LENGTH)
+    return TelemetryBatchHeader(version, count, station_id, sequence), records
+
+
+def record_to_telemetry(record: np.void) -> Dict[str, Any]:
+    """Convert one decoded record to the dictionary layout of the JSON telemetry messages."""
+    flags = int(record['flags'])
+    telemetry = {"time": int(record['time_us'])}
+    if flags & FLAG_IMU:
+        telemetry.update({
+            "azimuth": float(record['azimuth']),
+            "elevation": float(record['elevation']),
+        })
+    if flags & FLAG_GPS:
+        telemetry.update({
+            "gps_valid": bool(flags & FLAG_GPS_VALID),
+            "coordinates_lat": int(record['latitude_e7']) / 1e7,
+            "coordinates_lng": int(record['longitude_e7']) / 1e7,
+            "altitude": float(record['altitude']),
+            "speed": float(record['speed']),
+        })
+    return telemetry
+
+
+def sequence_gap(previous: int, current: int) -> int:
+    """
+    Number of batches lost between two sequence numbers, handling wrap around.
+    Reordered, duplicated batches and station restarts count as no loss.
+    """
+    gap = (current - previous - 1) & 0xFFFFFFFF
+    return gap if gap < 0x80000000 else 0
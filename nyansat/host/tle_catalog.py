@@ -0,0 +1,247 @@
+import logging
+import os
+import pickle
+import time
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import aiohttp
+from fuzzywuzzy import process
+from skyfield.api import load, EarthSatellite
+
+from nyansat.host.satdata_client import SatelliteScraper, SOURCE
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), ".nyansat")
+# Celestrak refreshes its element sets a few times a day
+DEFAULT_TTL = 12 * 60 * 60
+CACHE_VERSION = 1
+# Number of trigram candidates handed to the fuzzy matcher
+_FUZZY_CANDIDATES = 32
+
+
+class TleDownloadError(Exception):
+    """The downloaded TLE file holds no TLE records."""
+    pass
+
+
+@dataclass
+class TleRecord:
+    name: str
+    norad_id: int
+    line1: str
+    line2: str
+
+
+def _normalize(name: str) -> str:
+    return " ".join(name.upper().split())
+
+
+def _trigrams(name: str) -> set:
+    padded = f"  {_normalize(name)} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def parse_tle_text(text: str) -> List[TleRecord]:
+    """
+    Parse the text of a TLE file, with or without name lines, into records
+    :param text: contents of a TLE file
+    :return: list of TleRecord, in file order
+    """
+    lines = [line.rstrip() for line in text.splitlines() if line.strip()]
+    records = []
+    i = 0
+    while i + 1 < len(lines):
+        line1, line2 = lines[i], lines[i + 1]
+        if line1.startswith("1 ") and line2.startswith("2 "):
+            norad_id = int(line1[2:7])
+            previous = lines[i - 1] if i > 0 else ""
+            is_name = previous and not previous.startswith(("1 ", "2 "))
+            name = previous.strip() if is_name else str(norad_id)
+            records.append(TleRecord(name, norad_id, line1, line2))
+            i += 2
+        else:
+            i += 1
+    return records
+
+
+class TleCatalog(object):
+    """
+    On-disk catalog of TLE records. The raw TLE text is refreshed from
+    celestrak once its TTL expires, and the parsed records are stored next to
+    it together with name, NORAD ID and trigram indexes, so reloading the
+    catalog does not need the network or a reparse. EarthSatellite objects are
+    only built for the satellites that are actually looked up.
+    """
+
+    def __init__(
+            self,
+            cache_directory: str = DEFAULT_CACHE_DIRECTORY,
+            source: str = SOURCE,
+            ttl: float = DEFAULT_TTL,
+            offline_path: Optional[str] = None,
+    ):
+        """
+        :param cache_directory: directory holding the cached TLE text and index
+        :param source: URL of the TLE file to download
+        :param ttl: seconds after which the cached TLE file is refreshed
+        :param offline_path: local TLE file to use instead of the network
+        """
+        self.cache_directory = cache_directory
+        self.source = source
+        self.ttl = ttl
+        self.offline_path = offline_path
+        self.fetched_at = None
+        self._records: List[TleRecord] = []
+        self._by_name: Dict[str, int] = {}
+        self._by_norad_id: Dict[int, int] = {}
+        self._trigrams: Dict[str, List[int]] = {}
+        self._satellites: Dict[int, EarthSatellite] = {}
+        self._timescale = load.timescale(builtin=True)
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.cache_directory, "tle_index.pickle")
+
+    @property
+    def _text_path(self) -> str:
+        return os.path.join(self.cache_directory, "tle.txt")
+
+    def __len__(self):
+        return len(self._records)
+
+    def is_stale(self) -> bool:
+        return self.fetched_at is None or time.time() - self.fetched_at > self.ttl
+
+    async def load(self) -> 'TleCatalog':
+        """
+        Make the catalog ready for lookups: use the offline file if one was
+        given, otherwise the cached index if it is still fresh, otherwise
+        download a new TLE file. A stale cache is still used when the
+        download fails.
+        """
+        if self.offline_path is not None:
+            if not self._records:
+                with open(self.offline_path, "r") as f:
+                    self._build(parse_tle_text(f.read()), os.path.getmtime(self.offline_path))
+            return self
+        if not self._records and not self._load_index():
+            self.fetched_at = None
+        if not self.is_stale():
+            return self
+        try:
+            scraper = SatelliteScraper()
+            await scraper.get_tle_file(self.source)
+            records = parse_tle_text(scraper.file_text)
+            if not records:
+                # An error or rate limiting page, not an empty catalog
+                raise TleDownloadError(f"No TLE records in the file downloaded from {self.source}")
+        except (aiohttp.ClientError, OSError, TleDownloadError) as e:
+            if not self._records:
+                raise
+            LOG.warning(f"Unable to refresh the TLE catalog, using cached data: {e}")
+            return self
+        self._build(records, time.time())
+        self._save(scraper.file_text)
+        return self
+
+    def _build(self, records: List[TleRecord], fetched_at: float):
+        self._records = records
+        self.fetched_at = fetched_at
+        self._satellites = {}
+        self._by_name = {}
+        self._by_norad_id = {}
+        trigrams = {}
+        for idx, record in enumerate(records):
+            self._by_name.setdefault(_normalize(record.name), idx)
+            self._by_norad_id.setdefault(record.norad_id, idx)
+            for trigram in _trigrams(record.name):
+                trigrams.setdefault(trigram, []).append(idx)
+        self._trigrams = trigrams
+
+    def _load_index(self) -> bool:
+        try:
+            with open(self._index_path, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if index.get("version") != CACHE_VERSION or index.get("source") != self.source:
+            return False
+        self._records = [TleRecord(*fields) for fields in index["records"]]
+        self._by_name = index["by_name"]
+        self._by_norad_id = index["by_norad_id"]
+        self._trigrams = index["trigrams"]
+        self._satellites = {}
+        self.fetched_at = index["fetched_at"]
+        return True
+
+    def _save(self, text: str):
+        index = {
+            "version": CACHE_VERSION,
+            "source": self.source,
+            "fetched_at": self.fetched_at,
+            "records": [(r.name, r.norad_id, r.line1, r.line2) for r in self._records],
+            "by_name": self._by_name,
+            "by_norad_id": self._by_norad_id,
+            "trigrams": self._trigrams,
+        }
+        try:
+            os.makedirs(self.cache_directory, exist_ok=True)
+            self._atomic_write(self._text_path, text.encode("utf-8"))
+            self._atomic_write(self._index_path, pickle.dumps(index, pickle.HIGHEST_PROTOCOL))
+        except OSError as e:
+            LOG.warning(f"Unable to write the TLE cache: {e}")
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def names(self) -> Iterable[str]:
+        return (record.name for record in self._records)
+
+    def _fuzzy_index(self, query: str) -> Optional[int]:
+        hits = Counter()
+        for trigram in _trigrams(query):
+            hits.update(self._trigrams.get(trigram, ()))
+        if hits:
+            candidates = [idx for idx, _ in hits.most_common(_FUZZY_CANDIDATES)]
+        else:
+            candidates = range(len(self._records))
+        choices = {idx: self._records[idx].name for idx in candidates}
+        match = process.extractOne(query, choices)
+        if match is None:
+            return None
+        _, _, idx = match
+        return idx
+
+    def find(self, query: str) -> TleRecord:
+        """
+        Find a record by NORAD ID, exact name, or closest fuzzy name match
+        :param query: NORAD catalog number or (approximate) satellite name
+        :return: matching TleRecord
+        """
+        if not self._records:
+            raise LookupError("The TLE catalog is empty, load it first")
+        query = query.strip()
+        if query.isdigit() and int(query) in self._by_norad_id:
+            return self._records[self._by_norad_id[int(query)]]
+        idx = self._by_name.get(_normalize(query))
+        if idx is None:
+            idx = self._fuzzy_index(query)
+        if idx is None:
+            raise LookupError(f"No satellite matches '{query}'")
+        return self._records[idx]
+
+    def get_satellite(self, query: str) -> EarthSatellite:
+        """Return the EarthSatellite for a query, see find"""
+        record = self.find(query)
+        if record.norad_id not in self._satellites:
+            self._satellites[record.norad_id] = EarthSatellite(
+                record.line1, record.line2, record.name, self._timescale)
+        return self._satellites[record.norad_id]
@@ -0,0 +1,51 @@
+import struct
+
+import numpy as np
+
+from typing import Sequence
+
+# MicroPython boards count time from 2000-01-01 instead of the Unix epoch
+MICROPYTHON_EPOCH_OFFSET = 946684800
+
+# Must match nyansat/station/trajectory/trajectory.py
+TRAJECTORY_HEADER_FORMAT = '!IIH'
+TRAJECTORY_POINT_DTYPE = np.dtype([
+    ('offset_ms', '>u4'),
+    ('azimuth', '>u2'),
+    ('elevation', '>i2'),
+])
+MAX_TRAJECTORY_POINTS = 0xFFFF
+
+
+def encode_trajectory(
+        times: Sequence[float],
+        azimuths: Sequence[float],
+        elevations: Sequence[float],
+        epoch_offset: int = MICROPYTHON_EPOCH_OFFSET,
+) -> bytes:
+    """
+    Pack a trajectory into the compact table format played back on the station
+    :param times: Unix times GMT (timestamps) of each point, increasing
+    :param azimuths: azimuth of each point in degrees
+    :param elevations: elevation of each point in degrees
+    :param epoch_offset: seconds between the Unix epoch and the board epoch
+    :return: packed trajectory table
+    """
+    times = np.asarray(times, dtype=np.float64)
+    if len(times) == 0:
+        raise ValueError("A trajectory needs at least one point")
+    if len(times) > MAX_TRAJECTORY_POINTS:
+        raise ValueError(f"A trajectory holds at most {MAX_TRAJECTORY_POINTS} points")
+    if np.any(np.diff(times) <= 0):
+        raise ValueError("Trajectory times must be strictly increasing")
+
+    start = times[0] - epoch_offset
+    start_seconds = int(start)
+    start_micros = int(round((start - start_seconds) * 1e6))
+    header = struct.pack(TRAJECTORY_HEADER_FORMAT, start_seconds, start_micros, len(times))
+
+    points = np.empty(len(times), dtype=TRAJECTORY_POINT_DTYPE)
+    points['offset_ms'] = np.round((times - times[0]) * 1000)
+    points['azimuth'] = np.round(np.mod(azimuths, 360) * 100) % 36000
+    points['elevation'] = np.round(np.clip(elevations, -90, 90) * 100)
+    return header + points.tobytes()
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Optional, cast
+
+from rbs_tui_dom.dom import DOMWindow
+from rbs_tui_dom.dom.text import DOMText
+
+from nyansat.host.client import NyanSatTelemetryClient, StationState
+from nyansat.host.view.render_scheduler import RenderScheduler, RenderValue
+
+FLEET_REFRESH_INTERVAL = 0.5
+FLEET_HEADER = f"{'':2}{'Station':<24}{'Azimuth':>10}{'Elevation':>10}{'Rate':>9}{'Age':>8}{'Lost':>7}"
+
+
+def _format_angle(value: Optional[float]) -> str:
+    return "N/A" if value is None else f"{value:.2f}º"
+
+
+class FleetView:
+    """
+    One line per station heard on the multicast group. Stations report at
+    their own rate, so the table is refreshed on a timer rather than on every
+    datagram; each refresh costs one line per station.
+    """
+
+    def __init__(
+            self,
+            window: DOMWindow,
+            client: NyanSatTelemetryClient,
+            scheduler: RenderScheduler,
+            refresh_interval: float = FLEET_REFRESH_INTERVAL,
+    ):
+        self._dom_window = window
+        self._client = client
+        self._scheduler = scheduler
+        self._refresh_interval = refresh_interval
+        scheduler.register("fleet_value", cast(DOMText, window.get_element_by_id("fleet_value")), self._format)
+        self._task = asyncio.get_event_loop().create_task(self._refresh())
+
+    def _format_station(self, station: StationState, now: float) -> str:
+        telemetry = station.telemetry
+        selected = "*" if station.key == self._client.selected_station else ""
+        if station.is_online(now, self._client.offline_timeout):
+            age = f"{station.age(now):.1f}s"
+        else:
+            age = "offline"
+        return (
+            f"{selected:2}{station.name:<24}"
+            f"{_format_angle(telemetry.get('azimuth')):>10}"
+            f"{_format_angle(telemetry.get('elevation')):>10}"
+            f"{station.record_rate:>7.1f}/s"
+            f"{age:>8}"
+            f"{station.lost_batches:>7}"
+        )
+
+    def _format(self) -> RenderValue:
+        now = asyncio.get_event_loop().time()
+        stations = self._client.station_list()
+        if not stations:
+            return [FLEET_HEADER, "No station"]
+        return [FLEET_HEADER] + [self._format_station(station, now) for station in stations]
+
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            self._scheduler.mark_dirty("fleet_value")
@@ -0,0 +1,69 @@
+import asyncio
+from asyncio import AbstractEventLoop
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Union
+
+from rbs_tui_dom.dom.text import DOMText
+
+DEFAULT_MAX_FPS = 10.
+
+RenderValue = Union[str, List[str]]
+
+
+@dataclass
+class RenderField:
+    element: DOMText
+    formatter: Callable[[], RenderValue]
+    rendered: Optional[RenderValue] = None
+
+
+class RenderScheduler:
+    """
+    Coalesce DOM text updates. Views register each text element with a
+    formatter and mark it dirty when its data changes; dirty fields are
+    formatted and rendered together in one frame, at most max_fps times per
+    second, and an element is only updated when its formatted value changed.
+    """
+
+    def __init__(self, event_loop: AbstractEventLoop, max_fps: float = DEFAULT_MAX_FPS):
+        self._event_loop = event_loop
+        self._frame_interval = 1. / max_fps
+        self._fields: Dict[str, RenderField] = {}
+        # Insertion ordered, so fields render in the order they were marked
+        self._dirty: Dict[str, None] = {}
+        self._frame: Optional[asyncio.Handle] = None
+        self._last_frame = float('-inf')
+        self.frames = 0
+
+    def register(self, name: str, element: DOMText, formatter: Callable[[], RenderValue]):
+        self._fields[name] = RenderField(element, formatter)
+        self.mark_dirty(name)
+
+    def mark_dirty(self, name: str):
+        self._dirty[name] = None
+        if self._frame is None:
+            due = max(self._event_loop.time(), self._last_frame + self._frame_interval)
+            self._frame = self._event_loop.call_at(due, self.flush)
+
+    def observer(self, *names: str) -> Callable[..., None]:
+        """Return an observable callback marking the given fields dirty."""
+        def on_change(*args):
+            for name in names:
+                self.mark_dirty(name)
+        return on_change
+
+    def flush(self):
+        """Render the dirty fields now."""
+        if self._frame is not None:
+            self._frame.cancel()
+            self._frame = None
+        self._last_frame = self._event_loop.time()
+        dirty, self._dirty = self._dirty, {}
+        for name in dirty:
+            field = self._fields[name]
+            value = field.formatter()
+            if value == field.rendered:
+                continue
+            field.rendered = value
+            field.element.set_value(value)
+        self.frames += 1
@@ -1,4 +1,4 @@
-from typing import cast
+from typing import Optional, cast
 
 
 from rbs_tui_dom.dom import DOMWindow
@@ -6,139 +6,80 @@ from rbs_tui_dom.dom.text import DOMText
 from rbs_tui_dom.entity import EntityEventType
 
 from nyansat.host.client import NyanSatTelemetryClient
+from nyansat.host.view.render_scheduler import RenderScheduler
 
 
 class TelemetryView:
     def __init__(
             self,
             window: DOMWindow,
-            client: NyanSatTelemetryClient
+            client: NyanSatTelemetryClient,
+            scheduler: RenderScheduler,
     ):
         self._dom_window = window
-        self._dom_ip = cast(DOMText, window.get_element_by_id("ip_value"))
-        self._dom_port = cast(DOMText, window.get_element_by_id("port_value"))
-        self._dom_altitude = cast(DOMText, window.get_element_by_id("gps_altitude_value"))
-        self._dom_azimuth = cast(DOMText, window.get_element_by_id("antenna_azimuth"))
-        self._dom_coordinates = cast(DOMText, window.get_element_by_id("gps_coordinates_value"))
-        self._dom_elevation = cast(DOMText, window.get_element_by_id("antenna_elevation"))
-        self._dom_speed = cast(DOMText, window.get_element_by_id("gps_speed_value"))
-
         self._client = client
-        self._client.telemetry_entity.ip_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_ip,
-        )
-        self._client.telemetry_entity.port_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_port,
-        )
-        self._client.telemetry_entity.altitude_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_altitude,
-        )
-        self._client.telemetry_entity.azimuth_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_azimuth,
-        )
-        self._client.telemetry_entity.coordinates_lat_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_coordinates,
-        )
-        self._client.telemetry_entity.coordinates_lng_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_coordinates,
+        self._scheduler = scheduler
+        fields = (
+            ("ip_value", self._format_ip),
+            ("port_value", self._format_port),
+            ("gps_altitude_value", self._format_altitude),
+            ("antenna_azimuth", self._format_azimuth),
+            ("gps_coordinates_value", self._format_coordinates),
+            ("antenna_elevation", self._format_elevation),
+            ("gps_speed_value", self._format_speed),
         )
-        self._client.telemetry_entity.elevation_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_elevation,
-        )
-        self._client.telemetry_entity.speed_observable.add_observer(
-            EntityEventType.VALUE_CHANGED,
-            self._render_speed,
+        for element_id, formatter in fields:
+            scheduler.register(element_id, cast(DOMText, window.get_element_by_id(element_id)), formatter)
+
+        entity = self._client.telemetry_entity
+        observers = (
+            (entity.ip_observable, "ip_value"),
+            (entity.port_observable, "port_value"),
+            (entity.altitude_observable, "gps_altitude_value"),
+            (entity.azimuth_observable, "antenna_azimuth"),
+            (entity.coordinates_lat_observable, "gps_coordinates_value"),
+            (entity.coordinates_lng_observable, "gps_coordinates_value"),
+            (entity.elevation_observable, "antenna_elevation"),
+            (entity.speed_observable, "gps_speed_value"),
         )
-        self._render_ip()
-        self._render_port()
-        self._render_altitude()
-        self._render_azimuth()
-        self._render_coordinates()
-        self._render_elevation()
-        self._render_speed()
+        for observable, element_id in observers:
+            observable.add_observer(EntityEventType.VALUE_CHANGED, scheduler.observer(element_id))
 
     def _is_loaded(self):
         return self._client.telemetry_entity.is_loaded
 
-    def _render_ip(self, *args):
-        if not self._is_loaded():
-            value = "N/A"
-        else:
-            value = self._client.telemetry_entity.model.ip.value
-            if value is None:
-                value = "N/A"
-        self._dom_ip.set_value(value)
-
-    def _render_port(self, *args):
-        if not self._is_loaded():
-            value = "N/A"
-        else:
-            value = self._client.telemetry_entity.model.port.value
-            if value is None:
-                value = "N/A"
-            else:
-                value = str(value)
-        self._dom_port.set_value(value)
-
-    def _render_altitude(self, *args):
-        if not self._is_loaded():
-            value = "N/A"
-        else:
-            altitude = self._client.telemetry_entity.model.altitude.value
-            if altitude is None:
-                value = "N/A"
-            else:
-                value = f"{altitude:.2f}m"
-        self._dom_altitude.set_value(value)
-
-    def _render_azimuth(self, *args):
+    def _value(self, name: str):
         if not self._is_loaded():
-            value = "N/A"
-        else:
-            azimuth = self._client.telemetry_entity.model.azimuth.value
-            if azimuth is None:
-                value = "N/A"
-            else:
-                value = f"{azimuth:.2f}º"
-        self._dom_azimuth.set_value(value)
-
-    def _render_coordinates(self, *args):
-        if not self._is_loaded():
-            value = "N/A"
-        else:
-            lat = self._client.telemetry_entity.model.coordinates_lat.value
-            lng = self._client.telemetry_entity.model.coordinates_lng.value
-            if lat is None or lng is None:
-                value = "N/A"
-            else:
-                value = f"{lat:3.2f}, {lng:3.2f}"
-        self._dom_coordinates.set_value(value)
-
-    def _render_elevation(self, *args):
-        if not self._is_loaded():
-            value = "N/A"
-        else:
-            elevation = self._client.telemetry_entity.model.elevation.value
-            if elevation is None:
-                value = "N/A"
-            else:
-                value = f"{elevation:.2f}º"
-        self._dom_elevation.set_value(value)
-
-    def _render_speed(self, *args):
-        if not self._is_loaded():
-            value = "N/A"
-        else:
-            speed = self._client.telemetry_entity.model.speed.value
-            if speed is None:
-                value = "N/A"
-            else:
-                value = f"{speed:.2f}m/s"
-        self._dom_speed.set_value(value)
+            return None
+        return getattr(self._client.telemetry_entity.model, name).value
+
+    @staticmethod
+    def _format(value, unit: str = "", format_spec: str = ".2f") -> str:
+        if value is None:
+            return "N/A"
+        return f"{value:{format_spec}}{unit}"
+
+    def _format_ip(self) -> str:
+        return self._format(self._value("ip"), format_spec="")
+
+    def _format_port(self) -> str:
+        return self._format(self._value("port"), format_spec="")
+
+    def _format_altitude(self) -> str:
+        return self._format(self._value("altitude"), "m")
+
+    def _format_azimuth(self) -> str:
+        return self._format(self._value("azimuth"), "º")
+
+    def _format_coordinates(self) -> str:
+        lat: Optional[float] = self._value("coordinates_lat")
+        lng: Optional[float] = self._value("coordinates_lng")
+        if lat is None or lng is None:
+            return "N/A"
+        return f"{lat:3.2f}, {lng:3.2f}"
+
+    def _format_elevation(self) -> str:
+        return self._format(self._value("elevation"), "º")
+
+    def _format_speed(self) -> str:
+        return self._format(self._value("speed"), "m/s")
@@ -6,6 +6,7 @@ from config.config import ConfigRepository
 from gps.gps_basic import BasicGPSController
 from gps.mock_gps_controller import MockGPSController
 from imu.imu import ImuController
+from imu.imu_sampler import ImuSampler
 
 from imu.mock_imu import MockImuController
 from motor.mock_motor import MockMotorController
@@ -15,6 +16,13 @@ from screen.screen import ScreenController
 from antenny_threading import Queue
 from sender.sender_udp import UDPTelemetrySender
 from sender.mock_sender import MockTelemetrySender
+from trajectory.player import TrajectoryPlayer
+from trajectory.trajectory import TrajectoryTable
+
+try:
+    import ubinascii as binascii
+except ImportError:
+    import binascii
 
 _DEFAULT_MOTOR_POSITION = 90.
 _DEFAULT_MOTION_DELAY = 0.75
@@ -42,9 +50,12 @@ class AxisController:
         self._current_motor_position = self.motor.get_position(self.motor_idx)
         return self._current_motor_position
 
-    def set_motor_position(self, desired_heading: float):
+    def set_motor_position(self, desired_heading: float, smooth: bool = True):
         self._current_motor_position = desired_heading
-        self.motor.smooth_move(self.motor_idx, desired_heading, 50)
+        if smooth:
+            self.motor.smooth_move(self.motor_idx, desired_heading, 50)
+        else:
+            self.motor.set_position(self.motor_idx, degrees=desired_heading)
 
     def get_duty(self):
         return self.motor.duty(self.motor_idx)
@@ -79,6 +90,9 @@ class AntennaController:
     def stop_motion(self):
         self._motion_started = False
 
+    def is_motion_started(self) -> bool:
+        return self._motion_started
+
     def set_azimuth(self, desired_heading: float):
         if not self._motion_started:
             raise RuntimeError("Please start motion before moving the antenna")
@@ -143,6 +157,7 @@ class AntennyAPI:
             screen,  # type: Optional[ScreenController]
             telemetry,  # type: Optional[TelemetrySender]
             safe_mode: bool,
+            gps=None,  # type: Optional[GPSController]
     ):
         self.antenna = antenna
         self.imu = imu
@@ -150,18 +165,43 @@ class AntennyAPI:
         self._screen = screen
         self._telemetry = telemetry
         self.safe_mode = safe_mode
+        self.gps = gps
+        self._trajectory_player = None
+        self._rpc_server = None
+        self._pointing = None
 
     def start(self):
+        if self.gps is not None:
+            self.gps.start()
         if self._screen is not None:
             self._screen.start()
         if self._telemetry is not None:
             self._telemetry.start()
 
+    def attach(self, runtime):
+        """
+        Run the GPS, screen and telemetry as tasks of a runtime.Runtime, in place
+        of start()
+        """
+        if self._screen is not None:
+            self._screen.attach(runtime)
+        if self._telemetry is not None:
+            self._telemetry.attach(runtime)
+        if self.gps is not None:
+            self.gps.attach(runtime)
+
     def stop(self):
         if self._screen is not None:
             self._screen.stop()
         if self._telemetry is not None:
             self._telemetry.stop()
+        if self.gps is not None:
+            self.gps.stop()
+        self.stop_trajectory()
+        self.stop_pointing()
+        self.stop_rpc_server()
+        if isinstance(self.imu, ImuSampler):
+            self.imu.stop()
 
     def is_safemode(self):
         return self.safe_mode
@@ -195,6 +235,110 @@ class AntennyAPI:
             raise ValueError("Please enable the 'use_telemetry' option in the config")
         self._telemetry.update(data)
 
+    def play_trajectory(self, encoded_table: str):
+        """
+        Start following a precomputed trajectory table, replacing any trajectory already playing.
+        :param encoded_table: base64 encoded TrajectoryTable
+        """
+        if not self.antenna.is_motion_started():
+            raise RuntimeError("Please start motion before playing a trajectory")
+        table = TrajectoryTable(binascii.a2b_base64(encoded_table))
+        self.stop_trajectory()
+        self.stop_pointing()
+        LOG.info("Loaded a trajectory of {} points".format(table.count))
+        self._trajectory_player = TrajectoryPlayer(self.antenna, table)
+        self._trajectory_player.start()
+
+    def queue_trajectory(self, table: TrajectoryTable):
+        """
+        Play a trajectory table after the one playing, or right away when no
+        trajectory is playing. Used to stream a trajectory in parts.
+        """
+        if not self.antenna.is_motion_started():
+            raise RuntimeError("Please start motion before playing a trajectory")
+        if self.is_playing_trajectory() and self._trajectory_player.append(table):
+            return
+        self.stop_trajectory()
+        self.stop_pointing()
+        self._trajectory_player = TrajectoryPlayer(self.antenna, table)
+        self._trajectory_player.start()
+
+    def stop_trajectory(self):
+        if self._trajectory_player is not None:
+            self._trajectory_player.stop()
+            self._trajectory_player = None
+
+    def is_playing_trajectory(self) -> bool:
+        return self._trajectory_player is not None and self._trajectory_player.is_playing()
+
+    def point(self, azimuth: float, elevation: float):
+        """
+        Point the antenna using the IMU as feedback, with the PID gains from
+        the config. Replaces any trajectory being played; the loops keep
+        running, holding the target, until stop_pointing is called.
+        """
+        if not self.antenna.is_motion_started():
+            raise RuntimeError("Please start motion before pointing the antenna")
+        if self._pointing is None:
+            self.stop_trajectory()
+            self._pointing = self._pid_pointing_factory()
+            self._pointing.set_target(azimuth, elevation)
+            self._pointing.start()
+        else:
+            self._pointing.set_target(azimuth, elevation)
+
+    def _pid_pointing_factory(self):
+        from pointing.pid_pointing import PidAxis, PidPointingController
+        azimuth = PidAxis(
+            self.antenna.azimuth,
+            self.config.get("azimuth_imu_axis"),
+            self.config.get("azimuth_kp"),
+            self.config.get("azimuth_ki"),
+            self.config.get("azimuth_kd"),
+            wraps=True,
+        )
+        elevation = PidAxis(
+            self.antenna.elevation,
+            self.config.get("elevation_imu_axis"),
+            self.config.get("elevation_kp"),
+            self.config.get("elevation_ki"),
+            self.config.get("elevation_kd"),
+        )
+        return PidPointingController(
+            self.imu,
+            azimuth,
+            elevation,
+            self.config.get("pid_rate"),
+            self.config.get("pid_tolerance"),
+        )
+
+    def stop_pointing(self):
+        if self._pointing is not None:
+            self._pointing.stop()
+            self._pointing = None
+
+    def pointing_status(self):
+        """Closed-loop pointing report (see PidPointingController.status), None when not pointing."""
+        if self._pointing is None:
+            return None
+        return self._pointing.status()
+
+    def start_rpc_server(self, port: int):
+        """
+        Serve RPC requests over TCP, so hosts on the network can call the API
+        without going through the REPL. Clients authenticate with the
+        'rpc_secret' config value, the server does not start without one.
+        """
+        from rpc.server import RpcDispatcher, RpcTcpServer
+        self.stop_rpc_server()
+        self._rpc_server = RpcTcpServer(RpcDispatcher(self), self.config.get("rpc_secret"), port)
+        self._rpc_server.start()
+
+    def stop_rpc_server(self):
+        if self._rpc_server is not None:
+            self._rpc_server.stop()
+            self._rpc_server = None
+
     def pwm_calibration(self, error=0.1):
         """
         Calibrates Azimuth and Elevation to within specified error
@@ -274,9 +418,11 @@ class AntennyAPI:
 def mock_antenna_api_factory(
         use_screen: bool = False,
         use_telemetry: bool = False,
+        start: bool = True,
 ):
     """
     Create a new MOCK AntennyAPI object. Useful for local debugging in a desktop python environment.
+    :param start: start the service threads, leave False to attach the API to a runtime.Runtime
     """
     config = ConfigRepository()
     imu = MockImuController()
@@ -313,13 +459,15 @@ def mock_antenna_api_factory(
         telemetry_sender,
         True,
     )
-    api.start()
+    if start:
+        api.start()
     return api
 
 
-def esp32_antenna_api_factory():
+def esp32_antenna_api_factory(start: bool = True):
     """
     Create a new AntennyAPI object.
+    :param start: start the service threads, leave False to attach the API to a runtime.Runtime
     """
     import machine
     from machine import Pin
@@ -358,6 +506,9 @@ def esp32_antenna_api_factory():
                 address=config.get("i2c_bno_address"),
                 sign=(0, 0, 0)
             )
+            # Every reader is served from samples taken in the background
+            imu = ImuSampler(imu, config.get("imu_sample_rate"))
+            imu.start()
         except OSError:
             LOG.warning("Unable to initialize IMU, check configuration")
             imu = MockImuController()
@@ -397,6 +548,16 @@ def esp32_antenna_api_factory():
         LOG.warning("Unable to retrieve servo indices, using default values. Your motor movement may be incorrect")
         azimuth_index = 1
         elevation_index = 0
+    motor.set_motion_limits(
+        azimuth_index,
+        config.get("azimuth_max_rate"),
+        config.get("azimuth_max_acceleration"),
+    )
+    motor.set_motion_limits(
+        elevation_index,
+        config.get("elevation_max_rate"),
+        config.get("elevation_max_acceleration"),
+    )
 
     antenna_controller = AntennaController(
         AxisController(
@@ -435,7 +596,14 @@ def esp32_antenna_api_factory():
         if not config.get("use_gps"):
             LOG.warning("Telemetry enabled, but GPS disabled in config! Please enable the GPS ("
                         "using the GPS mock)")
-        telemetry_sender = UDPTelemetrySender(31337, gps, imu)
+        telemetry_sender = UDPTelemetrySender(
+            31337,
+            gps,
+            imu,
+            interval=1 / config.get("telemetry_rate"),
+            binary=config.get("telemetry_binary"),
+            station_id=config.get("station_id"),
+        )
     else:
         LOG.warning(
             "Telemetry disabled, please set use_screen=True in the settings and run `antkontrol`")
@@ -446,10 +614,17 @@ def esp32_antenna_api_factory():
         screen,
         telemetry_sender,
         safe_mode,
+        gps,
     )
     if config.get("enable_demo"):
         interrupt_pin = machine.Pin(15, machine.Pin.IN, machine.Pin.PULL_UP)
         interrupt_pin.irq(trigger=machine.Pin.IRQ_FALLING, handler=api.antenna.pin_motion_test)
 
-    api.start()
+    if start:
+        api.start()
+    if config.get("use_rpc"):
+        try:
+            api.start_rpc_server(config.get("rpc_port"))
+        except (OSError, ValueError) as e:
+            LOG.warning("Unable to start the RPC server: {}".format(e))
     return api
@@ -2,6 +2,8 @@ import logging
 import time
 
 _DEFAULT_DELAY = 0.01
+# Polling period of timed lock acquisitions, MicroPython locks take no timeout
+_LOCK_POLL_DELAY = 0.001
 LOG = logging.getLogger('antenny.common')
 
 _in_micro_python = 'machine' in globals()
@@ -47,16 +49,52 @@ class MPEmpty(Exception):
     pass
 
 
+class MPFull(Exception):
+    """
+    Replacement for queue.Full
+    """
+    pass
+
+
 try:
     from threading import Thread
-    from queue import Queue, Empty
-
-    Empty = Empty
-except:
-    Empty = MPEmpty
+except ImportError:
     Thread = MPThread
 
 
+def _ticks():
+    try:
+        return time.ticks_ms()
+    except AttributeError:
+        return int(time.monotonic() * 1000)
+
+
+def _ticks_diff(end, start):
+    try:
+        return time.ticks_diff(end, start)
+    except AttributeError:
+        return end - start
+
+
+def _acquire(lock, timeout=None) -> bool:
+    """
+    Acquire lock, waiting at most timeout seconds, forever if None. MicroPython
+    locks only support blocking or non blocking acquisition, so timed waits
+    poll the lock and return as soon as it is free.
+    """
+    if timeout is None:
+        return lock.acquire()
+    if lock.acquire(0):
+        return True
+    timeout_ms = int(timeout * 1000)
+    start = _ticks()
+    while _ticks_diff(_ticks(), start) < timeout_ms:
+        time.sleep(_LOCK_POLL_DELAY)
+        if lock.acquire(0):
+            return True
+    return False
+
+
 class VanillaThread(Thread):
 
     def __init__(
@@ -80,44 +118,81 @@ class VanillaThread(Thread):
 
 
 class MPQueue(object):
+    """
+    FIFO queue for MicroPython, with the queue.Queue interface. Items are kept
+    in a ring buffer, bounded by maxsize when it is greater than 0.
 
-    def __init__(self):
-        self._lock = _thread.allocate_lock()
-        self._queue = []
+    Blocked getters wait on _not_empty, which is held locked while the queue
+    is empty and released by put() when the first item arrives; a getter
+    leaving items behind releases it for the next one. _not_full works the
+    same way for putters of a bounded queue.
+    """
 
-    def get(
-            self,
-            timeout=None,
-    ):
-        if timeout is None:
-            while True:
-                try:
-                    with self._lock:
-                        return self._queue.pop()
-                except IndexError:
-                    pass
-        delay = 0
-        item = None
-        while delay < timeout:
-            try:
-                with self._lock:
-                    item = self._queue.pop()
-            except IndexError:
-                pass
-            time.sleep(_DEFAULT_DELAY)
-            delay += _DEFAULT_DELAY
-        if item is None:
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._mutex = _thread.allocate_lock()
+        self._not_empty = _thread.allocate_lock()
+        self._not_empty.acquire()
+        self._not_full = _thread.allocate_lock()
+        self._buffer = [None] * (maxsize if maxsize > 0 else 8)
+        self._head = 0
+        self._count = 0
+
+    def qsize(self):
+        return self._count
+
+    def empty(self):
+        return self._count == 0
+
+    def full(self):
+        return 0 < self.maxsize <= self._count
+
+    def _grow(self):
+        buffer = self._buffer
+        size = len(buffer)
+        self._buffer = [buffer[(self._head + i) % size] for i in range(size)] + [None] * size
+        self._head = 0
+
+    def put(self, item, block=True, timeout=None):
+        if self.maxsize > 0 and not _acquire(self._not_full, timeout if block else 0):
+            raise Full
+        with self._mutex:
+            if self._count == len(self._buffer):
+                self._grow()
+            self._buffer[(self._head + self._count) % len(self._buffer)] = item
+            self._count += 1
+            if self._count == 1:
+                self._not_empty.release()
+            if self.maxsize > 0 and self._count < self.maxsize:
+                self._not_full.release()
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def get(self, block=True, timeout=None):
+        if not _acquire(self._not_empty, timeout if block else 0):
             raise Empty
+        with self._mutex:
+            item = self._buffer[self._head]
+            self._buffer[self._head] = None
+            self._head = (self._head + 1) % len(self._buffer)
+            self._count -= 1
+            if self._count > 0:
+                self._not_empty.release()
+            if self.maxsize > 0 and self._count == self.maxsize - 1:
+                self._not_full.release()
         return item
 
-    def put(self, item):
-        with self._lock:
-            self._queue.append(item)
-
+    def get_nowait(self):
+        return self.get(False)
 
-try:
-    import threading
 
+if Thread is not MPThread:
     Thread = VanillaThread
+
+try:
+    from queue import Queue, Empty, Full
 except ImportError:
     Queue = MPQueue
+    Empty = MPEmpty
+    Full = MPFull
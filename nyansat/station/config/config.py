@@ -9,6 +9,91 @@ try:
 except ImportError:
     pass
 import os
+import struct
+
+# Binary config files start with this magic, JSON files with "{"
+_BINARY_MAGIC = b"ANTC\x01"
+_TYPE_NONE = b"n"
+_TYPE_BOOL = b"b"
+_TYPE_INT = b"i"
+_TYPE_FLOAT = b"f"
+_TYPE_STR = b"s"
+_TYPE_JSON = b"j"
+# Raised when decoding a truncated or corrupted config file; MicroPython's
+# struct has no error class and raises ValueError
+_DECODE_ERRORS = (ValueError, IndexError, getattr(struct, "error", ValueError))
+
+
+def _encode_binary(config: dict) -> bytes:
+    """Encode a config as the magic followed by (key, type, value) records."""
+    chunks = [_BINARY_MAGIC]
+    for key, value in config.items():
+        key = key.encode()
+        chunks.append(struct.pack("!B", len(key)))
+        chunks.append(key)
+        if value is None:
+            chunks.append(_TYPE_NONE)
+        elif isinstance(value, bool):
+            chunks.append(_TYPE_BOOL + struct.pack("!B", value))
+        elif isinstance(value, int) and -0x80000000 <= value <= 0x7fffffff:
+            chunks.append(_TYPE_INT + struct.pack("!i", value))
+        elif isinstance(value, float):
+            chunks.append(_TYPE_FLOAT + struct.pack("!d", value))
+        else:
+            if isinstance(value, str):
+                kind, encoded = _TYPE_STR, value.encode()
+            else:
+                kind, encoded = _TYPE_JSON, json.dumps(value).encode()
+            chunks.append(kind + struct.pack("!H", len(encoded)))
+            chunks.append(encoded)
+    return b"".join(chunks)
+
+
+def _decode_binary(data: bytes) -> dict:
+    config = {}
+    offset = len(_BINARY_MAGIC)
+    while offset < len(data):
+        key_length = data[offset]
+        key = data[offset + 1:offset + 1 + key_length].decode()
+        offset += 1 + key_length
+        kind = data[offset:offset + 1]
+        offset += 1
+        if kind == _TYPE_NONE:
+            value = None
+        elif kind == _TYPE_BOOL:
+            value = bool(data[offset])
+            offset += 1
+        elif kind == _TYPE_INT:
+            value = struct.unpack_from("!i", data, offset)[0]
+            offset += 4
+        elif kind == _TYPE_FLOAT:
+            value = struct.unpack_from("!d", data, offset)[0]
+            offset += 8
+        elif kind in (_TYPE_STR, _TYPE_JSON):
+            length = struct.unpack_from("!H", data, offset)[0]
+            value = data[offset + 2:offset + 2 + length].decode()
+            if kind == _TYPE_JSON:
+                value = json.loads(value)
+            offset += 2 + length
+        else:
+            raise ValueError("Unknown config value type {}".format(kind))
+        config[key] = value
+    return config
+
+
+class _ConfigBatch(object):
+    """Context of ConfigRepository.batch()."""
+
+    def __init__(self, repository):
+        self._repository = repository
+
+    def __enter__(self):
+        self._repository._begin()
+        return self._repository
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._repository._end(exc_type is None)
+        return False
 
 
 ############
@@ -29,12 +114,39 @@ class ConfigRepository:
         "use_telemetry": False,
         "use_imu": False,
         "use_webrepl": False,
+        "use_rpc": False,
         "enable_demo": True,
+        "rpc_port": 31338,
+        # Shared secret of the RPC server, which does not start without one
+        "rpc_secret": "",
+        # Run the station services as tasks of one event loop, see runtime.py
+        "use_cooperative_runtime": False,
+        # IMU background sampling rate (Hz)
+        "imu_sample_rate": 50,
+        # Telemetry sampling rate (Hz), wire format and station identifier
+        "telemetry_rate": 50,
+        "telemetry_binary": True,
+        "station_id": 0,
         # Elevation/azimuth servo defaults
         "elevation_servo_index": 0,
         "azimuth_servo_index": 1,
+        # Servo slew limits, in degrees/ms and degrees/ms^2
         "elevation_max_rate": 0.1,
         "azimuth_max_rate": 0.1,
+        "elevation_max_acceleration": 0.0005,
+        "azimuth_max_acceleration": 0.0005,
+        # Closed-loop pointing: PID gains, control rate (Hz), on-target
+        # tolerance (degrees) and matching ImuController.euler() index per axis
+        "azimuth_kp": 0.5,
+        "azimuth_ki": 1.0,
+        "azimuth_kd": 0.0,
+        "elevation_kp": 0.5,
+        "elevation_ki": 1.0,
+        "elevation_kd": 0.0,
+        "pid_rate": 20,
+        "pid_tolerance": 0.5,
+        "azimuth_imu_axis": 0,
+        "elevation_imu_axis": 2,
         # Antenny board layout
         "antenny_board_version": 2,
         # Pins
@@ -78,15 +190,100 @@ class ConfigRepository:
         "mag_radius_msb": 0,
     }
 
-    def __init__(self, config_filename: str = "") -> None:
+    def __init__(self, config_filename: str = "", binary: bool = False) -> None:
+        """
+        :param binary: save in the compact binary format instead of JSON, files
+            are loaded in either format
+        """
         self._config = {}
         self._config_filename = config_filename
+        self._binary = binary
+        # Nesting depth of batch(), the values before the outermost one and
+        # whether they changed since
+        self._batch_depth = 0
+        self._batch_backup = None
+        self._dirty = False
         self.reload()
 
     def _save(self) -> None:
-        """Dump in-memory configuration values to a file on the board."""
-        with open(self._config_filename, "w") as f:
-            json.dump(self._config, f)
+        """Dump in-memory configuration values to a file on the board. The
+        values are written to a temporary file renamed over the config file,
+        so a power loss leaves either the old or the new file.
+        """
+        if self._binary:
+            data = _encode_binary(self._config)
+        else:
+            data = json.dumps(self._config).encode()
+        temporary = "%s.tmp" % self._config_filename
+        with open(temporary, "wb") as f:
+            f.write(data)
+        try:
+            os.rename(temporary, self._config_filename)
+        except OSError:
+            if not self._exists(self._config_filename):
+                raise
+            # Filesystems without rename over an existing file
+            os.remove(self._config_filename)
+            os.rename(temporary, self._config_filename)
+        self._dirty = False
+
+    @staticmethod
+    def _exists(filename: str) -> bool:
+        try:
+            os.stat(filename)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _read(filename: str) -> dict:
+        with open(filename, "rb") as f:
+            data = f.read()
+        if data.startswith(_BINARY_MAGIC):
+            return _decode_binary(data)
+        return json.loads(data)
+
+    def _load(self, filename: str) -> dict:
+        """Read a JSON or binary config file, or its temporary file if a save
+        was interrupted between removing the old file and renaming the new one.
+        The temporary file may itself be truncated, it is only used if it
+        decodes completely.
+        """
+        try:
+            return self._read(filename)
+        except OSError:
+            pass
+        try:
+            return self._read("%s.tmp" % filename)
+        except _DECODE_ERRORS:
+            raise OSError("Incomplete config file %s.tmp" % filename)
+
+    def batch(self):
+        """Return a context in which set() only updates the in-memory values,
+        the file is saved once when the outermost batch exits. If the batch
+        exits with an exception its changes are discarded.
+
+            with config.batch():
+                config.set("use_gps", True)
+                config.set("gps_uart_tx", 17)
+        """
+        return _ConfigBatch(self)
+
+    def _begin(self) -> None:
+        if self._batch_depth == 0:
+            self._batch_backup = dict(self._config)
+        self._batch_depth += 1
+
+    def _end(self, commit: bool) -> None:
+        self._batch_depth -= 1
+        if self._batch_depth > 0:
+            return
+        backup, self._batch_backup = self._batch_backup, None
+        if not commit:
+            self._config = backup
+            self._dirty = False
+        elif self._dirty:
+            self._save()
 
     def reload(self) -> None:
         """Reload the in-memory configuration key-value store from the config
@@ -101,15 +298,13 @@ class ConfigRepository:
 
         try:
             if self._config_filename:
-                with open(self._config_filename, "r") as f:
-                    self._config = json.load(f)
+                self._config = self._load(self._config_filename)
             else:
                 loaded = set()
                 while self._config_filename != last_loaded:
                     # Set config filename to the default value
                     self._config_filename = last_loaded
-                    with open(self._config_filename, "r") as f:
-                        self._config = json.load(f)
+                    self._config = self._load(self._config_filename)
                     last_loaded = self._config.get("last_loaded",
                                                    self._config_filename)
                     if (last_loaded in loaded
@@ -127,6 +322,13 @@ class ConfigRepository:
         except OSError:
             self._config = dict(ConfigRepository.DEFAULT_CONFIG)
             self._config["last_loaded"] = self._config_filename
+        except _DECODE_ERRORS:
+            try:
+                logging.error("Corrupted config file %s, using defaults" % self._config_filename)
+            except (NameError, AttributeError):
+                pass
+            self._config = dict(ConfigRepository.DEFAULT_CONFIG)
+            self._config["last_loaded"] = self._config_filename
 
     def new(self, name: str) -> None:
         """Create a new configuration file and ensure each call to "reload" uses
@@ -163,13 +365,22 @@ class ConfigRepository:
         return ConfigRepository.DEFAULT_CONFIG[key]
 
     def set(self, key: str, value) -> None:
-        """Set the value for a key in-memory and save it to the file system."""
+        """Set the value for a key in-memory and save it to the file system,
+        or when the current batch() exits.
+        """
         if self._config is None:
             self.reload()
 
         self._config[key] = value
-        self._save()
-        self.reload()
+        self._dirty = True
+        if self._batch_depth == 0:
+            self._save()
+
+    def set_many(self, values: dict) -> None:
+        """Set several values, saving the file once."""
+        with self.batch():
+            for key, value in values.items():
+                self.set(key, value)
 
     def print_values(self) -> None:
         """Print the value of all user-set and default keys."""
@@ -1,7 +1,20 @@
+import time
+
+try:
+    _ticks_ms = time.ticks_ms
+    _ticks_diff = time.ticks_diff
+except AttributeError:
+    def _ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def _ticks_diff(end, start):
+        return end - start
+
+
 class GPSStatus(object):
-    __slots__ = ['valid', 'latitude', 'longitude', 'altitude', 'speed', 'course', 'timestamp']
+    __slots__ = ['valid', 'latitude', 'longitude', 'altitude', 'speed', 'course', 'timestamp', 'fixed_at']
     def __init__(self, valid: bool, latitude: float, longitude: float, altitude: float, speed: float, course: float,
-                 timestamp: float):
+                 timestamp: float, fixed_at: int = None):
         self.valid = valid
         self.latitude = latitude
         self.longitude = longitude
@@ -9,11 +22,33 @@ class GPSStatus(object):
         self.speed = speed
         self.course = course
         self.timestamp = timestamp
+        # ticks_ms() of the last valid fix, None before the first one
+        self.fixed_at = fixed_at
+
+    def fix_age(self):
+        """Seconds since the last valid fix, None without fix."""
+        if self.fixed_at is None:
+            return None
+        return _ticks_diff(_ticks_ms(), self.fixed_at) / 1000
 
 
 class GPSController(object):
     def run(self):
         raise NotImplementedError()
 
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def step(self):
+        """One update of the run() loop."""
+        pass
+
+    def attach(self, runtime):
+        """Schedule step() on a runtime.Runtime instead of running run()."""
+        pass
+
     def get_status(self):
         raise NotImplementedError
@@ -2,47 +2,64 @@ import machine
 import logging
 import time
 
-from micropyGPS import MicropyGPS
-
+from antenny_threading import Thread
 from config.config import ConfigRepository
 from gps.gps import GPSController, GPSStatus
+from gps.nmea import NmeaParser
+
+# At 9600 baud the receiver sends under 1 kB/s, the UART buffer holds a few
+# updates worth of sentences
+_UPDATE_INTERVAL = 0.25
+_CHUNK_SIZE = 256
+_UART_BUFFER_SIZE = 1024
+
+LOG = logging.getLogger('antenny.gps')
 
 
-class BasicGPSController(GPSController):
-    def __init__(self):
+class BasicGPSController(Thread, GPSController):
+    """
+    Read the GPS UART in chunks into a preallocated buffer and parse the
+    GGA/RMC sentences as they complete. The status returned by get_status()
+    is a single GPSStatus updated in place, see GPSStatus.fix_age() for how
+    current the fix is.
+    """
+
+    def __init__(self, interval: float = _UPDATE_INTERVAL):
+        super(BasicGPSController, self).__init__()
         self._gps_uart = machine.UART(1, 9600)
         self.cfg = ConfigRepository()
         self._gps_uart.init(tx=self.cfg.get("gps_uart_tx"),
-                            rx=self.cfg.get("gps_uart_rx"))
-        self._gps = MicropyGPS()
-        self._model = None
+                            rx=self.cfg.get("gps_uart_rx"),
+                            rxbuf=_UART_BUFFER_SIZE)
+        self._interval = interval
+        self._buffer = bytearray(_CHUNK_SIZE)
+        self._status = GPSStatus(False, 0., 0., 0., 0., 0., 0.)
+        self._parser = NmeaParser(self._status)
 
     def run(self):
-        # TODO: Why do we need to constantly update the GPS values here?
-        while True:
-            try:
-                self._update_gps()
-            except Exception as e:
-                logging.info(e)
+        while self.running:
+            self.step()
+            time.sleep(self._interval)
+
+    def step(self):
+        try:
+            self._update_gps()
+        except Exception as e:
+            LOG.info(e)
 
-            time.sleep(1)
+    def attach(self, runtime):
+        runtime.every(self._interval, self.step)
 
     def get_status(self) -> GPSStatus:
-        return self._model
+        if self._parser.sentences == 0:
+            return None
+        return self._status
 
     def _update_gps(self):
-        g_sentence = self._gps_uart.readline()
-        while g_sentence:
-            g_sentence = g_sentence.decode("ascii")
-            for g_word in g_sentence:
-                self._gps.update(g_word)
-            self._model = GPSStatus(
-                self._gps.valid,
-                self._gps.latitude,
-                self._gps.longitude,
-                self._gps.altitude,
-                self._gps.speed,
-                self._gps.course,
-                self._gps.timestamp,
-            )
-            g_sentence = self._gps_uart.readline()
+        pending = self._gps_uart.any()
+        while pending > 0:
+            count = self._gps_uart.readinto(self._buffer, min(pending, _CHUNK_SIZE))
+            if not count:
+                return
+            self._parser.feed(self._buffer, count)
+            pending = self._gps_uart.any()
@@ -0,0 +1,228 @@
+from gps.gps import GPSStatus, _ticks_ms
+
+# Longest NMEA 0183 sentence is 82 characters, with some slack for bad receivers
+_MAX_SENTENCE = 96
+# Highest field index read by the handlers is 9, in GGA
+_MAX_FIELDS = 16
+_DOLLAR = ord('$')
+_STAR = ord('*')
+_COMMA = ord(',')
+_POINT = ord('.')
+_MINUS = ord('-')
+_ZERO = ord('0')
+_LF = ord('\n')
+_CR = ord('\r')
+_SPACE = ord(' ')
+_A = ord('A')
+_C = ord('C')
+_G = ord('G')
+_M = ord('M')
+_R = ord('R')
+_S = ord('S')
+_W = ord('W')
+_KNOTS_TO_MS = 1852 / 3600
+
+
+def _hex_digit(byte: int) -> int:
+    if _ZERO <= byte <= _ZERO + 9:
+        return byte - _ZERO
+    byte |= 0x20
+    if ord('a') <= byte <= ord('f'):
+        return byte - ord('a') + 10
+    raise ValueError("Invalid checksum digit")
+
+
+def _integer(line, start: int, end: int) -> int:
+    """Parse the unsigned decimal integer in line[start:end]."""
+    if start >= end:
+        raise ValueError("Empty number")
+    value = 0
+    for index in range(start, end):
+        digit = line[index] - _ZERO
+        if digit < 0 or digit > 9:
+            raise ValueError("Invalid number")
+        value = value * 10 + digit
+    return value
+
+
+def _decimal(line, start: int, end: int) -> float:
+    """Parse the decimal number, e.g. -12.345, in line[start:end]."""
+    if start >= end:
+        raise ValueError("Empty number")
+    sign = 1
+    if line[start] == _MINUS:
+        sign = -1
+        start += 1
+    point = end
+    for index in range(start, end):
+        if line[index] == _POINT:
+            point = index
+            break
+    value = _integer(line, start, point) if point > start else 0
+    if point + 1 < end:
+        value += _integer(line, point + 1, end) / 10 ** (end - point - 1)
+    return sign * float(value)
+
+
+class NmeaParser(object):
+    """
+    Incremental NMEA 0183 parser, fed with raw UART chunks. Bytes are copied
+    from the caller's buffer into one preallocated line buffer, and fields
+    are read in place through their comma offsets, so parsing allocates no
+    intermediate bytes objects. Only the GGA (position, altitude) and RMC
+    (validity, speed, course) sentences are decoded; any other sentence is
+    dropped on its type, before checksum. Results are written in place into
+    one GPSStatus.
+    """
+
+    def __init__(self, status: GPSStatus):
+        self.status = status
+        self._line = bytearray(_MAX_SENTENCE)
+        self._length = 0
+        self._overflow = False
+        # Offset of the first byte of each field, the field ends at the next comma
+        self._starts = bytearray(_MAX_FIELDS + 1)
+        self._fields = 0
+        self.sentences = 0
+        self.errors = 0
+
+    def feed(self, buffer, length: int):
+        """Parse length bytes of buffer, completing any partial sentence."""
+        line = self._line
+        for index in range(length):
+            byte = buffer[index]
+            if byte == _LF:
+                if not self._overflow:
+                    self._sentence()
+                self._length = 0
+                self._overflow = False
+            elif self._overflow:
+                continue
+            elif self._length == _MAX_SENTENCE:
+                # Garbage or a lost line feed, drop up to the next one
+                self._overflow = True
+            else:
+                line[self._length] = byte
+                self._length += 1
+
+    def _sentence(self):
+        line = self._line
+        length = self._length
+        while length > 0 and (line[length - 1] == _CR or line[length - 1] == _SPACE):
+            length -= 1
+        if length < 7 or line[0] != _DOLLAR:
+            return
+        if line[3] == _G and line[4] == _G and line[5] == _A:
+            handler = self._gga
+        elif line[3] == _R and line[4] == _M and line[5] == _C:
+            handler = self._rmc
+        else:
+            return
+        star = self._split(line, length)
+        if star < 0 or not self._checksum_ok(line, length, star):
+            self.errors += 1
+            return
+        try:
+            handler()
+        except (IndexError, ValueError):
+            self.errors += 1
+            return
+        self.sentences += 1
+
+    def _split(self, line, length: int) -> int:
+        """Record the field offsets, return the offset of the checksum '*' or -1."""
+        starts = self._starts
+        starts[0] = 1
+        fields = 1
+        for index in range(1, length):
+            byte = line[index]
+            if byte == _STAR:
+                self._fields = fields
+                starts[fields] = index + 1
+                return index
+            if byte == _COMMA and fields < _MAX_FIELDS:
+                starts[fields] = index + 1
+                fields += 1
+        return -1
+
+    @staticmethod
+    def _checksum_ok(line, length: int, star: int) -> bool:
+        if star + 3 > length:
+            return False
+        checksum = 0
+        for index in range(1, star):
+            checksum ^= line[index]
+        try:
+            return checksum == _hex_digit(line[star + 1]) * 16 + _hex_digit(line[star + 2])
+        except ValueError:
+            return False
+
+    def _field(self, index: int):
+        """(start, end) offsets of a field, end excluded."""
+        if index >= self._fields:
+            raise IndexError("Missing field")
+        return self._starts[index], self._starts[index + 1] - 1
+
+    def _empty(self, index: int) -> bool:
+        start, end = self._field(index)
+        return start == end
+
+    def _is(self, index: int, byte: int) -> bool:
+        start, end = self._field(index)
+        return end - start == 1 and self._line[start] == byte
+
+    def _coordinate(self, value: int, hemisphere: int, degree_digits: int) -> float:
+        """Convert a (d)ddmm.mmmm NMEA coordinate to signed decimal degrees."""
+        line = self._line
+        start, end = self._field(value)
+        degrees = _integer(line, start, start + degree_digits) + _decimal(line, start + degree_digits, end) / 60
+        if self._is(hemisphere, _S) or self._is(hemisphere, _W):
+            return -degrees
+        return degrees
+
+    def _time_of_day(self, index: int) -> float:
+        """Convert a hhmmss.ss NMEA time to seconds since midnight UTC."""
+        line = self._line
+        start, end = self._field(index)
+        return _integer(line, start, start + 2) * 3600 + _integer(line, start + 2, start + 4) * 60 + \
+            _decimal(line, start + 4, end)
+
+    def _number(self, index: int) -> float:
+        start, end = self._field(index)
+        return _decimal(self._line, start, end)
+
+    def _gga(self):
+        # GGA,time,lat,N,lon,E,quality,satellites,hdop,altitude,M,...
+        status = self.status
+        if self._empty(6) or self._is(6, _ZERO) or self._empty(2):
+            status.valid = False
+            return
+        latitude = self._coordinate(2, 3, 2)
+        longitude = self._coordinate(4, 5, 3)
+        altitude = status.altitude if self._empty(9) else self._number(9)
+        timestamp = status.timestamp if self._empty(1) else self._time_of_day(1)
+        status.latitude = latitude
+        status.longitude = longitude
+        status.altitude = altitude
+        status.timestamp = timestamp
+        status.valid = True
+        status.fixed_at = _ticks_ms()
+
+    def _rmc(self):
+        # RMC,time,status,lat,N,lon,E,speed (knots),course,date,...
+        status = self.status
+        if not self._is(2, _A) or self._empty(3):
+            status.valid = False
+            return
+        latitude = self._coordinate(3, 4, 2)
+        longitude = self._coordinate(5, 6, 3)
+        speed = 0. if self._empty(7) else self._number(7) * _KNOTS_TO_MS
+        course = status.course if self._empty(8) else self._number(8)
+        timestamp = status.timestamp if self._empty(1) else self._time_of_day(1)
+        status.latitude = latitude
+        status.longitude = longitude
+        status.speed = speed
+        status.course = course
+        status.timestamp = timestamp
+        status.valid = True
+        status.fixed_at = _ticks_ms()
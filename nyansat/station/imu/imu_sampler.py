@@ -0,0 +1,142 @@
+import _thread
+import array
+import logging
+import time
+
+from antenny_threading import Thread
+from imu.imu import ImuCalibrationStatus, ImuController, ImuHeading, ImuStatus
+
+try:
+    _ticks_us = time.ticks_us
+    _ticks_diff = time.ticks_diff
+except AttributeError:
+    def _ticks_us():
+        return int(time.monotonic() * 1000000)
+
+    def _ticks_diff(end, start):
+        return end - start
+
+# The full status costs several I2C reads, so it is refreshed less often than the euler angles
+_STATUS_DIVIDER = 10
+_DEFAULT_HISTORY = 64
+
+LOG = logging.getLogger('antenny.imu')
+
+
+class ImuSampler(Thread, ImuController):
+    """
+    Poll another ImuController in the background at a fixed rate, and serve
+    euler(), heading() and get_status() from the latest samples, so readers
+    never wait on the I2C bus. The latest sample is a single tuple replaced as
+    a whole, so reading it needs no lock. The last euler samples are also kept,
+    with their timestamps, in a preallocated ring buffer.
+    """
+
+    def __init__(
+            self,
+            imu: ImuController,
+            rate: float = 50.,
+            history: int = _DEFAULT_HISTORY,
+    ):
+        """
+        :param imu: controller actually reading the sensor
+        :param rate: sampling rate in Hz
+        :param history: number of euler samples kept in the ring buffer
+        """
+        super(ImuSampler, self).__init__()
+        self.imu = imu
+        self._interval_us = int(1000000 / rate)
+        self._history = history
+        self._times = [0] * history
+        self._eulers = array.array('f', [0.] * (3 * history))
+        self._count = 0
+        # (ticks_us, euler) and (ticks_us, status) of the latest reads
+        self._latest = None
+        self._latest_status = None
+        # Serializes the sampling thread and pass-through calls on the bus
+        self._bus_lock = _thread.allocate_lock()
+
+    def _read(self, function):
+        with self._bus_lock:
+            return function()
+
+    def _sample(self):
+        euler = self._read(self.imu.euler)
+        now = _ticks_us()
+        slot = self._count % self._history
+        self._times[slot] = now
+        self._eulers[3 * slot] = euler[0]
+        self._eulers[3 * slot + 1] = euler[1]
+        self._eulers[3 * slot + 2] = euler[2]
+        self._count += 1
+        self._latest = (now, euler)
+        if self._latest_status is None or self._count % _STATUS_DIVIDER == 0:
+            self._latest_status = (_ticks_us(), self._read(self.imu.get_status))
+
+    def run(self):
+        LOG.info("Sampling the IMU every {} us".format(self._interval_us))
+        while self.running:
+            start = _ticks_us()
+            try:
+                self._sample()
+            except OSError as e:
+                LOG.warning("IMU read failed: {}".format(e))
+            elapsed = _ticks_diff(_ticks_us(), start)
+            time.sleep(max(self._interval_us - elapsed, 0) / 1000000)
+
+    def sample_age_us(self):
+        """Microseconds since the latest euler sample, None before the first one."""
+        latest = self._latest
+        if latest is None:
+            return None
+        return _ticks_diff(_ticks_us(), latest[0])
+
+    def status_age_us(self):
+        """Microseconds since the latest status sample, None before the first one."""
+        latest = self._latest_status
+        if latest is None:
+            return None
+        return _ticks_diff(_ticks_us(), latest[0])
+
+    def samples(self, count: int = None) -> list:
+        """Return up to count of the latest (ticks_us, heading, roll, pitch) samples, oldest first."""
+        available = min(self._count, self._history)
+        if count is None or count > available:
+            count = available
+        end = self._count
+        samples = []
+        for n in range(end - count, end):
+            slot = n % self._history
+            samples.append((
+                self._times[slot],
+                self._eulers[3 * slot],
+                self._eulers[3 * slot + 1],
+                self._eulers[3 * slot + 2],
+            ))
+        return samples
+
+    def euler(self) -> tuple:
+        """Return the latest Euler angles in degrees: (heading, roll, pitch)."""
+        latest = self._latest
+        if latest is None:
+            return self._read(self.imu.euler)
+        return latest[1]
+
+    def heading(self) -> ImuHeading:
+        elevation, azimuth, _ = self.euler()
+        return ImuHeading(elevation, azimuth)
+
+    def get_status(self) -> ImuStatus:
+        latest = self._latest_status
+        if latest is None:
+            return self._read(self.imu.get_status)
+        return latest[1]
+
+    def get_calibration_status(self) -> ImuCalibrationStatus:
+        return self._read(self.imu.get_calibration_status)
+
+    def save_calibration_profile(self, filename: str) -> None:
+        self._read(lambda: self.imu.save_calibration_profile(filename))
+
+    def upload_calibration_profile(self, filename: str) -> None:
+        self._read(lambda: self.imu.upload_calibration_profile(filename))
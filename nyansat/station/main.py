@@ -15,6 +15,7 @@ try:
     from antenny_threading import Queue
     from config.config import ConfigRepository
     from multi_client.follower import AntennyFollowerNode, MCAST_PORT, UDPFollowerClient
+    import runtime
 except ImportError as e:
     print(e)
     failed_imports = True
@@ -42,7 +43,8 @@ config = ConfigRepository()
 if not failed_imports:
     initialize_i2c_bus(config.get('antenny_board_version'))
     # leave this global so the entire system has access to the AntKontrol instance
-    api = antenny.esp32_antenna_api_factory()
+    # With the cooperative runtime the services are started by run_cooperative()
+    api = antenny.esp32_antenna_api_factory(start=not config.get('use_cooperative_runtime'))
 else:
     print("WARNING: necessary imports failed, please reboot the device after installing the "
           "necessary dependencies")
@@ -70,3 +72,14 @@ def join_leader(my_id: int):
         return
     follower.join()
     udp_client.join()
+
+
+def run_cooperative(my_id: int = None):
+    """
+    Run the station services, and join a leader if my_id is given, on a single
+    event loop instead of threads. Needs use_cooperative_runtime=True at boot.
+    """
+    if not config.get('use_cooperative_runtime'):
+        print("Set config.set('use_cooperative_runtime', True) and reboot first")
+        return
+    runtime.main(api, my_id)
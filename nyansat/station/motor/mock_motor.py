@@ -23,6 +23,9 @@ class MockMotorController(MotorController):
         """
         self._position = degrees
 
+    def set_motion_limits(self, index, max_rate, max_acceleration=None):
+        pass
+
     def release(self, index):
         """Set the duty cycle of the servo with the given index to 0."""
         pass
@@ -14,6 +14,12 @@ class MotorController(object):
         """
         raise NotImplementedError()
 
+    def set_motion_limits(self, index, max_rate, max_acceleration=None):
+        """Set the velocity (degrees/ms) and acceleration (degrees/ms^2) limits
+        of smooth_move for the servo with the given index.
+        """
+        raise NotImplementedError()
+
     def release(self, index):
         """Set the duty cycle of the servo with the given index to 0."""
         raise NotImplementedError()
@@ -1,11 +1,23 @@
 import _thread
 import math
+import time
+import struct
 
 import machine
 import pca9685
 
 from motor.motor import MotorController
 
+# Period of the timer interpolating every moving servo
+_MOTION_TICK_MS = 20
+
+# PCA9685 registers
+_MODE1 = 0x00
+_MODE1_AUTO_INCREMENT = 0x20
+_LED0_ON_L = 0x06
+_CHANNELS = 16
+_CHANNEL_SIZE = 4
+
 
 class Pca9685Controller(MotorController):
     """Controller for the PCA9685 servomotor PWM mux driver for antenny."""
@@ -35,11 +47,75 @@ class Pca9685Controller(MotorController):
         self.freq = freq
         self.pca9685 = pca9685.PCA9685(i2c, address)
         self.pca9685.freq(freq)
+        self._i2c = i2c
+        self._address = address
+        # Make sure consecutive LEDn registers can be written in one transaction
+        mode1 = i2c.readfrom_mem(address, _MODE1, 1)[0]
+        if not mode1 & _MODE1_AUTO_INCREMENT:
+            i2c.writeto_mem(address, _MODE1, bytes((mode1 | _MODE1_AUTO_INCREMENT,)))
+        # Shadow copy of the LEDn_ON/LEDn_OFF registers of every channel, read
+        # once here; afterwards the registers are only ever written
+        self._shadow = bytearray(_CHANNELS * _CHANNEL_SIZE)
+        i2c.readfrom_mem_into(address, _LED0_ON_L, self._shadow)
+        self._shadow_view = memoryview(self._shadow)
+        # Bitmask of the channels changed in the shadow but not written yet
+        self._dirty = 0
 
-        # Using timer 0 for interrupt-based movement
+        # Using timer 0 for interrupt-based movement of every servo at once
         self.move_timer = machine.Timer(0)
-        self._move_data = None
-        self.is_moving = False
+        self._timer_running = False
+        self._last_tick = 0
+        # index -> [position, velocity, target, max_rate, max_acceleration], in degrees and ms
+        self._motions = {}
+        # index -> (max_rate, max_acceleration)
+        self._limits = {}
+        # Guards the shadow registers, the dirty mask and _motions, which the
+        # motion timer and the trajectory, pointing and move threads all change
+        self._lock = _thread.allocate_lock()
+
+    def _stage_pwm(self, index, on, off):
+        """Change a channel in the shadow registers, written on the next flush. Callers hold _lock."""
+        struct.pack_into('<HH', self._shadow, index * _CHANNEL_SIZE, on, off)
+        self._dirty |= 1 << index
+
+    def _stage_duty(self, index, value):
+        """Same duty encoding as pca9685.PCA9685.duty, on the shadow registers."""
+        if not 0 <= value <= 4095:
+            raise ValueError("Out of range")
+        if value == 0:
+            self._stage_pwm(index, 0, 4096)
+        elif value == 4095:
+            self._stage_pwm(index, 4096, 0)
+        else:
+            self._stage_pwm(index, 0, value)
+
+    def _shadow_pwm(self, index):
+        return struct.unpack_from('<HH', self._shadow, index * _CHANNEL_SIZE)
+
+    def flush(self):
+        """Write every changed channel in a single auto-increment burst, from the
+        lowest to the highest changed channel. Unchanged channels in between are
+        rewritten with their current value from the shadow.
+        """
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        dirty = self._dirty
+        if not dirty:
+            return
+        self._dirty = 0
+        low = 0
+        while not dirty & (1 << low):
+            low += 1
+        high = _CHANNELS - 1
+        while not dirty & (1 << high):
+            high -= 1
+        self._i2c.writeto_mem(
+            self._address,
+            _LED0_ON_L + low * _CHANNEL_SIZE,
+            self._shadow_view[low * _CHANNEL_SIZE:(high + 1) * _CHANNEL_SIZE],
+        )
 
     def degrees(self, index: int) -> float:
         """Return the position in degrees of the servo with the given index."""
@@ -69,83 +145,173 @@ class Pca9685Controller(MotorController):
         elif duty is not None:
             pass
         else:
-            return self.pca9685.duty(index)
+            return self.duty(index)
         duty = min(self.max_duty, max(self.min_duty, int(duty)))
-        self.pca9685.duty(index, duty)
+        with self._lock:
+            # A direct command takes over from any motion in progress
+            self._motions.pop(index, None)
+            self._stage_duty(index, duty)
+            self._flush()
 
     def get_position(self, index):
         """Get the position of a servo in degrees."""
         span = self.max_duty - self.min_duty
-        duty = self.pca9685.duty(index)
+        duty = self.duty(index)
         degrees = (duty - self.min_duty) * self._degrees.get(index, self._default_degrees) / span
         return degrees
 
-    def __move_one(self, timer):
-        index, end, step = self._move_data
-        cur = self.pca9685.duty(index)
-        if cur != end:
-            try:
-                self.pca9685.duty(index, cur + step)
-            except ValueError as e:
-                print(str(e))
-                timer.deinit()
-                self.is_moving = False
+    def _degrees_to_duty(self, index, degrees):
+        span = self.max_duty - self.min_duty
+        duty = self.min_duty + span * degrees / self._degrees.get(index, self._default_degrees)
+        return min(self.max_duty, max(self.min_duty, int(duty)))
+
+    def set_motion_limits(self, index, max_rate, max_acceleration=None):
+        """Set the velocity (degrees/ms) and acceleration (degrees/ms^2) limits
+        used by smooth_move for the servo with the given index. Without an
+        acceleration limit, moves run at constant velocity.
+        """
+        self._limits[index] = (max_rate, max_acceleration)
+
+    def is_moving(self, index=None):
+        """Return True if the given servo, or any servo if index is None, is
+        still following a smooth_move.
+        """
+        if index is None:
+            return bool(self._motions)
+        return index in self._motions
+
+    def _step_motion(self, motion, dt):
+        """Advance a motion [position, velocity, target, max_rate, max_acceleration]
+        by dt ms, return True once the target is reached.
+        """
+        position, velocity, target, max_rate, max_acceleration = motion
+        remaining = target - position
+        direction = 1 if remaining >= 0 else -1
+        if max_acceleration is None:
+            velocity = direction * max_rate
+        elif velocity * direction > 0 and velocity * velocity >= 2 * max_acceleration * abs(remaining):
+            # Brake just hard enough to stop on the target
+            velocity -= velocity * velocity / (2 * remaining) * dt
         else:
-            timer.deinit()
-            self.is_moving = False
+            velocity += direction * max_acceleration * dt
+            velocity = min(max_rate, max(-max_rate, velocity))
+        step = velocity * dt
+        if (step >= remaining) if direction > 0 else (step <= remaining):
+            motion[0] = target
+            motion[1] = 0.
+            return True
+        motion[0] = position + step
+        motion[1] = velocity
+        return False
+
+    def __move_all(self, timer):
+        # The callback may interrupt a thread holding the lock, waiting for it
+        # would never return: skip the tick, the next one covers its time
+        if not self._lock.acquire(0):
+            return
+        try:
+            now = time.ticks_ms()
+            dt = time.ticks_diff(now, self._last_tick)
+            self._last_tick = now
+            for index in list(self._motions):
+                motion = self._motions.get(index)
+                if motion is None:
+                    continue
+                done = self._step_motion(motion, dt)
+                duty = self._degrees_to_duty(index, motion[0])
+                if duty != self.duty(index):
+                    self._stage_duty(index, duty)
+                if done:
+                    del self._motions[index]
+            self._flush()
+            if not self._motions:
+                timer.deinit()
+                self._timer_running = False
+        finally:
+            self._lock.release()
 
     def smooth_move(self, index, degrees, delay):
-        # Trying to acquire the move lock hung during testing, this is an attempt at a spin lock.
-        # Note that this could fail on a multi-core system
-        while self.is_moving:
-            pass
-        self.is_moving = True
+        """Start moving the servo with the given index to a position in degrees
+        and return immediately. All servos in motion are interpolated together
+        by a single timer, following trapezoidal velocity profiles when limits
+        were set with set_motion_limits. Otherwise the servo moves at a constant
+        one duty step per delay ms, like before. A new target for a servo that
+        is still moving takes over from its current position and velocity.
+        """
+        target = self._degrees_to_duty(index, degrees)
         span = self.max_duty - self.min_duty
-        duty = self.min_duty + span * degrees / self._degrees.get(index, self._default_degrees)
-        start = self.pca9685.duty(index)
-        end = min(self.max_duty, max(self.min_duty, int(duty)))
-        step = -1 if start > end else 1
-        self._move_data = [index, end, step]
-        self.move_timer.init(period=delay, mode=machine.Timer.PERIODIC, callback=self.__move_one)
-        return duty
+        target_degrees = (target - self.min_duty) * self._degrees.get(index, self._default_degrees) / span
+        max_rate, max_acceleration = self._limits.get(index, (None, None))
+        if max_rate is None:
+            max_rate = self._degrees.get(index, self._default_degrees) / span / delay
+            max_acceleration = None
+        with self._lock:
+            motion = self._motions.get(index)
+            if motion is None:
+                motion = [self.get_position(index), 0., target_degrees, max_rate, max_acceleration]
+            else:
+                motion[2:] = [target_degrees, max_rate, max_acceleration]
+            self._motions[index] = motion
+            if not self._timer_running:
+                self._last_tick = time.ticks_ms()
+            # (Re)arming the timer every time avoids racing with the callback disarming it
+            self._timer_running = True
+            self.move_timer.init(period=_MOTION_TICK_MS, mode=machine.Timer.PERIODIC, callback=self.__move_all)
+        return target
 
     def release(self, index):
-        self.pca9685.duty(index, 0)
+        with self._lock:
+            self._motions.pop(index, None)
+            self._stage_duty(index, 0)
+            self._flush()
 
     def _pin(self, pin, value=None):
         if value is None:
-            return bool(self.pca9685.pwm(pin)[0])
+            return bool(self._shadow_pwm(pin)[0])
         if value:
-            self.pca9685.pwm(pin, 4096, 0)
+            self._stage_pwm(pin, 4096, 0)
         else:
-            self.pca9685.pwm(pin, 0, 0)
+            self._stage_pwm(pin, 0, 0)
 
     def speed(self, index, value=None):
         pwm, in2, in1 = self._DC_MOTORS[index]
         if value is None:
-            value = self.pca9685.duty(pwm)
+            value = self.duty(pwm)
             if self._pin(in2) and not self._pin(in1):
                 value = -value
             return value
-        if value > 0:
-            # Forward
-            self._pin(in2, False)
-            self._pin(in1, True)
-        elif value < 0:
-            # Backward
-            self._pin(in1, False)
-            self._pin(in2, True)
-        else:
-            # Release
-            self._pin(in1, False)
-            self._pin(in2, False)
-        self.pca9685.duty(pwm, abs(value))
+        if abs(value) > 4095:
+            # Checked before the direction pins are staged
+            raise ValueError("Out of range")
+        with self._lock:
+            if value > 0:
+                # Forward
+                self._pin(in2, False)
+                self._pin(in1, True)
+            elif value < 0:
+                # Backward
+                self._pin(in1, False)
+                self._pin(in2, True)
+            else:
+                # Release
+                self._pin(in1, False)
+                self._pin(in2, False)
+            self._stage_duty(pwm, abs(value))
+            self._flush()
 
     def brake(self, index):
         pwm, in2, in1 = self._DC_MOTORS[index]
-        self._pin(in1, True)
-        self._pin(in2, True)
-        self.pca9685.duty(pwm, 0)
+        with self._lock:
+            self._pin(in1, True)
+            self._pin(in2, True)
+            self._stage_duty(pwm, 0)
+            self._flush()
 
     def duty(self, index):
-        return self.pca9685.duty(index)
+        """Return the duty of a channel from the shadow registers, without any I2C read."""
+        on, off = self._shadow_pwm(index)
+        if on == 0 and off == 4096:
+            return 0
+        if on == 4096 and off == 0:
+            return 4095
+        return off
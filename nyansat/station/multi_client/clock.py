@@ -0,0 +1,88 @@
+# Only the exchanges with the least network delay are used: they are the
+# least affected by queuing, and so give the most accurate offsets
+_WINDOW = 32
+_MIN_SAMPLES = 4
+# Drift is only estimated over this much leader time, in microseconds
+_MIN_DRIFT_SPAN_US = 5000000
+# Crystal oscillators are well within this, larger estimates are noise
+_MAX_DRIFT = 0.0005
+
+
+class FollowerClockModel(object):
+    """
+    Offset and drift of a follower clock relative to the leader clock,
+    estimated NTP style from ClockSyncRequest / ClockSyncResponse exchanges:
+    with t1 and t4 the leader send and receive times, t2 and t3 the follower
+    receive and send times, an exchange measures
+
+        offset = ((t2 - t1) + (t3 - t4)) / 2
+        delay = (t4 - t1) - (t3 - t2)
+
+    The offset is accurate to delay / 2, so the model fits a line through the
+    offsets of the lowest delay half of the last exchanges.
+    """
+
+    def __init__(self, window: int = _WINDOW):
+        self._window = window
+        # (leader time, offset, delay) of the last exchanges, in microseconds
+        self._samples = []
+        self.offset_us = None
+        self.drift = 0.
+        self.delay_us = None
+        self._reference_us = None
+
+    def __repr__(self):
+        return "<FollowerClockModel offset={}us drift={:.2f}ppm delay={}us samples={}>".format(
+                self.offset_us, self.drift * 1000000, self.delay_us, len(self._samples))
+
+    def add_exchange(self, t1: int, t2: int, t3: int, t4: int) -> bool:
+        """
+        Add a completed exchange, return False if it was discarded.
+        """
+        delay = (t4 - t1) - (t3 - t2)
+        if delay < 0:
+            return False
+        offset = ((t2 - t1) + (t3 - t4)) // 2
+        self._samples.append((t4, offset, delay))
+        if len(self._samples) > self._window:
+            self._samples.pop(0)
+        self._fit()
+        return True
+
+    def _fit(self):
+        best = sorted(self._samples, key=lambda sample: sample[2])
+        best = best[:max(len(best) // 2, 1)]
+        self.delay_us = best[0][2]
+        reference_us, offset_us, _ = best[0]
+        drift = 0.
+        latest_us = max(best)[0]
+        if len(best) > 1 and latest_us - min(best)[0] >= _MIN_DRIFT_SPAN_US:
+            # Least squares fit relative to the latest retained exchange, so
+            # the arithmetic stays small enough for single precision floats
+            reference_us = latest_us
+            base_offset = best[0][1]
+            mean_t = sum(sample[0] - reference_us for sample in best) / len(best)
+            mean_offset = sum(sample[1] - base_offset for sample in best) / len(best)
+            covariance = 0.
+            variance = 0.
+            for t, offset, _ in best:
+                dt = t - reference_us - mean_t
+                covariance += dt * (offset - base_offset - mean_offset)
+                variance += dt * dt
+            drift = max(-_MAX_DRIFT, min(_MAX_DRIFT, covariance / variance))
+            offset_us = base_offset + int(mean_offset - drift * mean_t)
+        self._reference_us = reference_us
+        self.offset_us = offset_us
+        self.drift = drift
+
+    def is_synced(self) -> bool:
+        return len(self._samples) >= _MIN_SAMPLES
+
+    def to_follower_us(self, leader_us: int) -> int:
+        """Convert a time on the leader clock to the follower clock."""
+        return leader_us + self.offset_us + int(self.drift * (leader_us - self._reference_us))
+
+    def to_leader_us(self, follower_us: int) -> int:
+        """Convert a time on the follower clock to the leader clock."""
+        leader_us = follower_us - self.offset_us
+        return leader_us - int(self.drift * (leader_us - self._reference_us))
@@ -8,11 +8,30 @@ except ImportError:
     machine = None
     RTC = None
 
+# Common times count from the MicroPython epoch, 2000-01-01 UTC, on every
+# port: CPython and Unix epoch ports are shifted by this many seconds.
+# Must match MICROPYTHON_EPOCH_OFFSET in nyansat/host/trajectory.py
+MICROPYTHON_EPOCH_OFFSET = 946684800
+_EPOCH_OFFSET = 0 if time.gmtime(0)[0] == 2000 else MICROPYTHON_EPOCH_OFFSET
+
 
 def common_time():
     """
-    Common python/micropython time wrapper.
+    Common python/micropython time wrapper, in seconds since 2000-01-01 UTC.
     """
     if machine is None:
-        return time.time()
+        return time.time() - _EPOCH_OFFSET
     return time.time() + RTC.datetime()[-1] / 1000000
+
+
+def common_time_us():
+    """
+    Common python/micropython time wrapper, in integer microseconds since
+    2000-01-01 UTC. Unlike common_time, this keeps sub-second precision on
+    boards with single precision floats.
+    """
+    if machine is None:
+        return int((time.time() - _EPOCH_OFFSET) * 1000000)
+    dt = RTC.datetime()
+    seconds = time.mktime((dt[0], dt[1], dt[2], dt[4], dt[5], dt[6], 0, 0))
+    return seconds * 1000000 + dt[7]
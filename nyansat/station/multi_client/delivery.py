@@ -0,0 +1,191 @@
+import _thread
+import logging
+import time
+
+from antenny_threading import Thread
+from multi_client.common import common_time, common_time_us
+from multi_client.protocol.move import MoveResponse
+
+# Retransmit timeout bounds and estimator gains, as in RFC 6298, in seconds
+_MIN_RTO = 0.02
+_MAX_RTO = 1.
+_INITIAL_RTO = 0.25
+_RTT_ALPHA = 0.125
+_RTT_BETA = 0.25
+_MAX_ATTEMPTS = 8
+_POLL_INTERVAL = 0.002
+
+LOG = logging.getLogger("antenny.multi_client.delivery")
+
+
+class DeliveryStats(object):
+    """Per device delivery statistics, and the retransmit timeout estimator."""
+
+    def __init__(self, device_id: int):
+        self.device_id = device_id
+        self.sent = 0
+        self.delivered = 0
+        self.rejected = 0
+        self.retransmissions = 0
+        self.lost = 0
+        self.duplicate_acks = 0
+        # Time from first transmission to acknowledgement, in seconds
+        self.last_latency = None
+        self.max_latency = 0.
+        self._total_latency = 0.
+        self.srtt = None
+        self.rttvar = None
+
+    def __repr__(self):
+        return "<DeliveryStats device_id={} sent={} delivered={} lost={} retransmissions={} " \
+               "avg latency={} rto={:.3f}>".format(
+                self.device_id, self.sent, self.delivered, self.lost, self.retransmissions,
+                self.average_latency(), self.rto())
+
+    def average_latency(self):
+        if self.delivered == 0:
+            return None
+        return self._total_latency / self.delivered
+
+    def loss_rate(self) -> float:
+        """Fraction of the settled moves that were never acknowledged."""
+        settled = self.delivered + self.lost
+        if settled == 0:
+            return 0.
+        return self.lost / settled
+
+    def seed_rtt(self, rtt: float):
+        """Initialize the estimator from an RTT measured elsewhere, e.g. heartbeats."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+
+    def add_rtt(self, rtt: float):
+        if self.srtt is None:
+            self.seed_rtt(rtt)
+            return
+        self.rttvar = (1 - _RTT_BETA) * self.rttvar + _RTT_BETA * abs(self.srtt - rtt)
+        self.srtt = (1 - _RTT_ALPHA) * self.srtt + _RTT_ALPHA * rtt
+
+    def add_latency(self, latency: float):
+        self.delivered += 1
+        self.last_latency = latency
+        self._total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def rto(self) -> float:
+        if self.srtt is None:
+            return _INITIAL_RTO
+        return max(_MIN_RTO, min(_MAX_RTO, self.srtt + 4 * self.rttvar))
+
+
+class PendingAck(object):
+
+    def __init__(self, sequence: int, device_id: int, message: bytes, expires_at: float, now: float, rto: float,
+                 sent_us: int):
+        self.sequence = sequence
+        self.device_id = device_id
+        self.message = message
+        self.expires_at = expires_at
+        # common_time_us() of the first transmission, latencies are measured in integer
+        # microseconds to keep their precision on boards with single precision floats
+        self.first_sent_us = sent_us
+        self.attempts = 1
+        self.rto = rto
+        self.deadline = min(now + rto, expires_at)
+
+
+class ReliableDelivery(Thread):
+    """
+    Keep sent requests until the follower acknowledges them, retransmitting
+    with an adaptive timeout and exponential backoff. A request is given up
+    once it expires (a move past its time is useless) or after _MAX_ATTEMPTS.
+    Only acknowledgements of requests sent once are used as RTT samples
+    (Karn's algorithm).
+    """
+
+    def __init__(self, client):
+        """
+        :param client: LeaderClient the requests are sent with and the responses read from
+        """
+        super(ReliableDelivery, self).__init__()
+        self.client = client
+        self._pending = {}
+        self._stats = {}
+        self._lock = _thread.allocate_lock()
+
+    def stats(self, device_id: int) -> DeliveryStats:
+        if device_id not in self._stats:
+            self._stats[device_id] = DeliveryStats(device_id)
+        return self._stats[device_id]
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def send(self, sequence: int, device_id: int, message: bytes, expires_at: float, rtt: float = None):
+        """
+        Send a request and track it until acknowledged
+        :param expires_at: leader common_time() after which the request is given up
+        :param rtt: RTT already measured for the device, to seed the timeout estimator
+        """
+        stats = self.stats(device_id)
+        if rtt is not None:
+            stats.seed_rtt(rtt)
+        now = common_time()
+        with self._lock:
+            self._pending[sequence] = PendingAck(
+                    sequence, device_id, message, expires_at, now, stats.rto(), common_time_us())
+            stats.sent += 1
+        self.client.send(message)
+
+    def _handle_ack(self, packet):
+        response = packet.payload  # type: MoveResponse
+        with self._lock:
+            pending = self._pending.pop(response.sequence, None)
+        if pending is None:
+            # Ack of a retransmission that crossed an earlier ack, or of a given up request
+            self.stats(packet.header.board_id).duplicate_acks += 1
+            return
+        stats = self.stats(pending.device_id)
+        # Measure up to the ack's arrival on the socket, not to when this thread got to it
+        received_at_us = packet.received_at_us
+        if received_at_us is None:
+            received_at_us = common_time_us()
+        latency = (received_at_us - pending.first_sent_us) / 1000000
+        if pending.attempts == 1:
+            stats.add_rtt(latency)
+        stats.add_latency(latency)
+        if not response.move_ok:
+            stats.rejected += 1
+            LOG.warning("Device {} rejected move {}".format(pending.device_id, pending.sequence))
+
+    def _retransmit(self, now: float):
+        resend = []
+        with self._lock:
+            for sequence in list(self._pending):
+                pending = self._pending[sequence]
+                if now < pending.deadline:
+                    continue
+                if now >= pending.expires_at or pending.attempts >= _MAX_ATTEMPTS:
+                    del self._pending[sequence]
+                    self.stats(pending.device_id).lost += 1
+                    LOG.warning("Move {} to device {} was not acknowledged after {} attempts".format(
+                            sequence, pending.device_id, pending.attempts))
+                    continue
+                pending.attempts += 1
+                pending.rto = min(_MAX_RTO, pending.rto * 2)
+                pending.deadline = min(now + pending.rto, pending.expires_at)
+                self.stats(pending.device_id).retransmissions += 1
+                resend.append(pending.message)
+        for message in resend:
+            self.client.send(message)
+
+    def run(self):
+        while self.running:
+            recv = self.client.recv(MoveResponse)
+            while recv is not None:
+                self._handle_ack(recv)
+                recv = self.client.recv(MoveResponse)
+            self._retransmit(common_time())
+            time.sleep(_POLL_INTERVAL)
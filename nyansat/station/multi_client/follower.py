@@ -1,10 +1,4 @@
-try:
-    import machine
-    import utime
-
-    RTC = machine.RTC()
-except ImportError:
-    RTC = None
+import _thread
 import logging
 import struct
 import socket
@@ -12,10 +6,17 @@ import time
 
 from antenny import AntennyAPI, esp32_antenna_api_factory, mock_antenna_api_factory
 from antenny_threading import Thread, Queue, Empty
-from multi_client.protocol.constants import HEARTBEAT_PAYLOAD_ACK_TYPE, MOVE_RESPONSE_PAYLOAD_TYPE
+from multi_client.common import common_time_us
+from multi_client.move_scheduler import MoveScheduler
+from multi_client.protocol.clock import ClockSyncRequest, ClockSyncResponse
+from multi_client.protocol.constants import (
+    CLOCK_SYNC_RESPONSE_PAYLOAD_TYPE, HEARTBEAT_PAYLOAD_ACK_TYPE, MOVE_RESPONSE_PAYLOAD_TYPE,
+)
 from multi_client.protocol.heartbeat import HeartbeatRequest, HeartbeatResponse
 from multi_client.protocol.move import MoveRequest, MoveResponse
-from multi_client.protocol.packet import MultiAntennyPacket, MultiAntennyPacketHeader
+from multi_client.protocol.packet import MultiAntennyPacket, MultiAntennyPacketHeader, PacketDecoder
+from multi_client.protocol.trajectory import TrajectoryRequest
+from trajectory.trajectory import TrajectoryTable
 
 MCAST_GRP = '224.11.11.11'
 MCAST_PORT = 31337
@@ -24,7 +25,13 @@ IS_ALL_GROUPS = False
 LOG = logging.getLogger("antenny.multi_client.follower")
 
 MAX_MESSAGE_SIZE = 1024
+# Number of preallocated receive buffers, i.e. of datagrams waiting to be handled
+_MESSAGE_SLOTS = 8
+# Number of recent move sequence numbers remembered to drop retransmissions
+_RECENT_MOVES = 64
 _DEFAULT_TIMEOUT = 0.0001
+# Raised by decoding a truncated or unknown packet, MicroPython has no struct.error
+_DECODE_ERRORS = (ValueError, IndexError, getattr(struct, "error", ValueError))
 
 try:
     import ujson as json
@@ -43,39 +50,58 @@ def socket_inet_aton(ip_address: str):
     return result
 
 
-def create_heartbeat_response_packet(board_id: int):
+def create_heartbeat_response_packet(board_id: int, nonce: int, sent_us: int):
     return MultiAntennyPacket(
             MultiAntennyPacketHeader(board_id, HEARTBEAT_PAYLOAD_ACK_TYPE, MCAST_PORT),
-            HeartbeatResponse(),
+            HeartbeatResponse(nonce, sent_us),
+    )
+
+
+def create_clock_sync_response_packet(board_id: int, leader_send_us: int, follower_receive_us: int):
+    return MultiAntennyPacket(
+            MultiAntennyPacketHeader(board_id, CLOCK_SYNC_RESPONSE_PAYLOAD_TYPE, MCAST_PORT),
+            ClockSyncResponse(leader_send_us, follower_receive_us, common_time_us()),
     )
 
 
-def create_move_response_packet(board_id: int, move_ok: bool):
+def create_move_response_packet(board_id: int, sequence: int, move_ok: bool):
     return MultiAntennyPacket(
             MultiAntennyPacketHeader(board_id, MOVE_RESPONSE_PAYLOAD_TYPE, MCAST_PORT),
-            MoveResponse(move_ok),
+            MoveResponse(sequence, move_ok),
     )
 
 
 class FollowerMessage(object):
+    """A received datagram: the first length bytes of buffer."""
+
     def __init__(
             self,
-            raw_message: bytes,
+            raw_message=None,
+            buffer=None,
     ):
-        self.raw_message = raw_message
+        if buffer is None:
+            buffer = raw_message if raw_message is not None else bytearray(MAX_MESSAGE_SIZE)
+        self.buffer = buffer
+        self.length = len(raw_message) if raw_message is not None else 0
+
+    @property
+    def raw_message(self) -> bytes:
+        return bytes(self.buffer[:self.length])
 
 
 class UDPFollowerMessage(FollowerMessage):
 
     def __init__(
             self,
-            raw_message: bytes,
-            sender_hostname: str,
-            sender_port: int,
+            raw_message: bytes = None,
+            sender_hostname: str = None,
+            sender_port: int = None,
+            received_at_us: int = None,
     ):
         super(UDPFollowerMessage, self).__init__(raw_message)
         self.sender_hostname = sender_hostname
         self.sender_port = sender_port
+        self.received_at_us = received_at_us
 
 
 class FollowerClient(Thread):
@@ -95,9 +121,20 @@ class FollowerClient(Thread):
         except Empty:
             return None
 
+    def receive_nowait(self):
+        # type: (...) -> Optional[FollowerMessage]
+        try:
+            return self.inbound_queue.get_nowait()
+        except Empty:
+            return None
+
     def send(self, message):
         self.outbound_queue.put(message)
 
+    def release(self, message: FollowerMessage):
+        """Hand a message back once handled, its buffer may then be reused."""
+        pass
+
 
 class UDPFollowerClient(FollowerClient):
 
@@ -123,12 +160,39 @@ class UDPFollowerClient(FollowerClient):
                 socket.SOCK_DGRAM,
                 socket.IPPROTO_UDP
         )
+        # Receive buffers are allocated once and recycled through release();
+        # without a free slot datagrams are left in the socket buffer
+        self._free_messages = [UDPFollowerMessage() for _ in range(_MESSAGE_SLOTS)]
+        self._free_lock = _thread.allocate_lock()
+        self._has_recv_into = hasattr(self._multicast_listen_sock, "recvfrom_into")
+
+    def release(self, message: FollowerMessage):
+        with self._free_lock:
+            self._free_messages.append(message)
+
+    @property
+    def listen_socket(self):
+        return self._multicast_listen_sock
 
     def run(self):
         while self.running:
             self._recv_from_multicast()
             self._send()
 
+    def receive_available(self):
+        """Queue every datagram already received, on a non blocking socket."""
+        while self._recv_from_multicast():
+            pass
+
+    def flush(self):
+        """Send every queued outbound message."""
+        while True:
+            try:
+                message, addr = self.outbound_queue.get_nowait()
+            except Empty:
+                return
+            self._multicast_send_socket.sendto(message, addr)
+
     def _send(self):
         try:
             message, addr = self.outbound_queue.get(timeout=_DEFAULT_TIMEOUT)
@@ -137,11 +201,27 @@ class UDPFollowerClient(FollowerClient):
         self._multicast_send_socket.sendto(message, addr)
 
     def _recv_from_multicast(self):
+        with self._free_lock:
+            if not self._free_messages:
+                return False
+            message = self._free_messages.pop()
         try:
-            message, (hostname, port) = self._multicast_listen_sock.recvfrom(MAX_MESSAGE_SIZE)
+            if self._has_recv_into:
+                length, (hostname, port) = self._multicast_listen_sock.recvfrom_into(message.buffer)
+            else:
+                # MicroPython sockets have no recvfrom_into
+                data, (hostname, port) = self._multicast_listen_sock.recvfrom(MAX_MESSAGE_SIZE)
+                length = len(data)
+                message.buffer[:length] = data
         except OSError:
-            return
-        self.inbound_queue.put(UDPFollowerMessage(message, hostname, port))
+            self.release(message)
+            return False
+        message.length = length
+        message.sender_hostname = hostname
+        message.sender_port = port
+        message.received_at_us = common_time_us()
+        self.inbound_queue.put(message)
+        return True
 
 
 class AntennyFollowerNode(Thread):
@@ -158,20 +238,81 @@ class AntennyFollowerNode(Thread):
         self.api = api
         self.following_id = None
         self._leaders = set()
+        self.move_scheduler = MoveScheduler(api.antenna)
+        # (leader id, sequence) of recently handled moves, and their outcome
+        self._recent_moves = {}
+        self._recent_move_order = []
+        self.duplicate_moves = 0
+        # Datagrams dropped as truncated or of a payload type this node does not handle
+        self.dropped_packets = 0
+        self._decoder = PacketDecoder()
+
+    def start(self):
+        self.move_scheduler.start()
+        super(AntennyFollowerNode, self).start()
+
+    def stop(self):
+        super(AntennyFollowerNode, self).stop()
+        self.move_scheduler.stop()
 
     def run(self):
         while self.running:
             message = self.follower_client.receive()
             if message is None:
                 continue
-            packet = MultiAntennyPacket.deserialize(message.raw_message)
-            if isinstance(packet.payload, HeartbeatRequest):
-                self._handle_heartbeat(packet, message)
-            elif isinstance(packet.payload, MoveRequest):
-                self._handle_move(packet, message)
-            else:
-                raise NotImplementedError(
-                        "Unable to handle packet type {}".format(type(packet.payload)))
+            try:
+                self._handle_message(message)
+            finally:
+                self.follower_client.release(message)
+
+    def step(self):
+        """Handle every message already received."""
+        message = self.follower_client.receive_nowait()
+        while message is not None:
+            try:
+                self._handle_message(message)
+            finally:
+                self.follower_client.release(message)
+            message = self.follower_client.receive_nowait()
+
+    def attach(self, runtime):
+        """
+        Handle datagrams from a runtime.Runtime as they arrive, instead of
+        running this node and its UDPFollowerClient as threads. Moves still
+        run from the MoveScheduler thread, to keep their timing.
+        """
+        client = self.follower_client  # type: UDPFollowerClient
+
+        def on_readable():
+            client.receive_available()
+            self.step()
+            client.flush()
+
+        self.move_scheduler.start()
+        runtime.add_reader(client.listen_socket, on_readable)
+
+    def _handle_message(self, message: FollowerMessage):
+        # The decoded packet is reused by the next decode, handlers must not keep it
+        try:
+            packet = self._decoder.decode(message.buffer, message.length)
+        except _DECODE_ERRORS as e:
+            self._drop(message, e)
+            return
+        if isinstance(packet.payload, HeartbeatRequest):
+            self._handle_heartbeat(packet, message)
+        elif isinstance(packet.payload, ClockSyncRequest):
+            self._handle_clock_sync(packet, message)
+        elif isinstance(packet.payload, MoveRequest):
+            self._handle_move(packet, message)
+        elif isinstance(packet.payload, TrajectoryRequest):
+            self._handle_trajectory(packet)
+        else:
+            self._drop(message, "unable to handle packet type {}".format(type(packet.payload)))
+
+    def _drop(self, message: FollowerMessage, reason):
+        self.dropped_packets += 1
+        LOG.warning("Dropping a datagram of {} bytes from {}: {}".format(
+                message.length, getattr(message, "sender_hostname", None), reason))
 
     def follow(self, board_id: int):
         if board_id not in self._leaders:
@@ -183,6 +324,7 @@ class AntennyFollowerNode(Thread):
 
     def unfollow(self):
         self.following_id = None
+        self.move_scheduler.cancel_all()
 
     def available_leaders(self):
         return self._leaders
@@ -198,12 +340,34 @@ class AntennyFollowerNode(Thread):
         if packet.header.board_id == self.following_id:
             LOG.debug("Got heartbeat from leader id={}".format(self.following_id))
             self.follower_client.send((
-                create_heartbeat_response_packet(self.board_id).serialize(),
+                create_heartbeat_response_packet(
+                        self.board_id,
+                        packet.payload.nonce,
+                        packet.payload.sent_us,
+                ).serialize(),
                 (message.sender_hostname, packet.header.listen_port)
             ))
         else:
             LOG.debug("Ignoring heartbeat from leader id={}".format(packet.header.board_id))
 
+    def _handle_clock_sync(
+            self,
+            packet: MultiAntennyPacket,
+            message: FollowerMessage,
+    ):
+        assert isinstance(message, UDPFollowerMessage)
+        assert isinstance(packet.payload, ClockSyncRequest)
+        if packet.header.board_id != self.following_id:
+            return
+        self.follower_client.send((
+            create_clock_sync_response_packet(
+                    self.board_id,
+                    packet.payload.leader_send_us,
+                    message.received_at_us,
+            ).serialize(),
+            (message.sender_hostname, packet.header.listen_port)
+        ))
+
     def _handle_move(
             self,
             packet: MultiAntennyPacket,
@@ -215,25 +379,55 @@ class AntennyFollowerNode(Thread):
                     packet.payload.board_id
             ))
             return
-        now = time.time()
-        if packet.payload.move_at_timestamp < now:
-            LOG.warning("Received a MoveRequest after the given timestamp, NOT moving!")
-            return
-        delta = packet.payload.move_at_timestamp - now
-        delta += packet.payload.move_at_millis - (RTC.datetime()[-1] / 1000000)
-        if delta > 10000:
-            LOG.debug("Very large time offset.")
-            return
-        LOG.debug("Sleeping for time delta of {} seconds".format(delta))
-        time.sleep(delta)
-        self.api.antenna.set_azimuth(packet.payload.azimuth)
-        self.api.antenna.set_elevation(packet.payload.elevation)
         assert isinstance(message, UDPFollowerMessage)
+        key = (packet.header.board_id, packet.payload.sequence)
+        move_ok = self._recent_moves.get(key)
+        if move_ok is None:
+            move_ok = self._schedule_move(packet.payload)
+            self._remember_move(key, move_ok)
+        else:
+            # A retransmission: our acknowledgement was lost, send it again
+            self.duplicate_moves += 1
         self.follower_client.send((
-            create_move_response_packet(self.board_id, move_ok=True).serialize(),
+            create_move_response_packet(self.board_id, packet.payload.sequence, move_ok).serialize(),
             (message.sender_hostname, packet.header.listen_port)
         ))
 
+    def _remember_move(self, key, move_ok: bool):
+        self._recent_moves[key] = move_ok
+        self._recent_move_order.append(key)
+        if len(self._recent_move_order) > _RECENT_MOVES:
+            del self._recent_moves[self._recent_move_order.pop(0)]
+
+    def _schedule_move(self, move: MoveRequest) -> bool:
+        move_at_us = move.move_at_timestamp * 1000000 + int(move.move_at_millis * 1000000)
+        delta = (move_at_us - common_time_us()) / 1000000
+        if delta < 0:
+            LOG.warning("Received a MoveRequest after the given timestamp, NOT moving!")
+            return False
+        if delta > 10000:
+            LOG.debug("Very large time offset.")
+            return False
+        LOG.debug("Scheduling a move in {} seconds".format(delta))
+        self.move_scheduler.schedule(move_at_us, move.azimuth, move.elevation)
+        return True
+
+    def _handle_trajectory(self, packet: MultiAntennyPacket):
+        assert isinstance(packet.payload, TrajectoryRequest)
+        if packet.header.board_id != self.following_id:
+            return
+        tables = packet.payload.tables_for(self.board_id)
+        if not tables:
+            return
+        # A trajectory takes over from single moves
+        self.move_scheduler.cancel_all()
+        for raw_table in tables:
+            try:
+                self.api.queue_trajectory(TrajectoryTable(raw_table))
+            except (RuntimeError, ValueError) as e:
+                LOG.warning("Not playing the trajectory: {}".format(e))
+                return
+
 
 def main(board_id: int):
     api = mock_antenna_api_factory(False, False)
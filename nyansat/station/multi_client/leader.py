@@ -4,25 +4,61 @@ import socket
 import time
 
 from antenny_threading import Thread, Queue, Empty
-from multi_client.common import common_time
-from multi_client.protocol.constants import HEARTBEAT_PAYLOAD_TYPE, MOVE_REQUEST_PAYLOAD_TYPE
+from multi_client.clock import FollowerClockModel
+from multi_client.delivery import DeliveryStats, ReliableDelivery
+from multi_client.common import common_time, common_time_us
+from multi_client.protocol.clock import ClockSyncRequest, ClockSyncResponse
+from multi_client.protocol.constants import (
+    CLOCK_SYNC_REQUEST_PAYLOAD_TYPE, HEARTBEAT_PAYLOAD_TYPE, MOVE_REQUEST_PAYLOAD_TYPE,
+    TRAJECTORY_REQUEST_PAYLOAD_TYPE,
+)
 from multi_client.protocol.heartbeat import HeartbeatRequest, HeartbeatResponse
 from multi_client.protocol.move import MoveRequest, MoveResponse
-from multi_client.protocol.packet import MultiAntennyPacket, MultiAntennyPacketHeader
+from multi_client.protocol.packet import PAYLOAD_TYPES, MultiAntennyPacket, MultiAntennyPacketHeader
+from multi_client.protocol.trajectory import TrajectoryRequest
+from trajectory.trajectory import TrajectoryTable, encode_trajectory_table
 
 MULTICAST_ADDR = "224.11.11.11"
 _DEFAULT_TIMEOUT = 0.0001
+# Followers receive at most MAX_MESSAGE_SIZE bytes per datagram
+MAX_PACKET_SIZE = 1024
+_TRAJECTORY_PAYLOAD_SPACE = MAX_PACKET_SIZE - MultiAntennyPacketHeader.HEADER_LENGTH - TrajectoryRequest.COUNT_LENGTH
+MAX_TRAJECTORY_CHUNK_POINTS = (
+    _TRAJECTORY_PAYLOAD_SPACE - TrajectoryRequest.ENTRY_LENGTH - TrajectoryTable.HEADER_LENGTH
+) // TrajectoryTable.POINT_LENGTH
+
+_HEARTBEAT_INTERVAL = 0.5
+_HEARTBEAT_POLL_INTERVAL = 0.005
+# Responses to rounds older than this many heartbeats are ignored
+_MAX_HEARTBEAT_AGE = 4
+_OFFLINE_TIMEOUT = 10
+_RTT_WINDOW = 32
+_RTT_ALPHA = 0.125
+_RTT_BETA = 0.25
+
+# Membership events, see HeartbeatThread.add_listener
+DEVICE_ONLINE = "online"
+DEVICE_OFFLINE = "offline"
+
 LOG = logging.getLogger("antenny.multi_client.leader")
 
 
-def create_heartbeat_request_packet(board_id: int, listen_port: int):
+def create_heartbeat_request_packet(board_id: int, listen_port: int, nonce: int):
     return MultiAntennyPacket(
             MultiAntennyPacketHeader(board_id, HEARTBEAT_PAYLOAD_TYPE, listen_port),
-            HeartbeatRequest(),
+            HeartbeatRequest(nonce, common_time_us()),
+    )
+
+
+def create_clock_sync_request_packet(board_id: int, listen_port: int):
+    return MultiAntennyPacket(
+            MultiAntennyPacketHeader(board_id, CLOCK_SYNC_REQUEST_PAYLOAD_TYPE, listen_port),
+            ClockSyncRequest(common_time_us()),
     )
 
 
 def create_move_request_packet(
+        sequence: int,
         from_board_id: int,
         to_board_id: int,
         azimuth: int,
@@ -33,10 +69,42 @@ def create_move_request_packet(
 ):
     return MultiAntennyPacket(
             MultiAntennyPacketHeader(from_board_id, MOVE_REQUEST_PAYLOAD_TYPE, listen_port),
-            MoveRequest(to_board_id, azimuth, elevation, move_at_timestamp, move_at_millis),
+            MoveRequest(sequence, to_board_id, azimuth, elevation, move_at_timestamp, move_at_millis),
     )
 
 
+def create_trajectory_request_packets(
+        from_board_id: int,
+        tables,  # type: List[Tuple[int, bytes]]
+        listen_port: int,
+):
+    """
+    Pack (board_id, table) entries into as few TrajectoryRequest packets as
+    fit in MAX_PACKET_SIZE, keeping their order.
+    """
+    packets = []
+    entries = []
+    size = 0
+    for board_id, table in tables:
+        entry_size = TrajectoryRequest.ENTRY_LENGTH + len(table)
+        if entries and (size + entry_size > _TRAJECTORY_PAYLOAD_SPACE
+                        or len(entries) >= TrajectoryRequest.MAX_ENTRIES):
+            packets.append(entries)
+            entries = []
+            size = 0
+        entries.append((board_id, table))
+        size += entry_size
+    if entries:
+        packets.append(entries)
+    return [
+        MultiAntennyPacket(
+                MultiAntennyPacketHeader(from_board_id, TRAJECTORY_REQUEST_PAYLOAD_TYPE, listen_port),
+                TrajectoryRequest(entries),
+        )
+        for entries in packets
+    ]
+
+
 class LeaderClient(Thread):
 
     def __init__(
@@ -47,7 +115,9 @@ class LeaderClient(Thread):
         super(LeaderClient, self).__init__()
         self.outbound_queue = outbound_queue
         self.inbound_queue = inbound_queue
-        self._payloads_by_packet_type = {}
+        # Created up front: recv() is called from several threads and only
+        # reads this dict, each queue being thread safe on its own
+        self._payloads_by_packet_type = {payload: Queue() for payload in PAYLOAD_TYPES.values()}
 
     def recv(
             self,
@@ -59,12 +129,14 @@ class LeaderClient(Thread):
         try:
             recv = self.inbound_queue.get(timeout=_DEFAULT_TIMEOUT)
         except Empty:
-            return None
+            # Packets sorted by an earlier call may still be waiting
+            recv = None
         while recv is not None:
-            curr_payload_type = type(recv.payload)
-            if curr_payload_type not in self._payloads_by_packet_type:
-                self._payloads_by_packet_type[curr_payload_type] = Queue()
-            self._payloads_by_packet_type[curr_payload_type].put(recv)
+            queue = self._payloads_by_packet_type.get(type(recv.payload))
+            if queue is None:
+                LOG.debug("Dropping a packet of unregistered payload {}".format(type(recv.payload)))
+            else:
+                queue.put(recv)
             try:
                 recv = self.inbound_queue.get(timeout=_DEFAULT_TIMEOUT)
             except Empty:
@@ -94,6 +166,10 @@ class UDPLeaderClient(LeaderClient):
                 socket.IPPROTO_UDP
         )
         self._mcast_send_socket.settimeout(0.01)
+        # Datagrams are received into one buffer; decoded packets copy what they keep
+        self._recv_buffer = bytearray(MAX_PACKET_SIZE)
+        self._recv_view = memoryview(self._recv_buffer)
+        self._has_recv_into = hasattr(self._mcast_send_socket, "recvfrom_into")
         self._mcast_send_socket.bind(('', listen_port))
 
     def _send(self):
@@ -101,7 +177,7 @@ class UDPLeaderClient(LeaderClient):
         Send any queued outbound messages
         """
         try:
-            message = self.outbound_queue.get()
+            message = self.outbound_queue.get_nowait()
         except Empty:
             return
         self._mcast_send_socket.sendto(message, (MULTICAST_ADDR, self._port))
@@ -113,23 +189,42 @@ class UDPLeaderClient(LeaderClient):
 
     def _recv(self):
         try:
-            raw_message, _ = self._mcast_send_socket.recvfrom(1024)
+            if self._has_recv_into:
+                length, _ = self._mcast_send_socket.recvfrom_into(self._recv_buffer)
+                raw_message = self._recv_view[:length]
+            else:
+                raw_message, _ = self._mcast_send_socket.recvfrom(MAX_PACKET_SIZE)
         except OSError:
             return
-        self.inbound_queue.put(MultiAntennyPacket.deserialize(raw_message))
+        received_at_us = common_time_us()
+        packet = MultiAntennyPacket.deserialize(raw_message)
+        packet.received_at_us = received_at_us
+        self.inbound_queue.put(packet)
 
 
 class OnlineDevice(object):
+    """
+    Liveness and heartbeat RTT of a follower. The RTT is kept as a smoothed
+    average and deviation, plus the last _RTT_WINDOW samples for percentiles,
+    so the state stays the same size however long the device is up.
+    """
 
     def __init__(
             self,
             device_id: int,
             last_online: float,
-            round_trip_times,  # type: List[float]
+            rtt: float = None,
     ):
         self.device_id = device_id
         self.last_online = last_online
-        self.round_trip_times = round_trip_times
+        self.online = True
+        self.srtt = None
+        self.rttvar = None
+        self.min_rtt = None
+        self.samples = 0
+        self._rtt_window = [0.] * _RTT_WINDOW
+        if rtt is not None:
+            self._add_sample(rtt)
 
     def __repr__(self):
         return "<Device device_id={} online={} avg RTT={}>".format(
@@ -138,30 +233,81 @@ class OnlineDevice(object):
                 self.average_rtt()
         )
 
-    def is_online(self, offline_time=10):
+    def is_online(self, offline_time=_OFFLINE_TIMEOUT):
         return common_time() - self.last_online < offline_time
 
+    def _add_sample(self, rtt: float):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+            self.min_rtt = rtt
+        else:
+            self.rttvar = (1 - _RTT_BETA) * self.rttvar + _RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - _RTT_ALPHA) * self.srtt + _RTT_ALPHA * rtt
+            self.min_rtt = min(self.min_rtt, rtt)
+        self._rtt_window[self.samples % _RTT_WINDOW] = rtt
+        self.samples += 1
+
     def add_rtt(self, new_rtt: float):
         self.last_online = common_time()
-        self.round_trip_times.append(new_rtt)
+        self._add_sample(new_rtt)
 
     def average_rtt(self):
-        return sum(self.round_trip_times) / len(self.round_trip_times)
+        """Smoothed RTT in seconds, None before the first sample."""
+        return self.srtt
+
+    def rtt_percentile(self, percentile: float):
+        """RTT percentile (0 to 100) over the last _RTT_WINDOW samples, in seconds."""
+        count = min(self.samples, _RTT_WINDOW)
+        if count == 0:
+            return None
+        window = sorted(self._rtt_window[:count])
+        return window[min(count - 1, int(percentile / 100 * count))]
 
 
 class HeartbeatThread(Thread):
+    """
+    Send a heartbeat and a clock sync request every _HEARTBEAT_INTERVAL and
+    handle the responses as they come in. RTTs are measured from the send
+    time echoed in the responses, so they do not depend on how often the
+    responses are polled. Devices going online or offline are reported to
+    the listeners registered with add_listener.
+    """
 
     def __init__(
             self,
             board_id: int,
             listen_port: int,
             client: LeaderClient,
+            interval: float = _HEARTBEAT_INTERVAL,
+            offline_timeout: float = _OFFLINE_TIMEOUT,
     ):
         super(HeartbeatThread, self).__init__()
         self.board_id = board_id
         self.client = client
         self.listen_port = listen_port
+        self.interval = interval
+        self.offline_timeout = offline_timeout
         self._online_devices = {}
+        self._clock_models = {}
+        self._listeners = []
+        self._nonce = random.getrandbits(32)
+        self._next_heartbeat = 0.
+
+    def add_listener(self, listener):
+        """
+        Register a callback called as listener(event, device) from the heartbeat
+        thread, with event DEVICE_ONLINE or DEVICE_OFFLINE.
+        """
+        self._listeners.append(listener)
+
+    def _emit(self, event: str, device: OnlineDevice):
+        LOG.info("Device {} is {}".format(device.device_id, event))
+        for listener in self._listeners:
+            try:
+                listener(event, device)
+            except Exception as e:
+                LOG.error("Membership listener failed: {}".format(e))
 
     def get_device_info(self, device_id):
         # type: (int) -> Optional[OnlineDevice]
@@ -170,33 +316,78 @@ class HeartbeatThread(Thread):
         except KeyError:
             return None
 
+    def get_clock_model(self, device_id):
+        # type: (int) -> Optional[FollowerClockModel]
+        try:
+            return self._clock_models[device_id]
+        except KeyError:
+            return None
+
+    def _handle_clock_sync(self, packet: MultiAntennyPacket):
+        response = packet.payload  # type: ClockSyncResponse
+        device_id = packet.header.board_id
+        if device_id not in self._clock_models:
+            self._clock_models[device_id] = FollowerClockModel()
+        self._clock_models[device_id].add_exchange(
+                response.leader_send_us,
+                response.follower_receive_us,
+                response.follower_send_us,
+                packet.received_at_us,
+        )
+
+    def _handle_heartbeat(self, packet: MultiAntennyPacket):
+        response = packet.payload  # type: HeartbeatResponse
+        if (self._nonce - response.nonce) & 0xFFFFFFFF >= _MAX_HEARTBEAT_AGE:
+            LOG.debug("Ignoring a stale heartbeat response from {}".format(packet.header.board_id))
+            return
+        received_at_us = packet.received_at_us
+        if received_at_us is None:
+            received_at_us = common_time_us()
+        rtt = (received_at_us - response.sent_us) / 1000000
+        device_id = packet.header.board_id
+        device = self._online_devices.get(device_id)
+        if device is None:
+            device = OnlineDevice(device_id, common_time(), rtt)
+            self._online_devices[device_id] = device
+            self._emit(DEVICE_ONLINE, device)
+            return
+        device.add_rtt(rtt)
+        if not device.online:
+            device.online = True
+            self._emit(DEVICE_ONLINE, device)
+
+    def _check_liveness(self):
+        for device in self._online_devices.values():
+            if device.online and not device.is_online(self.offline_timeout):
+                device.online = False
+                self._emit(DEVICE_OFFLINE, device)
+
     def hearbeat(self):
-        heart_beat = common_time()
-        serialized = create_heartbeat_request_packet(self.board_id, self.listen_port).serialize()
-        self.client.send(serialized)
-        delay = 0
-        while delay < 0.25:
-            time.sleep(_DEFAULT_TIMEOUT)
-            delay += _DEFAULT_TIMEOUT
+        """Start a heartbeat round."""
+        self._nonce = (self._nonce + 1) & 0xFFFFFFFF
+        self.client.send(create_heartbeat_request_packet(self.board_id, self.listen_port, self._nonce).serialize())
+        self.client.send(create_clock_sync_request_packet(self.board_id, self.listen_port).serialize())
+        self._check_liveness()
+
+    def poll(self):
+        """Handle the responses received so far, and start a round when due."""
+        recv = self.client.recv(HeartbeatResponse)
+        while recv is not None:
+            self._handle_heartbeat(recv)
             recv = self.client.recv(HeartbeatResponse)
-            while recv is not None:
-                device_id = recv.header.board_id
-                if device_id not in self._online_devices:
-                    self._online_devices[device_id] = OnlineDevice(
-                            device_id,
-                            heart_beat + delay,
-                            [delay]
-                    )
-                else:
-                    self._online_devices[device_id].add_rtt(delay)
-                recv = self.client.recv(HeartbeatResponse)
-        for device in self._online_devices.values():
-            print(device)
+        recv = self.client.recv(ClockSyncResponse)
+        while recv is not None:
+            self._handle_clock_sync(recv)
+            recv = self.client.recv(ClockSyncResponse)
+        now = common_time()
+        if now >= self._next_heartbeat:
+            self._next_heartbeat = now + self.interval
+            self.hearbeat()
 
     def run(self):
         while self.running:
-            self.hearbeat()
-            time.sleep(.5)
+            self.poll()
+            time.sleep(_HEARTBEAT_POLL_INTERVAL)
 
 
 class AntennyLeader(object):
@@ -207,17 +398,30 @@ class AntennyLeader(object):
             listen_port: int,
             leader_client: LeaderClient,
             heartbeat: HeartbeatThread,
+            delivery: ReliableDelivery = None,
     ):
         self.board_id = board_id
         self.listen_port = listen_port
         self.client = leader_client
         self.heartbeat = heartbeat
+        self.delivery = delivery if delivery is not None else ReliableDelivery(leader_client)
+        self._sequence = random.getrandbits(32)
 
     def start(self):
         self.heartbeat.start()
+        self.delivery.start()
 
     def stop(self):
         self.heartbeat.stop()
+        self.delivery.stop()
+
+    def delivery_stats(self, device_id: int) -> DeliveryStats:
+        """Move delivery latency and loss statistics of a device."""
+        return self.delivery.stats(device_id)
+
+    def _next_sequence(self) -> int:
+        self._sequence = (self._sequence + 1) & 0xFFFFFFFF
+        return self._sequence
 
     def wait_for_devices(
             self,
@@ -228,14 +432,18 @@ class AntennyLeader(object):
         LOG.info("Waiting for devices {}".format(device_ids))
         waited_for = 0
         while True:
-            if all([self.heartbeat.get_device_info(device_id)
-                    is not None for device_id in device_ids]):
+            if all([self.heartbeat.get_device_info(device_id) is not None
+                    and self.is_synced(device_id) for device_id in device_ids]):
                 break
             waited_for += _DEFAULT_TIMEOUT
             time.sleep(_DEFAULT_TIMEOUT)
             if waited_for >= max_delay:
                 raise RuntimeError("Not all devices came online within the max delay time.")
 
+    def is_synced(self, device_id: int) -> bool:
+        clock = self.heartbeat.get_clock_model(device_id)
+        return clock is not None and clock.is_synced()
+
     def move(
             self,
             device_id: int,
@@ -243,6 +451,11 @@ class AntennyLeader(object):
             elevation: int,
             move_at_timestamp: float,
     ):
+        """
+        Have a follower move at the given time, in seconds on the leader's
+        common_time() clock. The time is converted to the follower clock with
+        the model estimated over the heartbeat exchanges.
+        """
         device_info = self.heartbeat.get_device_info(device_id)  # type: Optional[OnlineDevice]
         if device_info is None:
             LOG.warning(
@@ -251,29 +464,86 @@ class AntennyLeader(object):
         if not device_info.is_online():
             LOG.warning("Not sending move command to an offline device")
             return
-        rtt_delta = device_info.average_rtt()
-        move_at = move_at_timestamp - (rtt_delta / 2)  # 1/2 full RTT delay
+        if not self.is_synced(device_id):
+            LOG.warning("Not sending move command to a device whose clock is not synchronized yet")
+            return
+        clock = self.heartbeat.get_clock_model(device_id)
+        move_at_us = clock.to_follower_us(int(move_at_timestamp * 1000000))
+        sequence = self._next_sequence()
         move_packet = create_move_request_packet(
+                sequence,
                 self.board_id,
                 device_id,
                 azimuth,
                 elevation,
-                int(move_at),
-                move_at - int(move_at),
+                move_at_us // 1000000,
+                (move_at_us % 1000000) / 1000000,
                 self.listen_port,
         )
-        self.client.send(move_packet.serialize())
-
+        self.delivery.send(
+                sequence,
+                device_id,
+                move_packet.serialize(),
+                move_at_timestamp,
+                device_info.average_rtt(),
+        )
 
-def y2k_timestamp():
-    return time.time() - 946684800.0
+    def _trajectory_tables(self, device_id: int, waypoints):
+        """
+        Split a device's waypoints into tables on the device clock. Consecutive
+        tables share a point, so the follower interpolates across the seams.
+        """
+        clock = self.heartbeat.get_clock_model(device_id)
+        tables = []
+        first = 0
+        while True:
+            chunk = waypoints[first:first + MAX_TRAJECTORY_CHUNK_POINTS]
+            times_us = [clock.to_follower_us(int(t * 1000000)) for t, _, _ in chunk]
+            points = [
+                ((time_us - times_us[0]) // 1000, azimuth, elevation)
+                for time_us, (_, azimuth, elevation) in zip(times_us, chunk)
+            ]
+            tables.append((device_id, encode_trajectory_table(times_us[0], points)))
+            first += len(chunk) - 1
+            if first + 1 >= len(waypoints):
+                return tables
+
+    def send_trajectory(self, waypoints_by_device):
+        """
+        Stream trajectories to followers, which interpolate between waypoints
+        and play them as soon as their first point is due, after anything
+        already streamed to them.
+        :param waypoints_by_device: dict of device id to lists of (time, azimuth,
+            elevation) waypoints in increasing time, in seconds on the leader's
+            common_time() clock and degrees
+        :return: number of packets sent
+        """
+        tables_by_device = []
+        for device_id, waypoints in waypoints_by_device.items():
+            if not waypoints:
+                continue
+            if not self.is_synced(device_id):
+                LOG.warning("Not sending a trajectory to device {}, its clock is not synchronized yet".format(
+                        device_id))
+                continue
+            tables_by_device.append(self._trajectory_tables(device_id, waypoints))
+        # Interleave the devices, so the first waypoints of every device go out first
+        tables = []
+        for index in range(max([len(device_tables) for device_tables in tables_by_device] or [0])):
+            tables.extend(device_tables[index] for device_tables in tables_by_device if index < len(device_tables))
+        packets = create_trajectory_request_packets(self.board_id, tables, self.listen_port)
+        for packet in packets:
+            self.client.send(packet.serialize())
+        return len(packets)
 
 
 def programmed_move_demo(device_ids, moves):
     for el, az, delay in moves:
         for device_id in device_ids:
-            leader.move(device_id, az, el, y2k_timestamp() + 1)
+            leader.move(device_id, az, el, common_time() + 1)
         time.sleep(delay)
+    for device_id in device_ids:
+        print(leader.delivery_stats(device_id))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,133 @@
+import _thread
+import logging
+import time
+
+from antenny_threading import Thread
+from multi_client.common import common_time_us
+
+try:
+    import uheapq as heapq
+except ImportError:
+    import heapq
+
+# Longest the executor sleeps before looking at the queue again, so that a
+# move scheduled ahead of the current head is not run late
+_MAX_IDLE_US = 2000
+
+LOG = logging.getLogger("antenny.multi_client.scheduler")
+
+# Fields of a scheduled move entry. Entries are lists so they can be marked
+# cancelled in place; the heap orders them by time then sequence number.
+_TIME = 0
+_ID = 1
+_AZIMUTH = 2
+_ELEVATION = 3
+_CALLBACK = 4
+_CANCELLED = 5
+
+
+class MoveScheduler(Thread):
+    """
+    Run antenna moves at given common_time_us() times from a dedicated thread,
+    so that receiving moves never blocks. Pending moves are kept in a heap
+    ordered by time; cancelled moves are only marked and are skipped once
+    they reach the head of the heap.
+    """
+
+    def __init__(self, antenna):
+        """
+        :param antenna: AxisController pair holder, typically AntennyAPI.antenna
+        """
+        super(MoveScheduler, self).__init__()
+        self.antenna = antenna
+        self._heap = []
+        self._pending = {}
+        self._next_id = 0
+        self._lock = _thread.allocate_lock()
+        self.executed = 0
+        self.max_lateness_us = 0
+
+    def schedule(self, move_at_us: int, azimuth, elevation, callback=None, replace: bool = False) -> int:
+        """
+        Queue a move
+        :param move_at_us: time to move at, on the common_time_us() clock
+        :param callback: called from the scheduler thread with the move id once it ran
+        :param replace: cancel every pending move first
+        :return: id of the move, for cancel()
+        """
+        with self._lock:
+            if replace:
+                self._cancel_all()
+            move_id = self._next_id
+            self._next_id += 1
+            entry = [move_at_us, move_id, azimuth, elevation, callback, False]
+            heapq.heappush(self._heap, entry)
+            self._pending[move_id] = entry
+        return move_id
+
+    def cancel(self, move_id: int) -> bool:
+        """Cancel a pending move, return False if it already ran or was cancelled."""
+        with self._lock:
+            entry = self._pending.pop(move_id, None)
+            if entry is None:
+                return False
+            entry[_CANCELLED] = True
+            return True
+
+    def cancel_all(self) -> int:
+        """Cancel every pending move, return how many were cancelled."""
+        with self._lock:
+            return self._cancel_all()
+
+    def _cancel_all(self) -> int:
+        count = len(self._pending)
+        for entry in self._pending.values():
+            entry[_CANCELLED] = True
+        self._pending = {}
+        # Nothing left in the heap is live
+        self._heap = []
+        return count
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _pop_due(self, now: int):
+        """
+        Pop the next live move if it is due, otherwise return the number of
+        microseconds to wait for it, or None without pending moves.
+        """
+        with self._lock:
+            while self._heap:
+                entry = self._heap[0]
+                if entry[_CANCELLED]:
+                    heapq.heappop(self._heap)
+                    continue
+                if entry[_TIME] > now:
+                    return entry[_TIME] - now
+                heapq.heappop(self._heap)
+                del self._pending[entry[_ID]]
+                return entry
+            return None
+
+    def _execute(self, entry, now: int):
+        lateness = now - entry[_TIME]
+        if lateness > self.max_lateness_us:
+            self.max_lateness_us = lateness
+        self.antenna.set_azimuth(entry[_AZIMUTH])
+        self.antenna.set_elevation(entry[_ELEVATION])
+        self.executed += 1
+        if entry[_CALLBACK] is not None:
+            entry[_CALLBACK](entry[_ID])
+
+    def run(self):
+        while self.running:
+            now = common_time_us()
+            due = self._pop_due(now)
+            if isinstance(due, list):
+                try:
+                    self._execute(due, now)
+                except Exception as e:
+                    LOG.error("Move {} failed: {}".format(due[_ID], e))
+                continue
+            wait_us = _MAX_IDLE_US if due is None else min(due, _MAX_IDLE_US)
+            time.sleep(wait_us / 1000000)
@@ -0,0 +1,42 @@
+from multi_client.protocol.constants import CLOCK_SYNC_REQUEST_PAYLOAD_TYPE, CLOCK_SYNC_RESPONSE_PAYLOAD_TYPE
+from multi_client.protocol.payload import StructPayload
+
+
+class ClockSyncRequest(StructPayload):
+    """
+    Sent by the leader along with its heartbeats. All times are integer
+    microseconds on the clock of the board that took them.
+    """
+    STRUCT_FORMAT = '!Q'
+    FIELDS = ('leader_send_us',)
+
+    def __init__(
+            self,
+            leader_send_us: int,
+    ):
+        super(ClockSyncRequest, self).__init__(CLOCK_SYNC_REQUEST_PAYLOAD_TYPE)
+        self.leader_send_us = leader_send_us
+
+
+class ClockSyncResponse(StructPayload):
+    """
+    Follower reply to a ClockSyncRequest: the leader send time it echoes, and
+    the follower times at which the request was received and the reply sent.
+    """
+    STRUCT_FORMAT = '!QQQ'
+    FIELDS = ('leader_send_us', 'follower_receive_us', 'follower_send_us')
+
+    def __init__(
+            self,
+            leader_send_us: int,
+            follower_receive_us: int,
+            follower_send_us: int,
+    ):
+        super(ClockSyncResponse, self).__init__(CLOCK_SYNC_RESPONSE_PAYLOAD_TYPE)
+        self.leader_send_us = leader_send_us
+        self.follower_receive_us = follower_receive_us
+        self.follower_send_us = follower_send_us
+
+    def __repr__(self):
+        return "<ClockSyncResponse t1={} t2={} t3={}>".format(
+                self.leader_send_us, self.follower_receive_us, self.follower_send_us)
@@ -3,3 +3,8 @@ HEARTBEAT_PAYLOAD_ACK_TYPE = 0x02
 
 MOVE_REQUEST_PAYLOAD_TYPE = 0x03
 MOVE_RESPONSE_PAYLOAD_TYPE = 0x04
+
+CLOCK_SYNC_REQUEST_PAYLOAD_TYPE = 0x05
+CLOCK_SYNC_RESPONSE_PAYLOAD_TYPE = 0x06
+
+TRAJECTORY_REQUEST_PAYLOAD_TYPE = 0x07
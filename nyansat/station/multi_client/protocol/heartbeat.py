@@ -1,28 +1,27 @@
 from multi_client.protocol.constants import HEARTBEAT_PAYLOAD_ACK_TYPE, HEARTBEAT_PAYLOAD_TYPE
-from multi_client.protocol.payload import MultiAntennyPayload
+from multi_client.protocol.payload import StructPayload
 
 
-class HeartbeatRequest(MultiAntennyPayload):
+class HeartbeatRequest(StructPayload):
+    """
+    Carries a nonce identifying the heartbeat round and the leader
+    common_time_us() at which it was sent, both echoed by the followers.
+    """
+    STRUCT_FORMAT = '!IQ'
+    FIELDS = ('nonce', 'sent_us')
 
-    def __init__(self):
+    def __init__(self, nonce: int, sent_us: int):
         super(HeartbeatRequest, self).__init__(HEARTBEAT_PAYLOAD_TYPE)
+        self.nonce = nonce
+        self.sent_us = sent_us
 
-    def serialize(self):
-        return b'heartbeat'
 
-    @classmethod
-    def deserialize(cls, payload: bytes):
-        return cls()
+class HeartbeatResponse(StructPayload):
+    """Echoes the nonce and send time of the HeartbeatRequest it answers."""
+    STRUCT_FORMAT = '!IQ'
+    FIELDS = ('nonce', 'sent_us')
 
-
-class HeartbeatResponse(MultiAntennyPayload):
-
-    def __init__(self):
+    def __init__(self, nonce: int, sent_us: int):
         super(HeartbeatResponse, self).__init__(HEARTBEAT_PAYLOAD_ACK_TYPE)
-
-    def serialize(self):
-        return b'heartbeat:ack'
-
-    @classmethod
-    def deserialize(cls, payload: bytes):
-        return cls()
+        self.nonce = nonce
+        self.sent_us = sent_us
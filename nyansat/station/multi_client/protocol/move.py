@@ -1,14 +1,18 @@
-import struct
-
 from multi_client.protocol.constants import MOVE_REQUEST_PAYLOAD_TYPE, MOVE_RESPONSE_PAYLOAD_TYPE
-from multi_client.protocol.payload import MultiAntennyPayload
+from multi_client.protocol.payload import StructPayload
 
 
-class MoveRequest(MultiAntennyPayload):
-    STRUCT_FORMAT = '!hhhid'
+class MoveRequest(StructPayload):
+    """
+    A move for one board. The sequence number, unique per leader, lets the
+    leader match the MoveResponse and the follower drop retransmissions.
+    """
+    STRUCT_FORMAT = '!Ihhhid'
+    FIELDS = ('sequence', 'board_id', 'azimuth', 'elevation', 'move_at_timestamp', 'move_at_millis')
 
     def __init__(
             self,
+            sequence: int,
             board_id: int,
             azimuth: int,
             elevation: int,
@@ -16,6 +20,7 @@ class MoveRequest(MultiAntennyPayload):
             move_at_millis: float,
     ):
         super(MoveRequest, self).__init__(MOVE_REQUEST_PAYLOAD_TYPE)
+        self.sequence = sequence
         self.board_id = board_id
         self.azimuth = azimuth
         self.elevation = elevation
@@ -23,39 +28,31 @@ class MoveRequest(MultiAntennyPayload):
         self.move_at_millis = move_at_millis
 
     def __repr__(self):
-        return "<MoveRequest device_id={} azimuth={} elevation={} move_at={}:{}>".format(
-            self.board_id, self.azimuth, self.elevation, self.move_at_timestamp,
+        return "<MoveRequest seq={} device_id={} azimuth={} elevation={} move_at={}:{}>".format(
+            self.sequence, self.board_id, self.azimuth, self.elevation, self.move_at_timestamp,
             self.move_at_millis)
 
-    def serialize(self):
-        packed = struct.pack(
-                self.STRUCT_FORMAT,
-                self.board_id,
-                self.azimuth,
-                self.elevation,
-                self.move_at_timestamp,
-                self.move_at_millis,
-        )
-        return packed
-
-    @classmethod
-    def deserialize(cls, payload: bytes):
-        return cls(*struct.unpack(MoveRequest.STRUCT_FORMAT, payload))
 
-
-class MoveResponse(MultiAntennyPayload):
-    STRUCT_FORMAT = '!b'
+class MoveResponse(StructPayload):
+    """
+    Acknowledges a MoveRequest on receipt. move_ok is False when the move was
+    rejected, e.g. because it arrived after its time.
+    """
+    STRUCT_FORMAT = '!Ib'
+    FIELDS = ('sequence', 'move_ok')
 
     def __init__(
             self,
+            sequence: int,
             move_ok: bool,
     ):
         super(MoveResponse, self).__init__(MOVE_RESPONSE_PAYLOAD_TYPE)
+        self.sequence = sequence
         self.move_ok = move_ok
 
-    def serialize(self):
-        return struct.pack(self.STRUCT_FORMAT, self.move_ok)
+    def unpack_into(self, buffer, offset: int, length: int):
+        super(MoveResponse, self).unpack_into(buffer, offset, length)
+        self.move_ok = bool(self.move_ok)
 
-    @classmethod
-    def deserialize(cls, payload: bytes):
-        return cls(bool(struct.unpack(MoveResponse.STRUCT_FORMAT, payload)[0]))
+    def __repr__(self):
+        return "<MoveResponse seq={} move_ok={}>".format(self.sequence, self.move_ok)
@@ -1,12 +1,39 @@
 import struct
 
+from multi_client.protocol.clock import ClockSyncRequest, ClockSyncResponse
 from multi_client.protocol.constants import (
+    CLOCK_SYNC_REQUEST_PAYLOAD_TYPE, CLOCK_SYNC_RESPONSE_PAYLOAD_TYPE,
     HEARTBEAT_PAYLOAD_ACK_TYPE, HEARTBEAT_PAYLOAD_TYPE,
-    MOVE_REQUEST_PAYLOAD_TYPE, MOVE_RESPONSE_PAYLOAD_TYPE,
+    MOVE_REQUEST_PAYLOAD_TYPE, MOVE_RESPONSE_PAYLOAD_TYPE, TRAJECTORY_REQUEST_PAYLOAD_TYPE,
 )
 from multi_client.protocol.heartbeat import HeartbeatRequest, HeartbeatResponse
 from multi_client.protocol.move import MoveRequest, MoveResponse
 from multi_client.protocol.payload import MultiAntennyPayload
+from multi_client.protocol.trajectory import TrajectoryRequest
+
+
+# Payload class for each payload type, see register_payload
+PAYLOAD_TYPES = {}
+
+
+def register_payload(payload_type: int, payload_class):
+    PAYLOAD_TYPES[payload_type] = payload_class
+
+
+def payload_class(payload_type: int):
+    try:
+        return PAYLOAD_TYPES[payload_type]
+    except KeyError:
+        raise ValueError("Unknown payload type: {}".format(payload_type))
+
+
+register_payload(HEARTBEAT_PAYLOAD_TYPE, HeartbeatRequest)
+register_payload(HEARTBEAT_PAYLOAD_ACK_TYPE, HeartbeatResponse)
+register_payload(MOVE_REQUEST_PAYLOAD_TYPE, MoveRequest)
+register_payload(MOVE_RESPONSE_PAYLOAD_TYPE, MoveResponse)
+register_payload(CLOCK_SYNC_REQUEST_PAYLOAD_TYPE, ClockSyncRequest)
+register_payload(CLOCK_SYNC_RESPONSE_PAYLOAD_TYPE, ClockSyncResponse)
+register_payload(TRAJECTORY_REQUEST_PAYLOAD_TYPE, TrajectoryRequest)
 
 
 class MultiAntennyPacketHeader(MultiAntennyPayload):
@@ -23,23 +50,33 @@ class MultiAntennyPacketHeader(MultiAntennyPayload):
         self.payload_type = payload_type
         self.listen_port = listen_port
 
+    @classmethod
+    def blank(cls):
+        return cls(0, 0, 0)
+
+    def packed_size(self) -> int:
+        return self.HEADER_LENGTH
+
+    def pack_into(self, buffer, offset: int) -> int:
+        struct.pack_into(self.STRUCT_FORMAT, buffer, offset, self.board_id, self.payload_type, self.listen_port)
+        return offset + self.HEADER_LENGTH
+
+    def unpack_into(self, buffer, offset: int, length: int):
+        if length < self.HEADER_LENGTH:
+            raise ValueError("Truncated packet header")
+        self.board_id, self.payload_type, self.listen_port = struct.unpack_from(self.STRUCT_FORMAT, buffer, offset)
+
     def serialize(self):
         return struct.pack(self.STRUCT_FORMAT, self.board_id, self.payload_type, self.listen_port)
 
     @classmethod
     def deserialize(cls, payload: bytes):
-        board_id, payload_type, listen_port = struct.unpack(
-                MultiAntennyPacketHeader.STRUCT_FORMAT,
-                payload[:MultiAntennyPacketHeader.HEADER_LENGTH],
-        )
-        return (
-            cls(board_id, payload_type, listen_port),
-            payload[MultiAntennyPacketHeader.HEADER_LENGTH:]
-        )
+        header = cls.blank()
+        header.unpack_into(payload, 0, len(payload))
+        return header, payload[MultiAntennyPacketHeader.HEADER_LENGTH:]
 
 
 class MultiAntennyPacket(object):
-
     def __init__(
             self,
             header: MultiAntennyPacketHeader,
@@ -47,21 +84,60 @@ class MultiAntennyPacket(object):
     ):
         self.header = header
         self.payload = payload
+        # Local common_time_us() at which the packet was received, if known
+        self.received_at_us = None
+
+    def packed_size(self) -> int:
+        return self.header.packed_size() + self.payload.packed_size()
+
+    def pack_into(self, buffer, offset: int = 0) -> int:
+        """Pack into buffer at offset, return the offset right after the packet."""
+        offset = self.header.pack_into(buffer, offset)
+        return self.payload.pack_into(buffer, offset)
 
     def serialize(self):
-        return self.header.serialize() + self.payload.serialize()
+        buffer = bytearray(self.packed_size())
+        self.pack_into(buffer)
+        return buffer
 
     @classmethod
-    def deserialize(cls, raw_payload: bytes):
-        header, payload = MultiAntennyPacketHeader.deserialize(raw_payload)
-        if header.payload_type == HEARTBEAT_PAYLOAD_TYPE:
-            payload = HeartbeatRequest.deserialize(payload)
-        elif header.payload_type == HEARTBEAT_PAYLOAD_ACK_TYPE:
-            payload = HeartbeatResponse.deserialize(payload)
-        elif header.payload_type == MOVE_REQUEST_PAYLOAD_TYPE:
-            payload = MoveRequest.deserialize(payload)
-        elif header.payload_type == MOVE_RESPONSE_PAYLOAD_TYPE:
-            payload = MoveResponse.deserialize(payload)
-        else:
-            raise ValueError("Unknown payload type: {}".format(header.payload_type))
+    def deserialize(cls, raw_payload):
+        header = MultiAntennyPacketHeader.blank()
+        header.unpack_into(raw_payload, 0, len(raw_payload))
+        payload = payload_class(header.payload_type).blank()
+        payload.unpack_into(
+                raw_payload,
+                MultiAntennyPacketHeader.HEADER_LENGTH,
+                len(raw_payload) - MultiAntennyPacketHeader.HEADER_LENGTH,
+        )
         return cls(header, payload)
+
+
+class PacketDecoder(object):
+    """
+    Decode packets without allocating: the same header, payload and packet
+    instances are decoded into every time, one payload instance per payload
+    type. A decoded packet is only valid until the next decode() call.
+    """
+
+    def __init__(self):
+        self._header = MultiAntennyPacketHeader.blank()
+        self._packets = {}
+
+    def _packet(self, payload_type: int) -> MultiAntennyPacket:
+        packet = self._packets.get(payload_type)
+        if packet is None:
+            packet = MultiAntennyPacket(self._header, payload_class(payload_type).blank())
+            self._packets[payload_type] = packet
+        return packet
+
+    def decode(self, buffer, length: int) -> MultiAntennyPacket:
+        self._header.unpack_into(buffer, 0, length)
+        packet = self._packet(self._header.payload_type)
+        packet.payload.unpack_into(
+                buffer,
+                MultiAntennyPacketHeader.HEADER_LENGTH,
+                length - MultiAntennyPacketHeader.HEADER_LENGTH,
+        )
+        packet.received_at_us = None
+        return packet
@@ -1,3 +1,6 @@
+import struct
+
+
 class MultiAntennyPayload(object):
 
     def __init__(
@@ -6,9 +9,59 @@ class MultiAntennyPayload(object):
     ):
         self.payload_type = payload_type
 
+    @classmethod
+    def blank(cls):
+        """Return an instance to decode packets into with unpack_into."""
+        raise NotImplementedError
+
+    def packed_size(self) -> int:
+        return len(self.serialize())
+
+    def pack_into(self, buffer, offset: int) -> int:
+        """Pack into buffer at offset, return the offset right after the payload."""
+        packed = self.serialize()
+        buffer[offset:offset + len(packed)] = packed
+        return offset + len(packed)
+
+    def unpack_into(self, buffer, offset: int, length: int):
+        """Decode length bytes of buffer from offset into this instance."""
+        raise NotImplementedError
+
     def serialize(self):
         raise NotImplementedError
 
     @classmethod
     def deserialize(cls, payload: bytes):
-        raise NotImplementedError
+        decoded = cls.blank()
+        decoded.unpack_into(payload, 0, len(payload))
+        return decoded
+
+
+class StructPayload(MultiAntennyPayload):
+    """
+    A payload with a fixed struct layout: FIELDS names the attributes packed
+    with STRUCT_FORMAT, in order.
+    """
+    STRUCT_FORMAT = None
+    FIELDS = ()
+
+    @classmethod
+    def blank(cls):
+        return cls(*([0] * len(cls.FIELDS)))
+
+    def packed_size(self) -> int:
+        return struct.calcsize(self.STRUCT_FORMAT)
+
+    def pack_into(self, buffer, offset: int) -> int:
+        struct.pack_into(self.STRUCT_FORMAT, buffer, offset, *[getattr(self, name) for name in self.FIELDS])
+        return offset + struct.calcsize(self.STRUCT_FORMAT)
+
+    def unpack_into(self, buffer, offset: int, length: int):
+        if length < struct.calcsize(self.STRUCT_FORMAT):
+            raise ValueError("Truncated {} payload".format(type(self).__name__))
+        values = struct.unpack_from(self.STRUCT_FORMAT, buffer, offset)
+        for index in range(len(self.FIELDS)):
+            setattr(self, self.FIELDS[index], values[index])
+
+    def serialize(self):
+        return struct.pack(self.STRUCT_FORMAT, *[getattr(self, name) for name in self.FIELDS])
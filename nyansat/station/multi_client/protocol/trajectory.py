@@ -0,0 +1,77 @@
+import struct
+
+from multi_client.protocol.constants import TRAJECTORY_REQUEST_PAYLOAD_TYPE
+from multi_client.protocol.payload import MultiAntennyPayload
+
+
+class TrajectoryRequest(MultiAntennyPayload):
+    """
+    Waypoints for one or more boards, each as a packed TrajectoryTable (see
+    trajectory.trajectory) whose start time is on that board's clock. Angles
+    are in hundredths of a degree and followers interpolate between points.
+
+    Layout: entry count (uint8), then per entry board id (uint16), table
+    length (uint16) and the table itself.
+    """
+    COUNT_FORMAT = '!B'
+    COUNT_LENGTH = 1
+    ENTRY_FORMAT = '!HH'
+    ENTRY_LENGTH = 4
+    MAX_ENTRIES = 0xFF
+
+    def __init__(self, entries):
+        """
+        :param entries: list of (board_id, packed table) in playing order
+        """
+        super(TrajectoryRequest, self).__init__(TRAJECTORY_REQUEST_PAYLOAD_TYPE)
+        self.entries = entries
+
+    def __repr__(self):
+        return "<TrajectoryRequest boards={}>".format([board_id for board_id, _ in self.entries])
+
+    def tables_for(self, board_id: int):
+        return [table for entry_board_id, table in self.entries if entry_board_id == board_id]
+
+    @classmethod
+    def blank(cls):
+        return cls([])
+
+    def packed_size(self) -> int:
+        size = self.COUNT_LENGTH
+        for _, table in self.entries:
+            size += self.ENTRY_LENGTH + len(table)
+        return size
+
+    def pack_into(self, buffer, offset: int) -> int:
+        struct.pack_into(self.COUNT_FORMAT, buffer, offset, len(self.entries))
+        offset += self.COUNT_LENGTH
+        for board_id, table in self.entries:
+            struct.pack_into(self.ENTRY_FORMAT, buffer, offset, board_id, len(table))
+            offset += self.ENTRY_LENGTH
+            buffer[offset:offset + len(table)] = table
+            offset += len(table)
+        return offset
+
+    def unpack_into(self, buffer, offset: int, length: int):
+        end = offset + length
+        if length < self.COUNT_LENGTH:
+            raise ValueError("Truncated trajectory request")
+        count = struct.unpack_from(self.COUNT_FORMAT, buffer, offset)[0]
+        offset += self.COUNT_LENGTH
+        entries = []
+        for _ in range(count):
+            if offset + self.ENTRY_LENGTH > end:
+                raise ValueError("Truncated trajectory request")
+            board_id, table_length = struct.unpack_from(self.ENTRY_FORMAT, buffer, offset)
+            offset += self.ENTRY_LENGTH
+            if offset + table_length > end:
+                raise ValueError("Truncated trajectory request")
+            # Copied, the receive buffer is reused for the next packet
+            entries.append((board_id, bytes(buffer[offset:offset + table_length])))
+            offset += table_length
+        self.entries = entries
+
+    def serialize(self):
+        buffer = bytearray(self.packed_size())
+        self.pack_into(buffer, 0)
+        return bytes(buffer)
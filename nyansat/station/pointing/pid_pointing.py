@@ -0,0 +1,169 @@
+import logging
+import time
+
+from PID import PID
+
+from antenny_threading import Thread
+from multi_client.common import common_time_us
+
+# Consecutive in-tolerance control ticks needed to call the antenna settled
+_SETTLE_TICKS = 5
+# Largest correction, in degrees, the PID may add to the target servo angle
+_MAX_CORRECTION = 90.
+
+LOG = logging.getLogger('antenny.pointing')
+
+
+def _wrap_degrees(angle: float) -> float:
+    """Wrap an angle difference to [-180, 180)."""
+    return (angle + 180.) % 360. - 180.
+
+
+class PidAxis(object):
+    """
+    Closed-loop control of one axis: the servo is commanded to the target
+    angle plus a PID correction computed from the IMU reading, so that the
+    measured angle converges on the target whatever the servo linearity.
+    """
+
+    def __init__(
+            self,
+            axis,  # type: AxisController
+            imu_axis: int,
+            kp: float,
+            ki: float,
+            kd: float,
+            wraps: bool = False,
+    ):
+        """
+        :param axis: AxisController driving the servo
+        :param imu_axis: index of the matching angle in ImuController.euler()
+        :param kp: proportional gain
+        :param ki: integral gain, in 1/s
+        :param kd: derivative gain, in s
+        :param wraps: True for an axis measured modulo 360 degrees (heading)
+        """
+        self.axis = axis
+        self.imu_axis = imu_axis
+        self.wraps = wraps
+        self.target = None
+        self.error = 0.
+        self._pid = PID(kp, ki, kd, setpoint=0., sample_time=None,
+                        output_limits=(-_MAX_CORRECTION, _MAX_CORRECTION))
+
+    def set_target(self, target: float):
+        self.target = target
+        self._pid.reset()
+
+    def update(self, euler: tuple, dt: float) -> float:
+        """
+        Run one control step
+        :param euler: latest ImuController.euler() reading
+        :param dt: seconds since the previous step
+        :return: pointing error in degrees after this step's measurement
+        """
+        error = self.target - euler[self.imu_axis]
+        if self.wraps:
+            error = _wrap_degrees(error)
+        self.error = error
+        # simple-pid works on setpoint - input, with a zero setpoint that is the error itself
+        correction = self._pid(-error, dt=dt)
+        self.axis.set_motor_position(self.target + correction, smooth=False)
+        return error
+
+
+class PidPointingController(Thread):
+    """
+    Run the azimuth and elevation PID loops at a fixed control rate, and keep
+    track of how long each new target took to settle and of the mean error
+    once settled.
+    """
+
+    def __init__(
+            self,
+            imu,  # type: ImuController
+            azimuth: PidAxis,
+            elevation: PidAxis,
+            rate: float,
+            tolerance: float,
+    ):
+        """
+        :param imu: IMU giving the measured antenna orientation
+        :param azimuth: azimuth control loop
+        :param elevation: elevation control loop
+        :param rate: control rate in Hz
+        :param tolerance: pointing error in degrees under which an axis counts as on target
+        """
+        super(PidPointingController, self).__init__()
+        self._imu = imu
+        self._axes = (azimuth, elevation)
+        self._period_us = int(1000000 / rate)
+        self._tolerance = tolerance
+        self._target_us = None
+        self._settle_us = None
+        self._in_tolerance_ticks = 0
+        self._settled_error_sum = [0., 0.]
+        self._settled_ticks = 0
+
+    def set_target(self, azimuth: float, elevation: float):
+        """Point at a new target; settle statistics restart from now."""
+        azimuth_axis, elevation_axis = self._axes
+        azimuth_axis.set_target(azimuth)
+        elevation_axis.set_target(elevation)
+        self._target_us = common_time_us()
+        self._settle_us = None
+        self._in_tolerance_ticks = 0
+        self._settled_error_sum = [0., 0.]
+        self._settled_ticks = 0
+
+    def is_settled(self) -> bool:
+        return self._settle_us is not None
+
+    def status(self) -> dict:
+        """
+        Report the current target, the last error of each axis, the time in ms
+        the current target took to settle (None until settled) and the mean
+        absolute error of each axis since settling.
+        """
+        azimuth_axis, elevation_axis = self._axes
+        steady_state_error = None
+        if self._settled_ticks:
+            steady_state_error = [error / self._settled_ticks for error in self._settled_error_sum]
+        settle_time_ms = None
+        if self._settle_us is not None:
+            settle_time_ms = (self._settle_us - self._target_us) // 1000
+        return {
+            "target": [azimuth_axis.target, elevation_axis.target],
+            "error": [azimuth_axis.error, elevation_axis.error],
+            "settle_time_ms": settle_time_ms,
+            "steady_state_error": steady_state_error,
+        }
+
+    def _record(self, errors, now_us: int):
+        if self._settle_us is None:
+            if all(abs(error) <= self._tolerance for error in errors):
+                self._in_tolerance_ticks += 1
+            else:
+                self._in_tolerance_ticks = 0
+            if self._in_tolerance_ticks >= _SETTLE_TICKS:
+                self._settle_us = now_us
+                LOG.info("Settled in {} ms".format((now_us - self._target_us) // 1000))
+            return
+        for i, error in enumerate(errors):
+            self._settled_error_sum[i] += abs(error)
+        self._settled_ticks += 1
+
+    def run(self):
+        LOG.info("Closed-loop pointing started")
+        last_us = common_time_us()
+        while self.running:
+            now_us = common_time_us()
+            if self._target_us is not None:
+                euler = self._imu.euler()
+                dt = max(now_us - last_us, 1) / 1000000
+                errors = [axis.update(euler, dt) for axis in self._axes]
+                self._record(errors, now_us)
+            last_us = now_us
+            elapsed_us = common_time_us() - now_us
+            time.sleep(max(self._period_us - elapsed_us, 0) / 1000000)
+        LOG.info("Closed-loop pointing stopped")
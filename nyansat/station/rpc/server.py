@@ -0,0 +1,281 @@
+"""
+JSON-lines RPC server exposing AntennyAPI methods.
+
+Each request is one JSON object per line:
+    {"id": 1, "method": "antenna.set_azimuth", "params": [45.0]}
+and gets exactly one reply line, in request order:
+    {"id": 1, "result": 45.0}    or    {"id": 1, "error": "RuntimeError(...)"}
+A line may also hold a JSON list of requests, answered by a list of replies.
+Requests can be pipelined: clients do not have to wait for a reply before
+sending the next request. Only the AntennyAPI methods listed in
+EXPOSED_METHODS can be called.
+
+TCP clients must first authenticate with the shared secret set in the
+'rpc_secret' config value:
+    {"id": 0, "method": "rpc.auth", "params": ["secret"]}
+"""
+import errno
+import logging
+import socket
+import sys
+
+from antenny_threading import Thread
+
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+EXIT_METHOD = "rpc.exit"
+PING_METHOD = "rpc.ping"
+AUTH_METHOD = "rpc.auth"
+DEFAULT_RPC_PORT = 31338
+_ACCEPT_TIMEOUT = 0.5
+# Receive timeout of a connection, how often the server checks it is still running
+_READ_TIMEOUT = 0.5
+# Clients silent for longer are dropped, so a half-open connection cannot hold the server
+_IDLE_TIMEOUT = 30.
+_RECV_SIZE = 512
+_MAX_LINE_LENGTH = 4096
+
+# AntennyAPI methods callable over RPC, must cover the calls of AntennyRpcClient
+# in nyansat/host/shell/rpc_client.py
+EXPOSED_METHODS = (
+    "is_safemode",
+    "config.get",
+    "imu.get_calibration_status",
+    "motor_test",
+    "antenna.start_motion",
+    "antenna.set_azimuth",
+    "antenna.set_elevation",
+    "point",
+    "stop_pointing",
+    "pointing_status",
+    "play_trajectory",
+    "stop_trajectory",
+    "is_playing_trajectory",
+)
+# The serial link already gives full access to the REPL, it may also edit the config
+SERIAL_METHODS = EXPOSED_METHODS + ("config.set",)
+
+LOG = logging.getLogger('antenny.rpc')
+
+
+def _to_json_value(value):
+    """Keep JSON-native results as they are, stringify everything else like the REPL would."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_to_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): _to_json_value(item) for key, item in value.items()}
+    return str(value)
+
+
+class RpcDispatcher(object):
+    """
+    Resolve dotted method names against an AntennyAPI object and call them.
+    Only the method names given are exposed, EXPOSED_METHODS by default.
+    """
+
+    def __init__(self, api, methods=EXPOSED_METHODS):
+        self._api = api
+        self._methods = set(methods)
+
+    def _resolve(self, method: str):
+        if method not in self._methods:
+            raise AttributeError("Method '{}' is not exposed".format(method))
+        target = self._api
+        for name in method.split("."):
+            target = getattr(target, name)
+        if not callable(target):
+            raise AttributeError("'{}' is not callable".format(method))
+        return target
+
+    def dispatch(self, request: dict) -> dict:
+        request_id = request.get("id")
+        method = request.get("method", "")
+        try:
+            if method == PING_METHOD:
+                result = True
+            else:
+                result = self._resolve(method)(*request.get("params", ()))
+            return {"id": request_id, "result": _to_json_value(result)}
+        except Exception as e:
+            LOG.debug("RPC {} failed: {}".format(method, repr(e)))
+            return {"id": request_id, "error": repr(e)}
+
+    def handle_line(self, line):
+        """
+        Handle one request line, return the reply line and whether the client asked to exit.
+        """
+        try:
+            request = json.loads(line)
+        except ValueError:
+            return json.dumps({"id": None, "error": "Malformed request"}), False
+        if isinstance(request, list):
+            replies = [self.dispatch(item) for item in request]
+            exit_requested = any(item.get("method") == EXIT_METHOD for item in request)
+            return json.dumps(replies), exit_requested
+        exit_requested = request.get("method") == EXIT_METHOD
+        if exit_requested:
+            return json.dumps({"id": request.get("id"), "result": True}), True
+        return json.dumps(self.dispatch(request)), False
+
+
+def _authenticate(line, secret: str):
+    """
+    Check the first request of a connection, return the reply line and whether
+    the client is authenticated.
+    """
+    try:
+        request = json.loads(line)
+        authenticated = (
+            isinstance(request, dict)
+            and request.get("method") == AUTH_METHOD
+            and list(request.get("params", ())) == [secret]
+        )
+        request_id = request.get("id") if isinstance(request, dict) else None
+    except ValueError:
+        authenticated = False
+        request_id = None
+    if authenticated:
+        return json.dumps({"id": request_id, "result": True}), True
+    return json.dumps({"id": request_id, "error": "Authentication required"}), False
+
+
+def serve_stream(dispatcher: RpcDispatcher, readline, write, secret: str = None):
+    """
+    Serve requests until the client exits or the stream is closed.
+    :param readline: callable returning the next request line, empty at end of stream
+    :param write: callable sending one reply line (str, without line ending)
+    :param secret: if set, the first request must be rpc.auth with this secret,
+        the stream is closed otherwise
+    """
+    authenticated = secret is None
+    while True:
+        line = readline()
+        if not line:
+            return
+        if isinstance(line, bytes):
+            line = line.decode()
+        line = line.strip()
+        if not line:
+            continue
+        if not authenticated:
+            reply, authenticated = _authenticate(line, secret)
+            write(reply)
+            if not authenticated:
+                return
+            continue
+        reply, exit_requested = dispatcher.handle_line(line)
+        write(reply)
+        if exit_requested:
+            return
+
+
+def serve_stdio(api):
+    """
+    Serve requests over the serial link. Meant to be started from the raw REPL
+    by the host; returns (and hands the REPL back) once the host sends rpc.exit.
+    """
+    def write(reply):
+        sys.stdout.write(reply)
+        sys.stdout.write("\n")
+
+    serve_stream(RpcDispatcher(api, SERIAL_METHODS), sys.stdin.readline, write)
+
+
+def _is_timeout(error: OSError) -> bool:
+    # CPython raises socket.timeout without errno, MicroPython OSError(ETIMEDOUT/EAGAIN)
+    return (
+        isinstance(error, getattr(socket, "timeout", ()))
+        or (error.args and error.args[0] in (errno.ETIMEDOUT, errno.EAGAIN))
+    )
+
+
+class _ConnectionReader(object):
+    """
+    Line reader over a connection with a receive timeout. readline() reports
+    the end of the stream once the server stops or the client stayed silent
+    for _IDLE_TIMEOUT.
+    """
+
+    def __init__(self, server, connection):
+        self._server = server
+        self._connection = connection
+        self._buffer = b""
+
+    def readline(self) -> bytes:
+        idle = 0.
+        while True:
+            end = self._buffer.find(b"\n")
+            if end >= 0:
+                line = self._buffer[:end + 1]
+                self._buffer = self._buffer[end + 1:]
+                return line
+            if len(self._buffer) > _MAX_LINE_LENGTH:
+                LOG.warning("RPC request too long, dropping the client")
+                return b""
+            if not self._server.running or idle >= _IDLE_TIMEOUT:
+                return b""
+            try:
+                chunk = self._connection.recv(_RECV_SIZE)
+            except OSError as e:
+                if not _is_timeout(e):
+                    raise
+                idle += _READ_TIMEOUT
+                continue
+            if not chunk:
+                return b""
+            idle = 0.
+            self._buffer += chunk
+
+
+class RpcTcpServer(Thread):
+    """
+    Serve RPC requests to authenticated TCP clients, one connection at a time.
+    """
+
+    def __init__(
+            self,
+            dispatcher: RpcDispatcher,
+            secret: str,
+            port: int = DEFAULT_RPC_PORT,
+    ):
+        """
+        :param secret: shared secret clients authenticate with, required
+        """
+        if not secret:
+            raise ValueError("The RPC server needs a shared secret, set 'rpc_secret'")
+        super(RpcTcpServer, self).__init__()
+        self._dispatcher = dispatcher
+        self._secret = secret
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(('', port))
+        self._socket.listen(1)
+        self._socket.settimeout(_ACCEPT_TIMEOUT)
+        self.port = port
+
+    def run(self):
+        LOG.info("Serving RPC on port {}".format(self.port))
+        while self.running:
+            try:
+                connection, address = self._socket.accept()
+            except OSError:
+                continue
+            LOG.info("RPC client connected from {}".format(address))
+            connection.settimeout(_READ_TIMEOUT)
+            reader = _ConnectionReader(self, connection)
+
+            def write(reply):
+                connection.sendall(reply.encode() + b"\n")
+
+            try:
+                serve_stream(self._dispatcher, reader.readline, write, self._secret)
+            except OSError as e:
+                LOG.info("RPC client disconnected: {}".format(e))
+            finally:
+                connection.close()
+        self._socket.close()
@@ -0,0 +1,162 @@
+"""
+Cooperative runtime: run the station services as tasks of a single
+uasyncio event loop (asyncio on CPython) instead of one thread each.
+
+Services expose step(), one iteration of their thread's run() loop, and
+attach(runtime), which schedules their steps here. Periodic services are
+stepped on their own interval. Sockets are made non blocking and their
+owner is called when they become readable: through loop.add_reader() on
+CPython, and on MicroPython from a task waiting on the socket in uasyncio's
+IO queue, so nothing runs while no datagram arrives.
+"""
+import logging
+
+try:
+    import uasyncio as asyncio
+    from uasyncio import core as _asyncio_core
+except ImportError:
+    import asyncio
+    _asyncio_core = None
+
+LOG = logging.getLogger("antenny.runtime")
+
+# How often the main task checks for stop(), which may be called from any thread
+_STOP_CHECK_INTERVAL = 0.5
+_FOLLOW_RETRY_INTERVAL = 1.
+
+
+class _Readable(object):
+    """
+    Awaitable completing once a socket is readable. uasyncio has no public
+    way to wait on a datagram socket; this is how its Stream.read() waits.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+
+    def __iter__(self):
+        yield _asyncio_core._io_queue.queue_read(self._sock)
+
+    __await__ = __iter__
+
+
+class Runtime(object):
+
+    def __init__(self):
+        self._readers = {}
+        self._coroutines = []
+        self._tasks = []
+        self._loop = None
+        self.running = False
+
+    def add_reader(self, sock, callback):
+        """Call callback() from the event loop whenever sock is readable."""
+        sock.setblocking(False)
+        self._readers[sock] = callback
+        if self.running:
+            self._start_reader(sock, callback)
+
+    def remove_reader(self, sock):
+        self._readers.pop(sock, None)
+        if self._loop is not None and hasattr(self._loop, "remove_reader"):
+            self._loop.remove_reader(sock)
+
+    def _start_reader(self, sock, callback):
+        if hasattr(self._loop, "add_reader"):
+            self._loop.add_reader(sock, self._call, callback)
+        else:
+            self._tasks.append(asyncio.create_task(self._read(sock, callback)))
+
+    async def _read(self, sock, callback):
+        while self.running and sock in self._readers:
+            await _Readable(sock)
+            if sock in self._readers:
+                self._call(callback)
+
+    @staticmethod
+    def _call(callback):
+        try:
+            callback()
+        except Exception as e:
+            LOG.error("{} failed: {}".format(callback, e))
+
+    def spawn(self, coroutine):
+        """Run a coroutine as a task once the runtime runs."""
+        if self.running:
+            self._tasks.append(asyncio.create_task(coroutine))
+        else:
+            self._coroutines.append(coroutine)
+
+    def every(self, interval: float, callback):
+        """Call callback() every interval seconds."""
+        self.spawn(self._every(interval, callback))
+
+    async def _every(self, interval: float, callback):
+        while self.running:
+            self._call(callback)
+            await asyncio.sleep(interval)
+
+    async def _main(self):
+        self._loop = asyncio.get_event_loop()
+        self.running = True
+        for sock, callback in self._readers.items():
+            self._start_reader(sock, callback)
+        for coroutine in self._coroutines:
+            self._tasks.append(asyncio.create_task(coroutine))
+        self._coroutines = []
+        while self.running:
+            await asyncio.sleep(_STOP_CHECK_INTERVAL)
+        for sock in list(self._readers):
+            if hasattr(self._loop, "remove_reader"):
+                self._loop.remove_reader(sock)
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def run(self):
+        """Run the services until stop() is called."""
+        asyncio.run(self._main())
+
+    def stop(self):
+        """Stop the runtime, within _STOP_CHECK_INTERVAL."""
+        self.running = False
+
+
+async def _follow(runtime: Runtime, node, leader_id: int):
+    while runtime.running and not node.follow(leader_id):
+        await asyncio.sleep(_FOLLOW_RETRY_INTERVAL)
+
+
+def main(api, board_id: int = None, leader_id: int = 0x42):
+    """
+    Run the services of an AntennyAPI created with start=False, and the
+    follower node if board_id is given, on the cooperative runtime.
+    """
+    from antenny_threading import Queue
+    from multi_client.follower import AntennyFollowerNode, MCAST_PORT, UDPFollowerClient
+
+    runtime = Runtime()
+    api.attach(runtime)
+    node = None
+    if board_id is not None:
+        node = AntennyFollowerNode(board_id, UDPFollowerClient(Queue(), Queue(), MCAST_PORT), api)
+        node.attach(runtime)
+        runtime.spawn(_follow(runtime, node, leader_id))
+    try:
+        runtime.run()
+    finally:
+        if node is not None:
+            node.move_scheduler.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--board-id', type=int, default=None)
+    parser.add_argument('--leader-id', type=int, default=0x42)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG)
+    from antenny import mock_antenna_api_factory
+
+    main(mock_antenna_api_factory(start=False), args.board_id, args.leader_id)
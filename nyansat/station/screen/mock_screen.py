@@ -1,9 +1,12 @@
 import logging
 
-from antenny_threading import Thread, Queue
+from antenny_threading import Empty, Thread, Queue
 from screen.screen import ScreenController
 
 LOG = logging.getLogger('antenny.mock_screen')
+# Longest wait for a value, only bounds how long stop() takes
+_DISPLAY_TIMEOUT = 0.5
+_REFRESH_INTERVAL = 0.1
 
 
 class MockScreenController(ScreenController, Thread):
@@ -16,14 +19,32 @@ class MockScreenController(ScreenController, Thread):
     ):
         Thread.__init__(self)
         self.display_queue = display_queue
+        self._previously_displayed = None
 
     def run(self):
-        previously_displayed = None
         while self.running:
-            newly_displayed = self.display_queue.get()
-            if newly_displayed != previously_displayed:
-                self._display(newly_displayed)
-            previously_displayed = newly_displayed
+            try:
+                newly_displayed = self.display_queue.get(timeout=_DISPLAY_TIMEOUT)
+            except Empty:
+                continue
+            self._show(newly_displayed)
+
+    def step(self):
+        while True:
+            try:
+                newly_displayed = self.display_queue.get_nowait()
+            except Empty:
+                return
+            self._show(newly_displayed)
+
+    def attach(self, runtime):
+        """Display from a runtime.Runtime task instead of the thread."""
+        runtime.every(_REFRESH_INTERVAL, self.step)
+
+    def _show(self, newly_displayed):
+        if newly_displayed != self._previously_displayed:
+            self._display(newly_displayed)
+        self._previously_displayed = newly_displayed
 
     def _display(self, data) -> None:
         LOG.info(data)
@@ -36,8 +36,23 @@ class MockTelemetrySender(Thread):
                 data = self._update_queue.get(timeout=_DEFAULT_TIMEOUT)
             except Empty:
                 continue
-            print("sending telemetry!!")
-            self._socket.sendto(json.dumps(data).encode('utf-8'), self._recipient_address)
+            self._send(data)
+
+    def step(self):
+        while True:
+            try:
+                data = self._update_queue.get_nowait()
+            except Empty:
+                return
+            self._send(data)
+
+    def attach(self, runtime):
+        """Send updates from a runtime.Runtime task instead of the thread."""
+        runtime.every(_DEFAULT_TIMEOUT, self.step)
+
+    def _send(self, data: dict):
+        print("sending telemetry!!")
+        self._socket.sendto(json.dumps(data).encode('utf-8'), self._recipient_address)
 
     def update(self, data: dict):
         self._update_queue.put(data)
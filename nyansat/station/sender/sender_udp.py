@@ -6,6 +6,8 @@ from antenny_threading import Thread
 from imu.mock_imu import MockImuController
 from gps.gps import GPSController
 from imu.imu import ImuController
+from multi_client.common import common_time_us
+from sender.telemetry_record import TelemetryBatch, gps_degrees, gps_speed
 
 try:
     import utime as time
@@ -29,6 +31,8 @@ INADDR_ANY = 0
 MAX_MESSAGE_SIZE = 1024
 
 DEFAULT_POLL_DELAY = 0.001
+# Longest time a record waits in a binary batch before the datagram is sent
+DEFAULT_MAX_LATENCY = 0.2
 
 
 class AbstractTelemetrySender(Thread, TelemetrySender):
@@ -46,10 +50,32 @@ class AbstractTelemetrySender(Thread, TelemetrySender):
 
     def run(self):
         while self.running:
-            telemetry = self._fetch_telemetry_data()
-            self._send_message(telemetry)
+            self.step()
             time.sleep(self._interval)
 
+    def step(self):
+        self._record()
+
+    def attach(self, runtime):
+        """Take samples from a runtime.Runtime task instead of the thread."""
+        runtime.every(self._interval, self.step)
+
+    def _record(self):
+        """
+        Take one telemetry sample and send it, or queue it for sending.
+        """
+        self._send_message(self._fetch_telemetry_data())
+
+    def _antenna_position(self):
+        """
+        Return (azimuth, elevation) from the IMU, or None without IMU data.
+        """
+        imu_position = self._imu_controller.euler()
+        if imu_position is None:
+            return None
+        # TODO: these values need to be chosen based on a configuration index
+        return imu_position[1], imu_position[0]
+
     def _fetch_telemetry_data(self):
         """
         Format & enqueu teleme
@@ -58,22 +84,20 @@ class AbstractTelemetrySender(Thread, TelemetrySender):
             data = {"time": time.ticks_ms()}
         else:
             data = {"time": time.time()}
-        imu_position = self._imu_controller.euler()
-        if imu_position is not None:
-            # TODO: these values need to be chosen based on a configuration index
+        antenna_position = self._antenna_position()
+        if antenna_position is not None:
             data.update({
-                "azimuth": imu_position[1],
-                "elevation": imu_position[0],
-                # "z": imu_position[2],
+                "azimuth": antenna_position[0],
+                "elevation": antenna_position[1],
             })
         gps_status = self._gps_controller.get_status()
         if gps_status is not None:
             data.update({
                 "gps_valid": gps_status.valid,
-                "coordinates_lng": gps_status.longitude,
-                "coordinates_lat": gps_status.latitude,
+                "coordinates_lng": gps_degrees(gps_status.longitude),
+                "coordinates_lat": gps_degrees(gps_status.latitude),
                 "altitude": gps_status.altitude,
-                "speed": gps_status.speed,
+                "speed": gps_speed(gps_status.speed),
             })
         return data
 
@@ -94,7 +118,9 @@ def socket_inet_aton(ip_address: str):
 
 class UDPTelemetrySender(AbstractTelemetrySender):
     """
-    UDP multicast implementation of a telemetry sender.
+    UDP multicast implementation of a telemetry sender. By default samples are
+    packed as binary records (see sender.telemetry_record), several to a
+    datagram; with binary=False every sample is sent on its own as JSON.
     """
 
     def __init__(
@@ -102,13 +128,29 @@ class UDPTelemetrySender(AbstractTelemetrySender):
             broadcast_port: int,
             gps_controller: GPSController,
             imu_controller: ImuController,
-            interval: float = 0.2
+            interval: float = 0.2,
+            binary: bool = True,
+            station_id: int = 0,
+            max_latency: float = DEFAULT_MAX_LATENCY,
     ):
         super(UDPTelemetrySender, self).__init__(gps_controller, imu_controller, interval)
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._socket.bind(('', broadcast_port))
         self._port = broadcast_port
+        self._batch = TelemetryBatch(station_id, MAX_MESSAGE_SIZE) if binary else None
+        self._max_latency_us = int(max_latency * 1000000)
+        self._batch_started_us = 0
+
+    def _record(self):
+        if self._batch is None:
+            return super(UDPTelemetrySender, self)._record()
+        now_us = common_time_us()
+        if self._batch.count == 0:
+            self._batch_started_us = now_us
+        self._batch.add(now_us, self._antenna_position(), self._gps_controller.get_status())
+        if self._batch.is_full() or now_us - self._batch_started_us >= self._max_latency_us:
+            self._socket.sendto(self._batch.take(), (MCAST_GRP, self._port))
 
     def _send_message(self, message: dict):
         self._socket.sendto(json.dumps(message).encode('utf8'), (MCAST_GRP, self._port))
@@ -0,0 +1,113 @@
+import struct
+
+# Datagram layout, must match nyansat/host/telemetry.py:
+#   header: magic, format version, record count, station id, batch sequence number
+#   records: time (board epoch, us), azimuth, elevation, latitude and longitude
+#            (1e-7 degrees), altitude (m), speed, flags
+TELEMETRY_MAGIC = b"NT"
+TELEMETRY_VERSION = 1
+HEADER_FORMAT = '!2sBBHI'
+HEADER_LENGTH = struct.calcsize(HEADER_FORMAT)
+RECORD_FORMAT = '!QffiiffB'
+RECORD_LENGTH = struct.calcsize(RECORD_FORMAT)
+
+FLAG_IMU = 0x01
+FLAG_GPS = 0x02
+FLAG_GPS_VALID = 0x04
+
+_NAN = float('nan')
+
+
+def gps_degrees(value):
+    """
+    Convert a micropyGPS coordinate ([degrees, minutes, hemisphere]) to signed
+    decimal degrees. Plain numbers are returned unchanged.
+    """
+    if isinstance(value, (list, tuple)):
+        degrees = value[0] + value[1] / 60
+        if len(value) > 2 and value[2] in ('S', 'W'):
+            degrees = -degrees
+        return degrees
+    return value
+
+
+def gps_speed(value):
+    """Convert a micropyGPS speed ([knots, mph, km/h]) to m/s. Plain numbers are returned unchanged."""
+    if isinstance(value, (list, tuple)):
+        return value[2] / 3.6
+    return value
+
+
+class TelemetryBatch(object):
+    """
+    Fixed-layout telemetry records accumulated in a preallocated datagram
+    buffer. Records are packed in place as they are added; the header is
+    filled in when the datagram is taken.
+    """
+
+    def __init__(self, station_id: int, max_size: int):
+        self.station_id = station_id
+        self.capacity = min((max_size - HEADER_LENGTH) // RECORD_LENGTH, 0xFF)
+        self.sequence = 0
+        self.count = 0
+        self._buffer = bytearray(HEADER_LENGTH + self.capacity * RECORD_LENGTH)
+        self._view = memoryview(self._buffer)
+
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+    def add(self, time_us, imu_position, gps_status):
+        """
+        Pack one record
+        :param time_us: board time in microseconds
+        :param imu_position: (azimuth, elevation) or None without IMU data
+        :param gps_status: GPSStatus or None without GPS data
+        """
+        flags = 0
+        azimuth = elevation = altitude = speed = _NAN
+        latitude = longitude = 0
+        if imu_position is not None:
+            flags |= FLAG_IMU
+            azimuth, elevation = imu_position
+        if gps_status is not None:
+            flags |= FLAG_GPS
+            if gps_status.valid:
+                flags |= FLAG_GPS_VALID
+            latitude = int(gps_degrees(gps_status.latitude) * 10000000)
+            longitude = int(gps_degrees(gps_status.longitude) * 10000000)
+            altitude = gps_status.altitude
+            speed = gps_speed(gps_status.speed)
+        struct.pack_into(
+            RECORD_FORMAT,
+            self._buffer,
+            HEADER_LENGTH + self.count * RECORD_LENGTH,
+            time_us,
+            azimuth,
+            elevation,
+            latitude,
+            longitude,
+            altitude,
+            speed,
+            flags,
+        )
+        self.count += 1
+
+    def take(self):
+        """
+        Return the datagram holding the records added so far and start a new
+        batch. The returned view is only valid until the next add.
+        """
+        struct.pack_into(
+            HEADER_FORMAT,
+            self._buffer,
+            0,
+            TELEMETRY_MAGIC,
+            TELEMETRY_VERSION,
+            self.count,
+            self.station_id,
+            self.sequence,
+        )
+        datagram = self._view[:HEADER_LENGTH + self.count * RECORD_LENGTH]
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        self.count = 0
+        return datagram
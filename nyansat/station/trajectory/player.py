@@ -0,0 +1,94 @@
+import _thread
+import logging
+import time
+
+from antenny_threading import Thread
+from multi_client.common import common_time_us
+from trajectory.trajectory import TrajectoryTable
+
+_DEFAULT_INTERVAL = 0.05
+_DEFAULT_DEADBAND = 0.05
+_MAX_IDLE_SLEEP = 1.
+
+LOG = logging.getLogger('antenny.trajectory')
+
+
+class TrajectoryPlayer(Thread):
+    """
+    Drive the antenna along a TrajectoryTable, interpolating against the board
+    clock. Further tables can be queued with append(): each one takes over
+    once its start time is reached. The thread exits on its own once the end
+    of the last table is reached, after which append() refuses tables.
+    """
+
+    def __init__(
+            self,
+            antenna,  # type: AntennaController
+            table: TrajectoryTable,
+            interval: float = _DEFAULT_INTERVAL,
+            deadband: float = _DEFAULT_DEADBAND,
+    ):
+        super(TrajectoryPlayer, self).__init__()
+        self._antenna = antenna
+        self._table = table
+        self._queued = []
+        self._lock = _thread.allocate_lock()
+        self._finished = False
+        self._interval = interval
+        self._deadband = deadband
+        self._last_azimuth = None
+        self._last_elevation = None
+
+    def is_playing(self) -> bool:
+        return self.running
+
+    def append(self, table: TrajectoryTable) -> bool:
+        """
+        Queue a table to play after the current one, from its own start time.
+        Return False if the player has already finished and won't play it.
+        """
+        with self._lock:
+            if self._finished:
+                return False
+            self._queued.append(table)
+            return True
+
+    def _next_table(self, now_us: int) -> bool:
+        """
+        Switch to the latest queued table that has started, return False when
+        there is nothing left to play.
+        """
+        with self._lock:
+            while self._queued and now_us >= self._queued[0].start_us:
+                self._table = self._queued.pop(0)
+            if now_us <= self._table.end_us() or len(self._queued) > 0:
+                return True
+            self._finished = True
+            return False
+
+    def run(self):
+        LOG.info("Playing a trajectory of {} points".format(self._table.count))
+        while self.running:
+            now_us = common_time_us()
+            if not self._next_table(now_us):
+                break
+            position = self._table.position_at(now_us)
+            if position is None:
+                # Not started yet, or waiting for the next table: wake up in time for it
+                start_us = self._table.start_us if now_us < self._table.start_us else self._queued[0].start_us
+                time.sleep(min(_MAX_IDLE_SLEEP, (start_us - now_us) / 1000000))
+                continue
+            self._move(*position)
+            time.sleep(self._interval)
+        with self._lock:
+            self._finished = True
+        LOG.info("Trajectory finished")
+        self.running = False
+
+    def _move(self, azimuth: float, elevation: float):
+        if self._last_azimuth is None or abs(azimuth - self._last_azimuth) >= self._deadband:
+            self._antenna.azimuth.set_motor_position(azimuth)
+            self._last_azimuth = azimuth
+        if self._last_elevation is None or abs(elevation - self._last_elevation) >= self._deadband:
+            self._antenna.elevation.set_motor_position(elevation)
+            self._last_elevation = elevation
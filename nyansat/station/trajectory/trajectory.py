@@ -0,0 +1,100 @@
+import struct
+
+
+class TrajectoryTable(object):
+    """
+    A time/azimuth/elevation table, kept in its packed wire format and decoded
+    one point at a time to avoid allocating the whole table on the board.
+
+    Layout (big endian):
+        header: start seconds (uint32), start microseconds (uint32), point count (uint16)
+        point:  offset from start in milliseconds (uint32),
+                azimuth in hundredths of a degree (uint16),
+                elevation in hundredths of a degree (int16)
+    """
+    HEADER_FORMAT = '!IIH'
+    HEADER_LENGTH = 10
+    POINT_FORMAT = '!IHh'
+    POINT_LENGTH = 8
+
+    def __init__(self, raw_table: bytes):
+        start_seconds, start_micros, count = struct.unpack_from(self.HEADER_FORMAT, raw_table, 0)
+        if len(raw_table) != self.HEADER_LENGTH + count * self.POINT_LENGTH:
+            raise ValueError("Trajectory table length does not match its point count")
+        if count < 1:
+            raise ValueError("Trajectory table has no points")
+        self._raw_table = raw_table
+        self.start_us = start_seconds * 1000000 + start_micros
+        self.count = count
+        self._cursor = 0
+
+    def point(self, index: int):
+        """Return the (offset_ms, azimuth, elevation) point at index, angles in degrees."""
+        offset_ms, azimuth, elevation = struct.unpack_from(
+                self.POINT_FORMAT,
+                self._raw_table,
+                self.HEADER_LENGTH + index * self.POINT_LENGTH,
+        )
+        return offset_ms, azimuth / 100, elevation / 100
+
+    def duration_ms(self) -> int:
+        return self.point(self.count - 1)[0]
+
+    def end_us(self) -> int:
+        return self.start_us + self.duration_ms() * 1000
+
+    def position_at(self, now_us: int):
+        """
+        Interpolate the (azimuth, elevation) at now_us, in microseconds since
+        the board epoch. Returns None before the first point or after the last
+        one. Lookups are expected to move forward in time, so a cursor is kept
+        between calls and each lookup is amortized O(1).
+        """
+        elapsed_ms = (now_us - self.start_us) // 1000
+        if elapsed_ms < 0:
+            return None
+        if self._cursor > 0 and self.point(self._cursor)[0] > elapsed_ms:
+            self._cursor = 0
+        while self._cursor + 1 < self.count and self.point(self._cursor + 1)[0] <= elapsed_ms:
+            self._cursor += 1
+        t0, az0, el0 = self.point(self._cursor)
+        if self._cursor + 1 >= self.count:
+            if elapsed_ms > t0:
+                return None
+            return az0, el0
+        t1, az1, el1 = self.point(self._cursor + 1)
+        if t1 == t0:
+            return az1, el1
+        fraction = (elapsed_ms - t0) / (t1 - t0)
+        # Take the short way around when the azimuth wraps through north
+        delta_az = az1 - az0
+        if delta_az > 180:
+            delta_az -= 360
+        elif delta_az < -180:
+            delta_az += 360
+        return (az0 + fraction * delta_az) % 360, el0 + fraction * (el1 - el0)
+
+
+def encode_trajectory_table(start_us: int, points) -> bytes:
+    """
+    Pack a TrajectoryTable
+    :param start_us: board time of the first point, in microseconds
+    :param points: (offset from start in milliseconds, azimuth, elevation) points, angles in degrees
+    """
+    count = len(points)
+    if count < 1:
+        raise ValueError("Trajectory table has no points")
+    raw_table = bytearray(TrajectoryTable.HEADER_LENGTH + count * TrajectoryTable.POINT_LENGTH)
+    struct.pack_into(TrajectoryTable.HEADER_FORMAT, raw_table, 0, start_us // 1000000, start_us % 1000000, count)
+    offset = TrajectoryTable.HEADER_LENGTH
+    for offset_ms, azimuth, elevation in points:
+        struct.pack_into(
+                TrajectoryTable.POINT_FORMAT,
+                raw_table,
+                offset,
+                offset_ms,
+                int(round(azimuth % 360 * 100)) % 36000,
+                int(round(max(-90, min(90, elevation)) * 100)),
+        )
+        offset += TrajectoryTable.POINT_LENGTH
+    return bytes(raw_table)
@@ -13,6 +13,7 @@ setup(
         "colorama",
         "fuzzywuzzy",
         "mpfshell==0.9.1",
+        "numpy",
         "pyserial",
         "rbs-tui-dom",
         "skyfield",